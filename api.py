@@ -0,0 +1,320 @@
+# api.py
+"""HTTP/JSON API реестра для других систем (мониторинг, заявки).
+
+    GET   /health
+    GET   /metrics                           замеры операций (текстовый формат Prometheus)
+    GET   /locations                         справочник локаций и адресов
+    GET   /incidents?from=&to=&status=&location=&address=&type=&duty=&text=&search=&limit=&offset=&archive=
+    GET   /incidents/<id>
+    POST  /incidents                         {"location", "address", "description", "date", "time",
+                                              "duty", "type", "comment", "notify"}; массив — пакетный импорт
+    PATCH /incidents/<id>                    {"status", "comment", "resolved_at", ...}
+    GET   /reports/daily?date=&template=
+    POST  /reports/daily/send                {"date"}
+    GET   /reports/period?from=&to=&template=
+    POST  /reports/period/send               {"from", "to"}
+
+Даты — "ДД.ММ.ГГГГ" или ISO, время — "ЧЧ:ММ". Список без from/to читает
+только рабочий реестр; archive=1 добавляет весь архив. Ошибки — {"error": "..."}
+с кодом 400/401/404/503. Сервер многопоточный, но работает с одним ядром
+(Core): чтения идут из общего кэша реестра и индексов, записи
+выстраиваются в очередь на блокировке хранилища. Запуск — вместе с демоном
+cli.py (api.enabled) или отдельно: python api.py.
+"""
+import json
+import re
+import signal
+import sys
+import threading
+from datetime import date, datetime, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+import pandas as pd
+from config import load_config
+from core import Core
+from exporter import incident_records
+from locking import StorageBusyError
+from metrics import METRICS
+from query import IncidentQuery
+from report_generator import TEMPLATES
+from storage import CLOSED_STATUS, INCIDENT_COLUMNS, ensure_incidents_schema
+
+MAX_BODY = 10 * 1024 * 1024   # ограничение тела запроса (пакетный импорт)
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+def _date(v: Any) -> Optional[date]:
+    if v in (None, ""):
+        return None
+    s = str(v).strip()
+    for parse in (lambda x: datetime.strptime(x, "%d.%m.%Y").date(), date.fromisoformat):
+        try:
+            return parse(s)
+        except ValueError:
+            pass
+    raise ApiError(400, f"Неверная дата «{s}»: нужно ДД.ММ.ГГГГ или ГГГГ-ММ-ДД.")
+
+def _time(v: Any) -> Optional[time]:
+    if v in (None, ""):
+        return None
+    s = str(v).strip()
+    for fmt in ("%H:%M", "%H:%M:%S"):
+        try:
+            return datetime.strptime(s, fmt).time()
+        except ValueError:
+            pass
+    raise ApiError(400, f"Неверное время «{s}»: нужно ЧЧ:ММ.")
+
+def _datetime(v: Any) -> Optional[datetime]:
+    if v in (None, ""):
+        return None
+    s = str(v).strip()
+    for parse in (lambda x: datetime.strptime(x, "%d.%m.%Y %H:%M"), datetime.fromisoformat):
+        try:
+            return parse(s)
+        except ValueError:
+            pass
+    raise ApiError(400, f"Неверное время закрытия «{s}»: нужно ДД.ММ.ГГГГ ЧЧ:ММ или ISO.")
+
+def _record(row: Dict[str, Any]) -> Dict[str, Any]:
+    return incident_records(ensure_incidents_schema(pd.DataFrame([row])))[0]
+
+def _query(params: Dict[str, str]) -> IncidentQuery:
+    return IncidentQuery(
+        date_from=_date(params.get("from")), date_to=_date(params.get("to")),
+        status=params.get("status"), location=params.get("location"), address=params.get("address"),
+        type=params.get("type"), duty=params.get("duty"), text=params.get("text"),
+        archive=params.get("archive", "") in ("1", "true", "yes"),
+    )
+
+def _int(params: Dict[str, str], key: str, default: int) -> int:
+    try:
+        return int(params.get(key, default))
+    except ValueError:
+        raise ApiError(400, f"Параметр {key} должен быть числом.")
+
+def _template(params: Dict[str, Any]):
+    name = params.get("template") or "plain"
+    if name not in TEMPLATES:
+        raise ApiError(400, f"Неизвестное оформление «{name}»: {', '.join(sorted(TEMPLATES))}.")
+    return TEMPLATES[name]
+
+# ---- Обработчики: (ядро, параметры URL, тело, id из пути) → JSON ----
+def health(core: Core, params, body, _id) -> Any:
+    return {"ok": True, "rows": core.storage.cache_stats()["rows"], "queue": core.outbox.depth()}
+
+def metrics(core: Core, params, body, _id) -> Any:
+    return METRICS.to_prometheus()
+
+def locations(core: Core, params, body, _id) -> Any:
+    return core.storage.directory()
+
+def list_incidents(core: Core, params, body, _id) -> Any:
+    q = _query(params)
+    limit = min(_int(params, "limit", 500), core.cfg["api"]["max_limit"])
+    offset = _int(params, "offset", 0)
+    if limit < 0 or offset < 0:
+        raise ApiError(400, "Параметры limit и offset не могут быть отрицательными.")
+    if params.get("search"):
+        df = core.storage.search(params["search"], q, limit=offset + limit).drop(columns="score")
+        total = len(df)
+    else:
+        df = core.storage.query(q)
+        total = len(df)
+        df = df.sort_values(by=["date", "time", "id"], ascending=False)
+    return {"total": total, "items": incident_records(df.iloc[offset:offset + limit])}
+
+def get_incident(core: Core, params, body, incident_id: int) -> Any:
+    row = core.storage.get_incident(incident_id)
+    if row is None:
+        raise ApiError(404, f"Инцидент id={incident_id} не найден.")
+    return _record(row)
+
+def create_incident(core: Core, params, body, _id) -> Any:
+    if isinstance(body, list):
+        # пакет — как импорт из файла: без справочника, одна проверка на всё
+        bad = [str(i + 1) for i, rec in enumerate(body) if not isinstance(rec, dict)]
+        if bad:
+            raise ApiError(400, f"Элементы массива должны быть объектами JSON: номера {', '.join(bad[:10])}.")
+        return {"ids": core.storage.append_incidents(body)}
+    if not isinstance(body, dict):
+        raise ApiError(400, "Ожидается объект JSON или массив объектов.")
+    rec = core.new_record(
+        str(body.get("location") or ""), str(body.get("address") or ""), str(body.get("description") or ""),
+        day=_date(body.get("date")), at=_time(body.get("time")),
+        duty=body.get("duty"), type=body.get("type"), comment=body.get("comment"),
+    )
+    incident_id = core.add_incident(rec, notify=bool(body.get("notify")))
+    return {"id": incident_id}
+
+def update_incident(core: Core, params, body, incident_id: int) -> Any:
+    if not isinstance(body, dict) or not body:
+        raise ApiError(400, "Ожидается объект JSON с изменяемыми полями.")
+    unknown = sorted(set(body) - set(INCIDENT_COLUMNS) | ({"id"} & set(body)))
+    if unknown:
+        raise ApiError(400, f"Эти поля менять нельзя: {', '.join(unknown)}.")
+    fields = dict(body)
+    for key, parse in (("date", _date), ("time", _time), ("resolved_at", _datetime)):
+        if key in fields:
+            fields[key] = parse(fields[key])
+    if "status" in fields and fields["status"] != CLOSED_STATUS:
+        # как в карточке инцидента: снова открытый инцидент без времени закрытия
+        fields["resolved_at"] = None
+    elif fields.get("status") == CLOSED_STATUS and fields.get("resolved_at") is None:
+        fields["resolved_at"] = datetime.now().replace(second=0, microsecond=0)
+    if core.storage.get_incident(incident_id) is None:
+        raise ApiError(404, f"Инцидент id={incident_id} не найден.")
+    core.storage.update_incident(incident_id, fields)
+    return get_incident(core, params, body, incident_id)
+
+def daily_report(core: Core, params, body, _id) -> Any:
+    day = _date(params.get("date")) or date.today()
+    text = core.reporter.build_daily_report(core.daily_frame(day), _template(params), day)
+    return {"date": day.isoformat(), "text": text}
+
+def send_daily_report(core: Core, params, body, _id) -> Any:
+    day = _date((body or {}).get("date")) or date.today()
+    core.send_daily_report(core.daily_frame(day), day)
+    return {"date": day.isoformat(), "queued": True}
+
+def _period(core: Core, src: Dict[str, Any]):
+    start, end = _date(src.get("from")), _date(src.get("to"))
+    if start is None or end is None:
+        raise ApiError(400, "Укажите from и to.")
+    return core.period_stats(start, end)
+
+def period_report(core: Core, params, body, _id) -> Any:
+    st = _period(core, params)
+    return {"text": "\n".join(core.reporter.render_period(st, _template(params)))}
+
+def send_period_report(core: Core, params, body, _id) -> Any:
+    core.send_period_report(_period(core, body or {}))
+    return {"queued": True}
+
+Handler = Callable[[Core, Dict[str, str], Any, Optional[int]], Any]
+ROUTES: List[Tuple[str, "re.Pattern[str]", Handler]] = [
+    ("GET", re.compile(r"/health"), health),
+    ("GET", re.compile(r"/metrics"), metrics),
+    ("GET", re.compile(r"/locations"), locations),
+    ("GET", re.compile(r"/incidents"), list_incidents),
+    ("POST", re.compile(r"/incidents"), create_incident),
+    ("GET", re.compile(r"/incidents/(\d+)"), get_incident),
+    ("PATCH", re.compile(r"/incidents/(\d+)"), update_incident),
+    ("GET", re.compile(r"/reports/daily"), daily_report),
+    ("POST", re.compile(r"/reports/daily/send"), send_daily_report),
+    ("GET", re.compile(r"/reports/period"), period_report),
+    ("POST", re.compile(r"/reports/period/send"), send_period_report),
+]
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive: клиент не открывает соединение на каждый запрос
+    server: "ApiServer"
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def log_message(self, format, *args):
+        # без строки в консоль на каждый запрос
+        pass
+
+    def _body(self) -> Any:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            raise ApiError(413, "Слишком большой запрос.")
+        if not length:
+            return None
+        try:
+            return json.loads(self.rfile.read(length).decode("utf-8"))
+        except ValueError:
+            raise ApiError(400, "Тело запроса — не JSON.")
+
+    def _dispatch(self, method: str):
+        url = urlsplit(self.path)
+        path = url.path.rstrip("/") or "/"
+        try:
+            body = self._body()
+            token = self.server.token
+            if token and self.headers.get("Authorization") != f"Bearer {token}":
+                raise ApiError(401, "Нужен заголовок Authorization: Bearer <token>.")
+            allowed = []
+            for m, pattern, handler in ROUTES:
+                match = pattern.fullmatch(path)
+                if match is None:
+                    continue
+                allowed.append(m)
+                if m == method:
+                    params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                    incident_id = int(match.group(1)) if match.groups() else None
+                    self._send(201 if method == "POST" and path == "/incidents" else 200,
+                               handler(self.server.core, params, body, incident_id))
+                    return
+            if allowed:
+                raise ApiError(405, f"Метод {method} не поддерживается: {', '.join(allowed)}.")
+            raise ApiError(404, f"Нет такого адреса: {path}")
+        except ApiError as e:
+            self._send(e.status, {"error": str(e)})
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+        except StorageBusyError as e:
+            self._send(503, {"error": str(e)})
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def _send(self, status: int, payload: Any):
+        # строка — готовый текст (/metrics), остальное — JSON
+        if isinstance(payload, str):
+            data, ctype = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            data, ctype = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, core: Core, host: str = "127.0.0.1", port: int = 8766, token: str = ""):
+        super().__init__((host, port), _ApiHandler)
+        self.core = core
+        self.token = token
+
+def start_api(core: Core) -> ApiServer:
+    """Запустить API в фоновом потоке на настройках api из конфигурации."""
+    a = core.cfg["api"]
+    server = ApiServer(core, a["host"], int(a["port"]), str(a.get("token") or ""))
+    threading.Thread(target=server.serve_forever, name="http-api", daemon=True).start()
+    return server
+
+def main() -> int:
+    core = Core(load_config("config.yaml"), start_scheduler=True, start_metrics_dump=True)
+    server = start_api(core)
+    host, port = server.server_address[:2]
+    print(f"API слушает http://{host}:{port}; остановка — Ctrl+C", flush=True)
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    try:
+        while not stopped.wait(0.5):
+            pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+        core.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,23 @@
 # app.py
 import tkinter as tk
+import numpy as np
 import pandas as pd
-from tkinter import ttk, messagebox, simpledialog
-from datetime import datetime, date
+from tkinter import ttk, messagebox, simpledialog, filedialog
+from datetime import datetime, date, timedelta
 from typing import Optional
 from config import load_config
-from storage import IncidentStorage, DEFAULT_STATUS, CLOSED_STATUS
-from report_generator import ReportGenerator
-from telegram_client import TelegramClient
+from storage import (
+    StorageEngine, IncidentEvent, DEFAULT_STATUS, CLOSED_STATUS,
+    concat_incidents, fmt_date, fmt_datetime, fmt_time, format_dates, format_times, format_datetimes,
+    read_incidents_file,
+)
+from report_generator import TEMPLATES, incident_message
+from telegram_outbox import TelegramOutbox
+from core import Core
+from tasks import TaskRunner
+from query import IncidentQuery
+from exporter import export_incidents
+from metrics import METRICS
 
 APP_TITLE = "Incident Reporter"
 
@@ -20,7 +30,7 @@ class HomeFrame(ttk.Frame):
         ttk.Button(self, text="Сформировать доклад за сегодня", command=on_make_report).pack(anchor="w")
 
 class CreateIncidentDialog(tk.Toplevel):
-    def __init__(self, master, cfg, storage: IncidentStorage, telegram: TelegramClient, on_saved=None):
+    def __init__(self, master, cfg, storage: StorageEngine, outbox: TelegramOutbox, tasks: TaskRunner, on_saved=None):
         super().__init__(master)
         self.title("Создать инцидент")
         self.resizable(False, False)
@@ -29,7 +39,8 @@ class CreateIncidentDialog(tk.Toplevel):
 
         self.cfg = cfg
         self.storage = storage
-        self.telegram = telegram
+        self.outbox = outbox
+        self.tasks = tasks
         self.on_saved = on_saved
 
         frm = ttk.Frame(self, padding=12)
@@ -87,7 +98,8 @@ class CreateIncidentDialog(tk.Toplevel):
         btns = ttk.Frame(frm)
         btns.grid(row=row, column=0, columnspan=3, sticky="e")
         ttk.Button(btns, text="Отмена", command=self.destroy).pack(side="right", padx=5)
-        ttk.Button(btns, text="Сохранить", command=self.on_save).pack(side="right", padx=5)
+        self.btn_save = ttk.Button(btns, text="Сохранить", command=self.on_save)
+        self.btn_save.pack(side="right", padx=5)
 
         # Предзаполнение адресов для первой локации (если есть)
         locs = self.storage.get_locations()
@@ -153,55 +165,113 @@ class CreateIncidentDialog(tk.Toplevel):
             messagebox.showerror("Ошибка", "Описание не может быть пустым.")
             return
 
-        try:
-            self.storage.append_incident(rec)
-        except Exception as e:
-            messagebox.showerror("Ошибка сохранения", f"Не удалось сохранить инцидент:\n{e}")
-            return
+        text = incident_message(rec) if self.var_send_tg.get() else None
+
+        # Запись и отправка — в фоне; окно остаётся отзывчивым
+        self.btn_save.configure(state="disabled")
+        self.tasks.submit(self._save_and_send, rec, text,
+                          on_done=self._on_saved, on_error=self._on_save_error,
+                          label="Сохранение инцидента")
 
-        if self.var_send_tg.get():
+    def _save_and_send(self, rec, text):
+        # Выполняется в рабочем потоке: без обращений к Tk
+        self.storage.append_incident(rec)
+        tg_error = None
+        if text is not None:
+            # отправку берёт на себя очередь: сообщение переживёт сбой сети и перезапуск
             try:
-                text = (
-                    "ИНЦИДЕНТ\n"
-                    f"Дата: {d.strftime('%d.%m.%Y')}\n"
-                    f"Время: {t.strftime('%H:%M')}\n"
-                    f"Локация: {rec['location']}\n"
-                    f"Адрес: {rec['address']}\n"
-                    f"Дежурный: {rec['duty']}\n"
-                    f"Тип: {rec['type']}\n"
-                    f"Описание: {rec['description']}"
-                )
-                self.telegram.send_message(text)
+                self.outbox.enqueue(text)
             except Exception as e:
-                messagebox.showwarning("Telegram", f"Инцидент сохранён, но не удалось отправить в Telegram:\n{e}")
+                tg_error = e
+        return tg_error
+
+    def _on_save_error(self, e):
+        if self.winfo_exists():
+            self.btn_save.configure(state="normal")
+        messagebox.showerror("Ошибка сохранения", f"Не удалось сохранить инцидент:\n{e}")
+
+    def _on_saved(self, tg_error):
+        if tg_error is not None:
+            messagebox.showwarning("Telegram", f"Инцидент сохранён, но не удалось поставить сообщение в очередь Telegram:\n{tg_error}")
 
         if self.on_saved:
             self.on_saved()
 
         messagebox.showinfo("Готово", "Инцидент сохранён.")
-        self.destroy()
+        if self.winfo_exists():
+            self.destroy()
 
 class RegistryWindow(tk.Toplevel):
-    def __init__(self, master, storage: IncidentStorage):
+    # Виртуальный список: в Treeview живут только видимые строки + небольшой запас,
+    # прокрутка и выделение ведутся по позиции в отсортированном DataFrame.
+    OVERSCAN = 5
+    WHEEL_ROWS = 3
+    COLUMNS = ("id","date","time","location","address","duty","type","description","status","resolved_at")
+    SEARCH_LIMIT = 500
+    FILTER_FIELDS = {"status": "Статус:", "location": "Локация:", "address": "Адрес:", "type": "Тип:", "duty": "Дежурный:"}
+
+    def __init__(self, master, storage: StorageEngine, tasks: TaskRunner):
         super().__init__(master)
         self.title("Реестр инцидентов")
         self.geometry("1100x500")
         self.storage = storage
+        self.tasks = tasks
 
         frm = ttk.Frame(self, padding=8)
         frm.pack(fill="both", expand=True)
 
+        # Фильтры: даты — диапазон, поля — точное значение; поиск — по словам описания
+        # и комментария, результаты по релевантности
         toolbar = ttk.Frame(frm)
         toolbar.pack(fill="x")
-        self.var_filter_date = tk.StringVar(value="")
-        ttk.Label(toolbar, text="Дата (ДД.ММ.ГГГГ):").pack(side="left", padx=(0,6))
-        ttk.Entry(toolbar, textvariable=self.var_filter_date, width=12).pack(side="left")
-        ttk.Button(toolbar, text="Применить", command=self.refresh).pack(side="left", padx=6)
-        ttk.Button(toolbar, text="Сброс", command=self.reset_filter).pack(side="left", padx=6)
-
-        columns = ("id","date","time","location","address","duty","type","description","status","resolved_at")
-        self.tree = ttk.Treeview(frm, columns=columns, show="headings", height=16)
-        self.tree.pack(fill="both", expand=True, pady=(6,0))
+        toolbar2 = ttk.Frame(frm)
+        toolbar2.pack(fill="x", pady=(4,0))
+        self.var_date_from = tk.StringVar(value="")
+        self.var_date_to = tk.StringVar(value="")
+        self.var_search = tk.StringVar(value="")
+        self.var_archive = tk.BooleanVar(value=False)   # без дат — и весь архив
+        self.filter_vars = {f: tk.StringVar(value="") for f in self.FILTER_FIELDS}
+        self.filter_boxes = {}
+
+        def entry(parent, label, var, width):
+            ttk.Label(parent, text=label).pack(side="left", padx=(0,4))
+            e = ttk.Entry(parent, textvariable=var, width=width)
+            e.pack(side="left", padx=(0,10))
+            e.bind("<Return>", lambda _: self.refresh())
+
+        def combo(parent, field, width):
+            ttk.Label(parent, text=self.FILTER_FIELDS[field]).pack(side="left", padx=(0,4))
+            cb = ttk.Combobox(parent, textvariable=self.filter_vars[field], width=width)
+            cb.pack(side="left", padx=(0,10))
+            cb.bind("<<ComboboxSelected>>", lambda _: self.refresh())
+            cb.bind("<Return>", lambda _: self.refresh())
+            self.filter_boxes[field] = cb
+
+        entry(toolbar, "С (ДД.ММ.ГГГГ):", self.var_date_from, 11)
+        entry(toolbar, "По:", self.var_date_to, 11)
+        combo(toolbar, "status", 10)
+        combo(toolbar, "location", 16)
+        combo(toolbar, "address", 22)
+        combo(toolbar2, "type", 16)
+        combo(toolbar2, "duty", 16)
+        entry(toolbar2, "Поиск:", self.var_search, 28)
+        ttk.Checkbutton(toolbar2, text="С архивом", variable=self.var_archive,
+                        command=self.refresh).pack(side="left", padx=(0,10))
+        ttk.Button(toolbar2, text="Применить", command=self.refresh).pack(side="left", padx=6)
+        ttk.Button(toolbar2, text="Сброс", command=self.reset_filter).pack(side="left", padx=6)
+        ttk.Button(toolbar2, text="Экспорт…", command=self.on_export).pack(side="left", padx=6)
+        self.lbl_count = ttk.Label(toolbar2, text="")
+        self.lbl_count.pack(side="right")
+        self.lbl_export = ttk.Label(toolbar2, text="")
+        self.lbl_export.pack(side="right", padx=(0,10))
+
+        body = ttk.Frame(frm)
+        body.pack(fill="both", expand=True, pady=(6,0))
+        columns = self.COLUMNS
+        self.tree = ttk.Treeview(body, columns=columns, show="headings", height=16, selectmode="browse")
+        self.vsb = ttk.Scrollbar(body, orient="vertical", command=self._on_scrollbar)
+        self.vsb.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
         headers = {
             "id":"ID","date":"Дата","time":"Время","location":"Локация","address":"Адрес",
             "duty":"Дежурный","type":"Тип","description":"Описание","status":"Статус","resolved_at":"Исправлено"
@@ -211,50 +281,300 @@ class RegistryWindow(tk.Toplevel):
             self.tree.heading(c, text=headers[c])
             self.tree.column(c, width=widths[c], anchor="w")
 
+        try:
+            self._row_height = int(ttk.Style(self).lookup("Treeview", "rowheight") or 20)
+        except (tk.TclError, ValueError):
+            self._row_height = 20
+
+        self._rows = pd.DataFrame(columns=columns)   # отсортированный (и отфильтрованный) реестр
+        self._ids = []                                # id по позициям _rows
+        self._top = 0                                 # позиция первой видимой строки
+        self._items = []                              # пул строк Treeview
+        self._selected_id: Optional[int] = None
+        self._applied_query = IncidentQuery()         # фильтр, с которым построен _rows
+        self._applied_search = ""                     # строка поиска (порядок — по релевантности)
+
         self.tree.bind("<Double-1>", self.on_double_click)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<Configure>", lambda e: self._render())
+        self.tree.bind("<MouseWheel>", self._on_wheel)
+        self.tree.bind("<Button-4>", self._on_wheel)
+        self.tree.bind("<Button-5>", self._on_wheel)
+        for key in ("<Up>", "<Down>", "<Prior>", "<Next>", "<Home>", "<End>"):
+            self.tree.bind(key, self._on_key)
+
+        # Сохранения обновляют только затронутую строку, без полной перезагрузки
+        # (события приходят из рабочего потока — переносим их в поток Tk)
+        self._unsubscribe = self.storage.subscribe(self.tasks.ui_callback(self._on_storage_event))
+        self.bind("<Destroy>", self._on_destroy)
 
         self.refresh()
 
+    def _on_destroy(self, event):
+        if event.widget is self and self._unsubscribe:
+            self._unsubscribe()
+            self._unsubscribe = None
+
     def reset_filter(self):
-        self.var_filter_date.set("")
+        self.var_date_from.set("")
+        self.var_date_to.set("")
+        self.var_search.set("")
+        self.var_archive.set(False)
+        for var in self.filter_vars.values():
+            var.set("")
         self.refresh()
 
-    def refresh(self):
+    def _parse_filter_date(self, var: tk.StringVar) -> Optional[pd.Timestamp]:
+        f = var.get().strip()
+        if not f:
+            return None
+        return pd.Timestamp(datetime.strptime(f, "%d.%m.%Y"))
+
+    def _build_query(self) -> Optional[IncidentQuery]:
         try:
-            for i in self.tree.get_children():
-                self.tree.delete(i)
-
-            df = self.storage.load_incidents()
-
-            f = self.var_filter_date.get().strip()
-            if f:
-                try:
-                    target = datetime.strptime(f, "%d.%m.%Y").date()
-                    df = df[df["date"] == target]
-                except ValueError:
-                    messagebox.showerror("Ошибка", "Неверный формат даты фильтра.")
-                    return
-
-            if df is not None and not df.empty:
-                df = df.sort_values(by=["date","time","id"], ascending=[False, False, False])
-                for _, r in df.iterrows():
-                    d = r.get("date")
-                    t = r.get("time")
-                    ra = r.get("resolved_at")
-                    self.tree.insert("", "end", values=(
-                        int(r.get("id")) if not pd.isna(r.get("id")) else "",
-                        d.strftime("%d.%m.%Y") if pd.notna(d) and d else "",
-                        t.strftime("%H:%M") if pd.notna(t) and t else "",
-                        r.get("location",""),
-                        r.get("address",""),
-                        r.get("duty",""),
-                        r.get("type",""),
-                        r.get("description",""),
-                        r.get("status",""),
-                        ra.strftime("%d.%m.%Y %H:%M") if pd.notna(ra) and ra else "",
-                    ))
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось обновить реестр:\n{e}")
+            date_from = self._parse_filter_date(self.var_date_from)
+            date_to = self._parse_filter_date(self.var_date_to)
+        except ValueError:
+            messagebox.showerror("Ошибка", "Неверный формат даты фильтра.")
+            return None
+        fields = {f: var.get().strip() or None for f, var in self.filter_vars.items()}
+        return IncidentQuery(date_from=date_from, date_to=date_to, archive=self.var_archive.get(), **fields)
+
+    def refresh(self):
+        q = self._build_query()
+        if q is None:
+            return
+        self._reload(q, self.var_search.get().strip())
+
+    def _reload(self, q: IncidentQuery, text: str):
+        # повторные запросы, пока идёт загрузка, схлопываются в один
+        self.tasks.submit(self._load_rows, q, text,
+                          on_done=lambda res: self._on_loaded(res, q, text),
+                          on_error=self._on_load_error,
+                          key=f"registry-refresh-{id(self)}", label="Загрузка реестра")
+
+    @METRICS.timed("ui.registry.load", rows=lambda res: len(res[0]))
+    def _load_rows(self, q: IncidentQuery, text: str):
+        # Рабочий поток: выборка по индексам, сортировка и значения для выпадающих списков
+        if text:
+            df = self.storage.search(text, q, limit=self.SEARCH_LIMIT)
+        else:
+            df = self.storage.query(q).sort_values(by=["date","time","id"], ascending=[False, False, False])
+        choices = {f: self.storage.distinct_values(f) for f in self.FILTER_FIELDS}
+        return df, choices
+
+    def _on_loaded(self, res, q: IncidentQuery, text: str):
+        if not self.winfo_exists():
+            return
+        df, choices = res
+        for f, values in choices.items():
+            self.filter_boxes[f]["values"] = [""] + values
+        self._applied_query = q
+        self._applied_search = text
+        self._set_rows(df)
+
+    def _on_load_error(self, e):
+        messagebox.showerror("Ошибка", f"Не удалось обновить реестр:\n{e}")
+
+    # ---- Экспорт ----
+    def on_export(self):
+        # Выгружаются записи под применёнными фильтрами (без полнотекстового поиска)
+        path = filedialog.asksaveasfilename(
+            parent=self, title="Экспорт реестра",
+            defaultextension=".csv", initialfile=f"incidents_{date.today():%Y%m%d}.csv",
+            filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl"), ("Excel", "*.xlsx")],
+        )
+        if not path:
+            return
+        progress = self.tasks.ui_callback(self._on_export_progress)
+        self.lbl_export.configure(text="Экспорт…")
+        self.tasks.submit(export_incidents, self.storage, path, self._applied_query, progress,
+                          on_done=self._on_exported, on_error=self._on_export_error,
+                          key=f"registry-export-{id(self)}", label="Экспорт реестра")
+
+    def _on_export_progress(self, done: int, total: int):
+        if self.winfo_exists():
+            self.lbl_export.configure(text=f"Экспорт: {done} из {total}")
+
+    def _on_exported(self, n: int):
+        if self.winfo_exists():
+            self.lbl_export.configure(text="")
+        messagebox.showinfo("Экспорт", f"Выгружено записей: {n}.")
+
+    def _on_export_error(self, e):
+        if self.winfo_exists():
+            self.lbl_export.configure(text="")
+        messagebox.showerror("Экспорт", f"Не удалось выгрузить реестр:\n{e}")
+
+    @METRICS.timed("ui.registry.set_rows")
+    def _set_rows(self, df: pd.DataFrame):
+        self._rows = df.reset_index(drop=True)
+        self._ids = self._rows["id"].tolist()
+        label = "Найдено" if self._applied_search else "Записей"
+        self.lbl_count.configure(text=f"{label}: {len(self._rows)}")
+        self._render()
+
+    # ---- Точечные обновления по событиям хранилища ----
+    def _matches_filter(self, row) -> bool:
+        return self._applied_query.matches(row)
+
+    def _insert_pos(self, rows: pd.DataFrame, row) -> int:
+        # Позиция в порядке (date, time, id) по убыванию; строки без даты — в конце
+        d, t, i = row.get("date"), row.get("time"), row.get("id")
+        if pd.isna(d):
+            return len(rows)
+        before = (rows["date"] > d) | ((rows["date"] == d) & (
+            (rows["time"] > t) | ((rows["time"] == t) & (rows["id"] > i))
+        ))
+        return int(before.to_numpy(dtype=bool, na_value=False).sum())
+
+    @METRICS.timed("ui.registry.event")
+    def _on_storage_event(self, event: IncidentEvent):
+        if not self.winfo_exists():
+            return
+        if self._applied_search or event.kind == "imported":
+            # порядок по релевантности зависит от всего корпуса, а импорт приносит
+            # сразу много строк — просто повторяем запрос
+            self._reload(self._applied_query, self._applied_search)
+            return
+        rows = self._rows
+        found = np.flatnonzero((rows["id"] == event.id).to_numpy(dtype=bool, na_value=False))
+        if len(found):
+            pos = int(found[0])
+            rows = rows.drop(index=pos).reset_index(drop=True)
+            del self._ids[pos]
+            if pos < self._top:
+                self._top -= 1
+        if self._matches_filter(event.row):
+            pos = self._insert_pos(rows, event.row)
+            rows = concat_incidents([rows.iloc[:pos], pd.DataFrame([event.row]), rows.iloc[pos:]])
+            self._ids.insert(pos, event.id)
+            # строка выше окна сдвигает окно, чтобы видимые записи остались на месте
+            if pos < self._top:
+                self._top += 1
+        self._rows = rows
+        self.lbl_count.configure(text=f"Записей: {len(self._rows)}")
+        self._render()
+
+    # ---- Виртуальная прокрутка ----
+    def _visible_count(self) -> int:
+        h = self.tree.winfo_height()
+        if h <= 1:
+            # окно ещё не отрисовано
+            return int(self.tree.cget("height"))
+        # минус строка заголовков
+        return max(1, h // self._row_height - 1)
+
+    def _format_rows(self, a: int, b: int):
+        # Форматируем только срез [a, b) целыми колонками
+        part = self._rows.iloc[a:b]
+        if part.empty:
+            return []
+        cols = [
+            ["" if pd.isna(v) else int(v) for v in part["id"]],
+            format_dates(part["date"]),
+            format_times(part["time"]),
+            part["location"], part["address"], part["duty"], part["type"],
+            part["description"], part["status"],
+            format_datetimes(part["resolved_at"]),
+        ]
+        return list(zip(*[list(c) for c in cols]))
+
+    @METRICS.timed("ui.registry.render")
+    def _render(self):
+        total = len(self._rows)
+        vis = self._visible_count()
+        self._top = max(0, min(self._top, total - vis))
+        n = max(0, min(total - self._top, vis + self.OVERSCAN))
+
+        while len(self._items) < n:
+            self._items.append(self.tree.insert("", "end"))
+        while len(self._items) > n:
+            self.tree.delete(self._items.pop())
+
+        selected = None
+        for iid, values in zip(self._items, self._format_rows(self._top, self._top + n)):
+            self.tree.item(iid, values=values)
+            if self._selected_id is not None and values[0] == self._selected_id:
+                selected = iid
+        if selected is not None:
+            if self.tree.selection() != (selected,):
+                self.tree.selection_set(selected)
+            self.tree.focus(selected)
+        elif self.tree.selection():
+            self.tree.selection_remove(*self.tree.selection())
+        self.tree.yview_moveto(0)
+
+        if total:
+            self.vsb.set(self._top / total, min(1.0, (self._top + vis) / total))
+        else:
+            self.vsb.set(0.0, 1.0)
+
+    def _scroll_to(self, top: int):
+        self._top = top
+        self._render()
+
+    def _ensure_visible(self, pos: int):
+        vis = self._visible_count()
+        if pos < self._top:
+            self._top = pos
+        elif pos >= self._top + vis:
+            self._top = pos - vis + 1
+
+    def _on_scrollbar(self, *args):
+        total = len(self._rows)
+        vis = self._visible_count()
+        if args[0] == "moveto":
+            self._scroll_to(int(float(args[1]) * total))
+        elif args[0] == "scroll":
+            step = vis if args[2] == "pages" else 1
+            self._scroll_to(self._top + int(args[1]) * step)
+
+    def _on_wheel(self, event):
+        if getattr(event, "num", None) == 4:
+            delta = -self.WHEEL_ROWS
+        elif getattr(event, "num", None) == 5:
+            delta = self.WHEEL_ROWS
+        else:
+            delta = -int(event.delta / 120) * self.WHEEL_ROWS if event.delta else 0
+        self._scroll_to(self._top + delta)
+        return "break"
+
+    def _selected_pos(self) -> Optional[int]:
+        sel = self.tree.selection()
+        if not sel or sel[0] not in self._items:
+            return None
+        return self._top + self._items.index(sel[0])
+
+    def _on_key(self, event):
+        total = len(self._rows)
+        if not total:
+            return "break"
+        vis = self._visible_count()
+        pos = self._selected_pos()
+        if pos is None:
+            pos = self._top
+        step = {"Up": -1, "Down": 1, "Prior": -vis, "Next": vis}.get(event.keysym)
+        if event.keysym == "Home":
+            pos = 0
+        elif event.keysym == "End":
+            pos = total - 1
+        elif step is not None:
+            pos = max(0, min(total - 1, pos + step))
+        self._selected_id = self._ids[pos]
+        self._ensure_visible(pos)
+        self._render()
+        return "break"
+
+    def _on_select(self, *_):
+        # Treeview мог сам прокрутиться к частично видимой строке — переносим сдвиг в _top
+        pos = self._selected_pos()
+        if pos is not None and pos < len(self._ids):
+            self._selected_id = self._ids[pos]
+        first = self.tree.yview()[0]
+        if first > 0 and self._items:
+            self._top += round(first * len(self._items))
+            self._render()
 
     def on_double_click(self, event):
         item = self.tree.focus()
@@ -267,26 +587,35 @@ class RegistryWindow(tk.Toplevel):
             incident_id = int(values[0])
         except Exception:
             return
-        IncidentDetailsDialog(self, self.storage, incident_id, on_saved=self.refresh)
+        def show(row):
+            if not self.winfo_exists():
+                return
+            if row is None:
+                messagebox.showerror("Ошибка", f"Инцидент id={incident_id} не найден.", parent=self)
+                return
+            # реестр обновится по событию хранилища
+            IncidentDetailsDialog(self, self.storage, self.tasks, row)
+
+        # запись ищется и в архиве (реестр показывает архивные месяцы при фильтре по датам)
+        self.tasks.submit(
+            self.storage.get_incident, incident_id, on_done=show,
+            on_error=lambda e: messagebox.showerror("Ошибка", f"Не удалось загрузить инцидент:\n{e}", parent=self),
+            key=f"incident-{incident_id}", label="Загрузка инцидента",
+        )
 
 class IncidentDetailsDialog(tk.Toplevel):
-    def __init__(self, master, storage: IncidentStorage, incident_id: int, on_saved=None):
+    # row — запись из storage.get_incident (ищется в фоне до открытия окна)
+    def __init__(self, master, storage: StorageEngine, tasks: TaskRunner, row: dict, on_saved=None):
         super().__init__(master)
+        incident_id = int(row["id"])
         self.title(f"Инцидент #{incident_id}")
         self.resizable(False, False)
         self.grab_set()
         self.storage = storage
+        self.tasks = tasks
         self.incident_id = incident_id
         self.on_saved = on_saved
-
-        # Загружаем запись
-        df = self.storage.load_incidents()
-        row = df[df["id"] == incident_id]
-        if row.empty:
-            messagebox.showerror("Ошибка", f"Инцидент id={incident_id} не найден.")
-            self.destroy()
-            return
-        self.row = row.iloc[0]
+        self.row = row
 
         frm = ttk.Frame(self, padding=12)
         frm.pack(fill="both", expand=True)
@@ -341,26 +670,17 @@ class IncidentDetailsDialog(tk.Toplevel):
         btns = ttk.Frame(frm)
         btns.grid(row=rowi, column=0, columnspan=2, sticky="e")
         ttk.Button(btns, text="Отмена", command=self.destroy).pack(side="right", padx=5)
-        ttk.Button(btns, text="Сохранить", command=self._save).pack(side="right", padx=5)
+        self.btn_save = ttk.Button(btns, text="Сохранить", command=self._save)
+        self.btn_save.pack(side="right", padx=5)
 
         # Применить состояние контролов по статусу
         self._apply_status_controls()
 
     def _fmt_date(self, d) -> str:
-        try:
-            if d and hasattr(d, "strftime"):
-                return d.strftime("%d.%m.%Y")
-        except Exception:
-            pass
-        return ""
+        return fmt_date(d)
 
     def _fmt_time(self, t) -> str:
-        try:
-            if t and hasattr(t, "strftime"):
-                return t.strftime("%H:%M")
-        except Exception:
-            pass
-        return ""
+        return fmt_time(t)
 
     def _on_status_change(self, *_):
         self._apply_status_controls()
@@ -396,19 +716,26 @@ class IncidentDetailsDialog(tk.Toplevel):
                 return
 
         fields = {"status": status, "comment": comment, "resolved_at": resolved_at}
-        try:
-            self.storage.update_incident(self.incident_id, fields)
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось сохранить изменения:\n{e}")
-            return
+        self.btn_save.configure(state="disabled")
+        self.tasks.submit(self.storage.update_incident, self.incident_id, fields,
+                          on_done=self._on_saved, on_error=self._on_save_error,
+                          label="Сохранение инцидента")
+
+    def _on_save_error(self, e):
+        if self.winfo_exists():
+            self.btn_save.configure(state="normal")
+        messagebox.showerror("Ошибка", f"Не удалось сохранить изменения:\n{e}")
+
+    def _on_saved(self, _):
         if self.on_saved:
             self.on_saved()
-        self.destroy()
+        if self.winfo_exists():
+            self.destroy()
 
 class ReportDialog(tk.Toplevel):
-    def __init__(self, master, report_text: str, on_send_telegram):
+    def __init__(self, master, report_text: str, on_send_telegram, title: str = "Суточный доклад"):
         super().__init__(master)
-        self.title("Суточный доклад")
+        self.title(title)
         self.geometry("700x500")
         self.grab_set()
 
@@ -425,7 +752,7 @@ class ReportDialog(tk.Toplevel):
         ttk.Button(btns, text="Отправить в Telegram", command=lambda: (on_send_telegram(), self.destroy())).pack(side="right", padx=6)
 
 class LocationsManager(tk.Toplevel):
-    def __init__(self, master, storage: IncidentStorage, on_close=None):
+    def __init__(self, master, storage: StorageEngine, on_close=None):
         super().__init__(master)
         self.title("Справочник: Локации и адреса")
         self.geometry("700x400")
@@ -605,9 +932,9 @@ class LocationsManager(tk.Toplevel):
 
 class ReportDialog(tk.Toplevel):
     # (без изменений от предыдущей версии)
-    def __init__(self, master, report_text: str, on_send_telegram):
+    def __init__(self, master, report_text: str, on_send_telegram, title: str = "Суточный доклад"):
         super().__init__(master)
-        self.title("Суточный доклад")
+        self.title(title)
         self.geometry("700x500")
         self.grab_set()
 
@@ -623,6 +950,139 @@ class ReportDialog(tk.Toplevel):
         ttk.Button(btns, text="Отмена", command=self.destroy).pack(side="right", padx=6)
         ttk.Button(btns, text="Отправить в Telegram", command=lambda: (on_send_telegram(), self.destroy())).pack(side="right", padx=6)
 
+class PeriodReportDialog(tk.Toplevel):
+    """Выбор периода для сводного доклада; on_ok(start, end) получает даты."""
+
+    def __init__(self, master, on_ok):
+        super().__init__(master)
+        self.title("Доклад за период")
+        self.resizable(False, False)
+        self.grab_set()
+        self.on_ok = on_ok
+
+        frm = ttk.Frame(self, padding=10)
+        frm.pack(fill="both", expand=True)
+        today = date.today()
+        self.var_from = tk.StringVar(value=(today - timedelta(days=6)).strftime("%d.%m.%Y"))
+        self.var_to = tk.StringVar(value=today.strftime("%d.%m.%Y"))
+        ttk.Label(frm, text="С (ДД.ММ.ГГГГ)").grid(row=0, column=0, sticky="w", padx=5, pady=3)
+        ttk.Entry(frm, textvariable=self.var_from, width=14).grid(row=0, column=1, sticky="w", padx=5, pady=3)
+        ttk.Label(frm, text="По (ДД.ММ.ГГГГ)").grid(row=1, column=0, sticky="w", padx=5, pady=3)
+        ttk.Entry(frm, textvariable=self.var_to, width=14).grid(row=1, column=1, sticky="w", padx=5, pady=3)
+
+        presets = ttk.Frame(frm)
+        presets.grid(row=2, column=0, columnspan=2, sticky="w", pady=(6, 0))
+        ttk.Button(presets, text="Неделя", command=lambda: self._preset(7)).pack(side="left", padx=5)
+        ttk.Button(presets, text="Месяц", command=self._this_month).pack(side="left", padx=5)
+        ttk.Button(presets, text="Год", command=lambda: self._preset(365)).pack(side="left", padx=5)
+
+        btns = ttk.Frame(frm)
+        btns.grid(row=3, column=0, columnspan=2, sticky="e", pady=(10, 0))
+        ttk.Button(btns, text="Отмена", command=self.destroy).pack(side="right", padx=6)
+        ttk.Button(btns, text="Сформировать", command=self._ok).pack(side="right", padx=6)
+
+    def _preset(self, days: int):
+        today = date.today()
+        self.var_from.set((today - timedelta(days=days - 1)).strftime("%d.%m.%Y"))
+        self.var_to.set(today.strftime("%d.%m.%Y"))
+
+    def _this_month(self):
+        today = date.today()
+        self.var_from.set(today.replace(day=1).strftime("%d.%m.%Y"))
+        self.var_to.set(today.strftime("%d.%m.%Y"))
+
+    def _ok(self):
+        try:
+            start = datetime.strptime(self.var_from.get().strip(), "%d.%m.%Y").date()
+            end = datetime.strptime(self.var_to.get().strip(), "%d.%m.%Y").date()
+        except ValueError:
+            messagebox.showerror("Ошибка", "Неверный формат даты. Используйте ДД.ММ.ГГГГ.", parent=self)
+            return
+        if start > end:
+            messagebox.showerror("Ошибка", "Начало периода позже конца.", parent=self)
+            return
+        self.destroy()
+        self.on_ok(start, end)
+
+class DiagnosticsWindow(tk.Toplevel):
+    """Замеры операций (metrics.METRICS) с обновлением раз в REFRESH_MS."""
+    REFRESH_MS = 2000
+    COLUMNS = ("op", "count", "avg_ms", "p50_ms", "p95_ms", "max_ms", "last_ms", "rows", "bytes", "errors")
+
+    def __init__(self, master, core: Core):
+        super().__init__(master)
+        self.title("Диагностика")
+        self.geometry("980x460")
+        self.core = core
+
+        frm = ttk.Frame(self, padding=8)
+        frm.pack(fill="both", expand=True)
+        self.lbl_summary = ttk.Label(frm, text="")
+        self.lbl_summary.pack(fill="x", pady=(0, 6))
+
+        self.tree = ttk.Treeview(frm, columns=self.COLUMNS, show="headings")
+        headers = {"op": "Операция", "count": "Вызовов", "avg_ms": "Среднее, мс", "p50_ms": "Медиана, мс",
+                   "p95_ms": "95%, мс", "max_ms": "Макс., мс", "last_ms": "Последний, мс",
+                   "rows": "Строк", "bytes": "Записано", "errors": "Ошибок"}
+        for c in self.COLUMNS:
+            self.tree.heading(c, text=headers[c])
+            self.tree.column(c, width=220 if c == "op" else 85, anchor="w" if c == "op" else "e")
+        vsb = ttk.Scrollbar(frm, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=vsb.set)
+        self.tree.pack(side="left", fill="both", expand=True)
+        vsb.pack(side="left", fill="y")
+
+        btns = ttk.Frame(self, padding=(8, 0, 8, 8))
+        btns.pack(fill="x")
+        ttk.Button(btns, text="Закрыть", command=self.destroy).pack(side="right", padx=6)
+        ttk.Button(btns, text="Сохранить…", command=self.on_save).pack(side="right", padx=6)
+        ttk.Button(btns, text="Сбросить", command=self.on_reset).pack(side="right", padx=6)
+        self.refresh()
+
+    @staticmethod
+    def _size(n: int) -> str:
+        for unit in ("Б", "КиБ", "МиБ"):
+            if n < 1024:
+                return f"{n:.0f} {unit}"
+            n /= 1024
+        return f"{n:.1f} ГиБ"
+
+    def refresh(self):
+        if not self.winfo_exists():
+            return
+        cache = self.core.storage.cache_stats()
+        tg = self.core.outbox.stats()
+        self.lbl_summary.configure(text=(
+            f"Записей в памяти: {cache['rows']}; кэш реестра: попаданий {cache['hits']}, чтений {cache['misses']}; "
+            f"Telegram: в очереди {tg['depth']}, отправлено {tg['sent']}, не отправлено {tg['failed']}"
+        ))
+        snap = METRICS.snapshot()
+        self.tree.delete(*self.tree.get_children())
+        for name, m in snap.items():
+            self.tree.insert("", "end", values=(
+                name, m["count"], f"{m['avg_ms']:.1f}", f"{m['p50_ms']:.1f}", f"{m['p95_ms']:.1f}",
+                f"{m['max_ms']:.1f}", f"{m['last_ms']:.1f}", m["rows"] or "",
+                self._size(m["bytes"]) if m["bytes"] else "", m["errors"] or "",
+            ))
+        self.after(self.REFRESH_MS, self.refresh)
+
+    def on_reset(self):
+        METRICS.reset()
+        self.tree.delete(*self.tree.get_children())
+
+    def on_save(self):
+        path = filedialog.asksaveasfilename(
+            parent=self, title="Сохранить замеры", defaultextension=".json",
+            initialfile=f"metrics_{datetime.now():%Y%m%d_%H%M}.json",
+            filetypes=[("JSON", "*.json"), ("Prometheus", "*.prom")],
+        )
+        if not path:
+            return
+        try:
+            METRICS.dump(path)
+        except OSError as e:
+            messagebox.showerror("Ошибка", f"Не удалось сохранить файл:\n{e}", parent=self)
+
 class App(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -630,16 +1090,71 @@ class App(tk.Tk):
         self.geometry("1060x640")
 
         self.cfg = load_config("config.yaml")
-        self.storage = IncidentStorage(self.cfg["storage"]["excel_path"])
-        self.reporter = ReportGenerator(self.cfg)
-        self.telegram = TelegramClient(self.cfg["telegram"]["token"], self.cfg["telegram"]["chat_id"])
+        # хранилище, доклады и очередь Telegram — общие с командной строкой (cli.py)
+        self.core = Core(self.cfg, start_scheduler=True, start_metrics_dump=True)
+        self.storage = self.core.storage
+        self.reporter = self.core.reporter
+        self.telegram = self.core.telegram
+        self.outbox = self.core.outbox
+
+        self.tasks = TaskRunner(self)
 
         self.registry = None
 
+        # Строка состояния: индикатор фоновых операций
+        self.status_bar = ttk.Frame(self, padding=(8, 2))
+        self.status_bar.pack(side="bottom", fill="x")
+        self.lbl_status = ttk.Label(self.status_bar, text="")
+        self.lbl_status.pack(side="left")
+        self.progress = ttk.Progressbar(self.status_bar, mode="indeterminate", length=120)
+        self.lbl_outbox = ttk.Label(self.status_bar, text="")
+        self.lbl_outbox.pack(side="right", padx=(0, 8))
+        self.tasks.add_busy_listener(self._on_busy_change)
+        self._update_outbox_status()
+
         self.home = HomeFrame(self, self.on_make_report)
         self.home.pack(fill="both", expand=True)
 
         self.create_menu()
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+
+    def _on_busy_change(self, labels):
+        if labels:
+            self.lbl_status.configure(text=f"{labels[-1] or 'Выполняется'}…")
+            if not self.progress.winfo_ismapped():
+                self.progress.pack(side="right")
+                self.progress.start(12)
+        else:
+            self.lbl_status.configure(text="")
+            self.progress.stop()
+            self.progress.pack_forget()
+
+    def _update_outbox_status(self):
+        st = self.outbox.stats()
+        parts = []
+        if st["depth"]:
+            parts.append(f"Telegram: в очереди {st['depth']}")
+            if st["oldest_age"] is not None and st["oldest_age"] >= 10:
+                parts.append(f"ждёт {st['oldest_age']:.0f} с")
+        if st["failed"]:
+            parts.append(f"не отправлено {st['failed']}")
+        nxt = self.core.scheduler.next_run()
+        if nxt is not None:
+            parts.append(f"доклад по расписанию: {fmt_datetime(nxt)}")
+        if self.core.scheduler.last_error:
+            parts.append(f"ошибка доклада по расписанию: {self.core.scheduler.last_error}")
+        self.lbl_outbox.configure(text=", ".join(parts))
+        self.after(1000, self._update_outbox_status)
+
+    def _on_close(self):
+        # Дожидаемся фоновых записей, затем переносим журнал в книгу и закрываем соединения;
+        # неотправленные сообщения остаются в очереди до следующего запуска
+        self.tasks.shutdown(wait=True)
+        try:
+            self.core.close()
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Не удалось сохранить журнал в книгу:\n{e}")
+        self.destroy()
 
     def create_menu(self):
         m = tk.Menu(self)
@@ -648,6 +1163,7 @@ class App(tk.Tk):
         menu_home.add_command(label="Панель", command=self.show_home)
         menu_home.add_separator()
         menu_home.add_command(label="Проверить Telegram", command=self.check_telegram)
+        menu_home.add_command(label="Диагностика", command=self.open_diagnostics)
         menu_home.add_command(label="О программе", command=lambda: messagebox.showinfo("О программе", APP_TITLE))
         m.add_cascade(label="Главная", menu=menu_home)
 
@@ -655,11 +1171,14 @@ class App(tk.Tk):
         menu_inc = tk.Menu(m, tearoff=0)
         menu_inc.add_command(label="Создать инцидент", command=self.open_create_incident)
         menu_inc.add_command(label="Реестр инцидентов", command=self.open_registry)
+        menu_inc.add_separator()
+        menu_inc.add_command(label="Импорт из файла…", command=self.on_import_incidents)
         m.add_cascade(label="Инциденты", menu=menu_inc)
 
         # Доклад
         menu_rep = tk.Menu(m, tearoff=0)
         menu_rep.add_command(label="Сформировать доклад", command=self.on_make_report)
+        menu_rep.add_command(label="Доклад за период…", command=self.on_period_report)
         m.add_cascade(label="Доклад", menu=menu_rep)
 
         # Справочники
@@ -676,19 +1195,40 @@ class App(tk.Tk):
         self.home.pack(fill="both", expand=True)
 
     def check_telegram(self):
-        try:
-            self.telegram.send_message("Проверка соединения: приложение активно.")
-            messagebox.showinfo("Telegram", "Сообщение отправлено.")
-        except Exception as e:
-            messagebox.showerror("Telegram", f"Не удалось отправить сообщение:\n{e}")
+        self.tasks.submit(
+            self.telegram.send_message, "Проверка соединения: приложение активно.",
+            on_done=lambda _: messagebox.showinfo("Telegram", "Сообщение отправлено."),
+            on_error=lambda e: messagebox.showerror("Telegram", f"Не удалось отправить сообщение:\n{e}"),
+            key="telegram-check", label="Проверка Telegram",
+        )
 
     def open_create_incident(self):
-        # передаём колбэк, чтобы реестр обновился после сохранения
-        CreateIncidentDialog(self, self.cfg, self.storage, self.telegram, on_saved=self.refresh_registry)
+        # открытый реестр подхватит новую запись по событию хранилища
+        CreateIncidentDialog(self, self.cfg, self.storage, self.outbox, self.tasks)
+
+    def on_import_incidents(self):
+        path = filedialog.askopenfilename(
+            parent=self, title="Импорт инцидентов",
+            filetypes=[("Реестр (CSV, Excel)", "*.csv *.xlsx"), ("Все файлы", "*.*")],
+        )
+        if not path:
+            return
+
+        def run():
+            return self.storage.append_incidents(read_incidents_file(path))
+
+        # открытый реестр перечитается по событию хранилища
+        self.tasks.submit(
+            run,
+            on_done=lambda ids: messagebox.showinfo(
+                "Импорт", f"Импортировано записей: {len(ids)}." if ids else "В файле нет записей."),
+            on_error=lambda e: messagebox.showerror("Импорт", f"Не удалось импортировать файл:\n{e}"),
+            key="import", label="Импорт инцидентов",
+        )
 
     def open_registry(self):
         if self.registry is None or not self.registry.winfo_exists():
-            self.registry = RegistryWindow(self, self.storage)
+            self.registry = RegistryWindow(self, self.storage, self.tasks)
             self.registry.protocol("WM_DELETE_WINDOW", self._on_registry_close)
         else:
             self.registry.lift()
@@ -701,27 +1241,55 @@ class App(tk.Tk):
         finally:
             self.registry = None
 
-    def refresh_registry(self):
-        if self.registry and self.registry.winfo_exists():
-            self.registry.refresh()
-            
     def open_locations_manager(self):
         LocationsManager(self, self.storage)
 
+    def open_diagnostics(self):
+        DiagnosticsWindow(self, self.core)
+
     def on_make_report(self):
-        try:
-            df = self.storage.load_incidents()
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось загрузить данные для доклада:\n{e}")
-            return
-        text = self.reporter.build_daily_report(df)
-        def send():
-            try:
-                self.telegram.send_message(text)
-                messagebox.showinfo("Готово", "Доклад отправлен в Telegram.")
-            except Exception as e:
-                messagebox.showerror("Telegram", f"Не удалось отправить доклад:\n{e}")
-        ReportDialog(self, text, send)
+        def build():
+            df = self.core.daily_frame()
+            # в окне — простой текст; в Telegram уходит шаблон из настроек
+            return df, self.reporter.build_daily_report(df, TEMPLATES["plain"])
+
+        def send(df):
+            self.tasks.submit(
+                self.core.send_daily_report, df,
+                on_done=lambda _: messagebox.showinfo("Готово", "Доклад поставлен в очередь отправки в Telegram."),
+                on_error=lambda e: messagebox.showerror("Telegram", f"Не удалось поставить доклад в очередь:\n{e}"),
+                label="Отправка доклада",
+            )
+
+        self.tasks.submit(
+            build,
+            on_done=lambda res: ReportDialog(self, res[1], lambda: send(res[0])),
+            on_error=lambda e: messagebox.showerror("Ошибка", f"Не удалось загрузить данные для доклада:\n{e}"),
+            key="make-report", label="Формирование доклада",
+        )
+
+    def on_period_report(self):
+        PeriodReportDialog(self, self._make_period_report)
+
+    def _make_period_report(self, start, end):
+        def build():
+            st = self.core.period_stats(start, end)
+            return st, "\n".join(self.reporter.render_period(st, TEMPLATES["plain"]))
+
+        def send(st):
+            self.tasks.submit(
+                self.core.send_period_report, st,
+                on_done=lambda _: messagebox.showinfo("Готово", "Доклад поставлен в очередь отправки в Telegram."),
+                on_error=lambda e: messagebox.showerror("Telegram", f"Не удалось поставить доклад в очередь:\n{e}"),
+                label="Отправка доклада",
+            )
+
+        self.tasks.submit(
+            build,
+            on_done=lambda res: ReportDialog(self, res[1], lambda: send(res[0]), title="Доклад за период"),
+            on_error=lambda e: messagebox.showerror("Ошибка", f"Не удалось сформировать доклад:\n{e}"),
+            key="make-period-report", label="Формирование доклада",
+        )
 
 if __name__ == "__main__":
     App().mainloop()
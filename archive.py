@@ -0,0 +1,231 @@
+# archive.py
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import pandas as pd
+from locking import retry_io
+from rollup import DailyRollup
+from search import SearchIndex
+from storage import (
+    INCIDENT_SHEET, CLOSED_STATUS, concat_incidents, ensure_incidents_schema, to_excel_frame,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # без pyarrow архив читается только из книг
+    pa = None
+    feather = None
+
+ARCHIVE_SUFFIX = ".archive"
+MANIFEST_NAME = "index.json"
+CACHED_MONTHS = 24   # сколько прочитанных месяцев держать в памяти
+
+def month_of(v: Any) -> str:
+    return pd.Timestamp(v).strftime("%Y-%m")
+
+def archivable(df: pd.DataFrame, cutoff: pd.Timestamp) -> pd.Series:
+    """Закрытые инциденты с датой раньше cutoff — кандидаты в архив."""
+    return (df["status"] == CLOSED_STATUS).fillna(False) & (df["date"] < cutoff).fillna(False)
+
+class _Month:
+    __slots__ = ("key", "df", "rollup", "search")
+
+    def __init__(self, key: Tuple, df: pd.DataFrame):
+        self.key = key
+        self.df = df
+        self.rollup: Optional[DailyRollup] = None
+        self.search: Optional[SearchIndex] = None
+
+class ArchivePartitions:
+    """Помесячный архив закрытых инцидентов рядом с книгой: <книга>.archive/ГГГГ-ММ.xlsx.
+
+    Месяц — отдельная книга того же формата (её можно открыть в Excel),
+    рядом колоночный снимок .arrow, как у основной книги. index.json хранит
+    по месяцу границы id и число записей: по нему выдаются новые id и
+    ищется месяц записи без чтения архива. Прочитанные месяцы кэшируются
+    (ключ — mtime/размер книги). Запись — только под блокировкой реестра.
+    """
+
+    def __init__(self, workbook: Path, snapshot: bool = True):
+        self.root = workbook.with_name(workbook.name + ARCHIVE_SUFFIX)
+        self.snapshot = snapshot and pa is not None
+        self._lock = threading.RLock()
+        self._months: "OrderedDict[str, _Month]" = OrderedDict()
+
+    # ---- Файлы ----
+    def _book(self, month: str) -> Path:
+        return self.root / f"{month}.xlsx"
+
+    def _sidecar(self, month: str) -> Path:
+        return self.root / f"{month}.arrow"
+
+    def months(self) -> List[str]:
+        if not self.root.exists():
+            return []
+        return sorted(p.stem for p in self.root.glob("????-??.xlsx"))
+
+    def months_between(self, start: Any = None, end: Any = None) -> List[str]:
+        """Месяцы архива, пересекающие [start, end]; None — без ограничения с этой стороны."""
+        lo = month_of(start) if start is not None else ""
+        hi = month_of(end) if end is not None else "9999-99"
+        return [m for m in self.months() if lo <= m <= hi]
+
+    def _manifest_path(self) -> Path:
+        return self.root / MANIFEST_NAME
+
+    def manifest(self) -> Dict[str, Dict[str, int]]:
+        """месяц → {"min_id", "max_id", "rows"}; при потере файла собирается по архиву."""
+        try:
+            with open(self._manifest_path(), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if set(data) == set(self.months()):
+                return data
+        except (OSError, ValueError):
+            pass
+        data = {m: self._month_stats(self.load(m)) for m in self.months()}
+        if data:
+            self._write_manifest(data)
+        return data
+
+    def _month_stats(self, df: pd.DataFrame) -> Dict[str, int]:
+        ids = df["id"].dropna()
+        return {
+            "min_id": int(ids.min()) if len(ids) else 0,
+            "max_id": int(ids.max()) if len(ids) else 0,
+            "rows": len(df),
+        }
+
+    def _write_manifest(self, data: Dict[str, Dict[str, int]]):
+        tmp = self._manifest_path().with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1, sort_keys=True)
+        retry_io(lambda: os.replace(tmp, self._manifest_path()))
+
+    def max_id(self) -> int:
+        return max((s["max_id"] for s in self.manifest().values()), default=0)
+
+    # ---- Чтение ----
+    def _key(self, month: str) -> Tuple:
+        st = self._book(month).stat()
+        return (st.st_mtime_ns, st.st_size)
+
+    def _entry(self, month: str, keep: bool = True) -> _Month:
+        # keep=False: непрочитанный месяц не кладётся в кэш и не вытесняет из него
+        # другие — так сплошной проход по архиву не прокручивает весь LRU
+        with self._lock:
+            key = self._key(month)
+            e = self._months.get(month)
+            if e is None or e.key != key:
+                e = _Month(key, self._read(month, key))
+                if not keep:
+                    return e
+                self._months[month] = e
+            self._months.move_to_end(month)
+            while len(self._months) > CACHED_MONTHS:
+                self._months.popitem(last=False)
+            return e
+
+    def _read(self, month: str, key: Tuple) -> pd.DataFrame:
+        stamp = f"{key[0]}:{key[1]}".encode()
+        if self.snapshot and self._sidecar(month).exists():
+            try:
+                table = feather.read_table(self._sidecar(month), memory_map=True)
+                if (table.schema.metadata or {}).get(b"workbook_key") == stamp:
+                    return ensure_incidents_schema(table.to_pandas())
+            except Exception:
+                pass
+        df = retry_io(lambda: pd.read_excel(self._book(month), sheet_name=INCIDENT_SHEET, engine="openpyxl"))
+        df = ensure_incidents_schema(df)
+        self._write_sidecar(month, df, stamp)
+        return df
+
+    def _write_sidecar(self, month: str, df: pd.DataFrame, stamp: bytes):
+        if not self.snapshot:
+            return
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"workbook_key": stamp})
+            tmp = self._sidecar(month).with_suffix(".tmp")
+            feather.write_feather(table, tmp, compression="uncompressed")
+            os.replace(tmp, self._sidecar(month))
+        except Exception:
+            try:
+                self._sidecar(month).unlink()
+            except OSError:
+                pass
+
+    def load(self, month: str) -> pd.DataFrame:
+        """Записи месяца (без копии — не менять)."""
+        return self._entry(month).df
+
+    def rollup(self, month: str) -> DailyRollup:
+        e = self._entry(month)
+        if e.rollup is None:
+            e.rollup = DailyRollup.from_frame(e.df)
+        return e.rollup
+
+    def search_index(self, month: str) -> SearchIndex:
+        e = self._entry(month)
+        if e.search is None:
+            e.search = SearchIndex.from_frame(e.df)
+        return e.search
+
+    def scan(self, months: List[str], search: bool = False) -> Iterator[Tuple[pd.DataFrame, Optional[SearchIndex]]]:
+        """Записи месяцев по порядку (с поисковым индексом, если search).
+
+        Проход длиннее кэша читает непрочитанные месяцы мимо него: иначе каждый
+        запрос по всему архиву вытеснял бы и перечитывал все месяцы заново.
+        """
+        keep = len(months) <= CACHED_MONTHS
+        for month in months:
+            e = self._entry(month, keep)
+            if search and e.search is None:
+                e.search = SearchIndex.from_frame(e.df)
+            yield e.df, e.search
+
+    def find(self, incident_id: int) -> Optional[str]:
+        """Месяц архива с записью incident_id (читаются только месяцы с подходящими границами id)."""
+        for month, st in self.manifest().items():
+            if st["min_id"] <= incident_id <= st["max_id"]:
+                if (self.load(month)["id"] == incident_id).any():
+                    return month
+        return None
+
+    # ---- Запись (под блокировкой реестра) ----
+    def write(self, month: str, df: pd.DataFrame):
+        """Заменить месяц целиком (пустой df удаляет месяц)."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        book = self._book(month)
+        data = self.manifest()
+        if df.empty:
+            for p in (book, self._sidecar(month)):
+                if p.exists():
+                    p.unlink()
+            data.pop(month, None)
+        else:
+            tmp = book.with_suffix(".tmp")
+            with pd.ExcelWriter(tmp, engine="openpyxl") as w:
+                to_excel_frame(df).to_excel(w, sheet_name=INCIDENT_SHEET, index=False)
+            with open(tmp, "rb") as f:
+                os.fsync(f.fileno())
+            retry_io(lambda: os.replace(tmp, book))
+            key = self._key(month)
+            self._write_sidecar(month, df, f"{key[0]}:{key[1]}".encode())
+            data[month] = self._month_stats(df)
+        with self._lock:
+            self._months.pop(month, None)
+        self._write_manifest(data)
+
+    def add(self, rows: pd.DataFrame):
+        """Дописать записи в их месяцы; запись с уже архивным id заменяет прежнюю."""
+        for month, part in rows.groupby(rows["date"].dt.strftime("%Y-%m"), sort=True):
+            if self._book(month).exists():
+                old = self.load(month)
+                old = old[~old["id"].isin(part["id"])]
+                part = concat_incidents([old, part])
+            part = part.sort_values("id", kind="stable").reset_index(drop=True)
+            self.write(month, part)
@@ -0,0 +1,255 @@
+# benchmarks/run.py
+"""Замеры хранилища, реестра и докладов на синтетических данных.
+
+    python -m benchmarks.run                                 # 1k/10k/100k, все движки
+    python -m benchmarks.run --rows 10000 --engines sqlite --ops append_incident,query
+    python -m benchmarks.run --compare benchmarks/results/прошлый.json --threshold 1.2
+
+Запускать из корня проекта. Для каждого движка и размера реестра данные
+создаются заново во временной папке (одинаковые при одинаковом --seed).
+Время — медиана и минимум по --repeat повторам (перед операциями без
+подготовки — один прогон вхолостую); пик памяти — отдельным прогоном под
+tracemalloc (память Python и numpy/pandas; память pyarrow и SQLite не
+видна). Результаты — JSON в benchmarks/results/; с --compare печатается
+отношение к прошлому прогону, а с --threshold код возврата 1, если
+какая-то операция замедлилась сильнее порога.
+
+Движок excel без журнала переписывает книгу на каждую запись — на 100k
+записей append/update идут секундами, поэтому полный прогон долгий.
+"""
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import make_incidents, make_locations, write_workbook
+from config import DEFAULT_CONFIG
+from query import IncidentQuery
+from report_generator import ReportGenerator
+from sqlite_storage import SqliteStorage
+from storage import DEFAULT_STATUS, IncidentStorage, StorageEngine
+
+try:
+    # без tkinter (урезанный Python) замер реестра пропускается
+    from app import RegistryWindow
+except ImportError:
+    RegistryWindow = None
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+SCREEN_ROWS = 40   # строк реестра на экране (форматируются при обновлении)
+
+class Bench(NamedTuple):
+    name: str
+    run: Callable[[SimpleNamespace], Any]
+    setup: Optional[Callable[[SimpleNamespace], Any]] = None   # перед каждым повтором, вне замера
+    engines: Optional[tuple] = None                              # None — все движки
+
+# ---- Движки ----
+def _excel(folder: Path, journal: bool) -> StorageEngine:
+    # архив выключен: замеряем рабочий реестр целиком; журнал не уплотняется сам
+    return IncidentStorage(str(folder / "incidents.xlsx"), journal=journal, compact_every=0, archive_days=0)
+
+ENGINES: Dict[str, Callable[[Path], StorageEngine]] = {
+    "excel": lambda folder: _excel(folder, journal=False),
+    "excel-journal": lambda folder: _excel(folder, journal=True),
+    "sqlite": lambda folder: SqliteStorage(str(folder / "incidents.db")),
+}
+
+def _prepare(engine: str, folder: Path, workbook: Path, incidents: pd.DataFrame,
+             locations: pd.DataFrame) -> StorageEngine:
+    folder.mkdir(parents=True)
+    if engine == "sqlite":
+        storage = ENGINES[engine](folder)
+        storage.save_locations(locations)
+        storage.append_incidents(incidents)
+        return storage
+    shutil.copy(workbook, folder / "incidents.xlsx")
+    return ENGINES[engine](folder)
+
+# ---- Операции ----
+def _new_record(ctx: SimpleNamespace) -> Dict[str, Any]:
+    loc = ctx.locations.iloc[ctx.n % len(ctx.locations)]
+    ctx.n += 1
+    return {
+        "id": None, "date": ctx.end, "time": datetime.now().time().replace(microsecond=0),
+        "location": loc["location"], "address": loc["address"], "duty": "Замер",
+        "type": "Без типа", "description": f"Замер записи {ctx.n}", "status": DEFAULT_STATUS,
+    }
+
+def _update(ctx: SimpleNamespace):
+    ctx.n += 1
+    ctx.storage.update_incident(int(ctx.rng.integers(1, ctx.rows + 1)), {"comment": f"Замер правки {ctx.n}"})
+
+def _drop_snapshot(ctx: SimpleNamespace):
+    ctx.storage.invalidate_cache()
+    ctx.storage.snapshot_path.unlink(missing_ok=True)
+
+def _daily_report(ctx: SimpleNamespace):
+    return ctx.reporter.build_daily_report(ctx.storage.load_day_range(ctx.end, ctx.end), None, ctx.end)
+
+def _period_report(ctx: SimpleNamespace):
+    start = ctx.end - timedelta(days=29)
+    st = ctx.reporter.period_stats(ctx.storage.load_day_range(start, ctx.end), start, ctx.end,
+                                   rollup=ctx.storage.daily_rollup(start, ctx.end))
+    return ctx.reporter.render_period(st)
+
+def _registry_refresh(ctx: SimpleNamespace):
+    # RegistryWindow.refresh без окна: выборка и списки фильтров (рабочий поток),
+    # затем форматирование первого экрана строк
+    win = SimpleNamespace(storage=ctx.storage, SEARCH_LIMIT=RegistryWindow.SEARCH_LIMIT,
+                          FILTER_FIELDS=RegistryWindow.FILTER_FIELDS)
+    df, _ = RegistryWindow._load_rows(win, IncidentQuery(), "")
+    win._rows = df.reset_index(drop=True)
+    return RegistryWindow._format_rows(win, 0, SCREEN_ROWS)
+
+BENCHES: List[Bench] = [
+    Bench("load_workbook", lambda ctx: ctx.storage.load_incidents(), _drop_snapshot, ("excel", "excel-journal")),
+    Bench("load_cold", lambda ctx: ctx.storage.load_incidents(), lambda ctx: ctx.storage.invalidate_cache()),
+    Bench("load_warm", lambda ctx: ctx.storage.load_incidents()),
+    Bench("append_incident", lambda ctx: ctx.storage.append_incident(_new_record(ctx))),
+    Bench("update_incident", _update),
+    Bench("query", lambda ctx: ctx.storage.query(
+        IncidentQuery(date_from=ctx.end - timedelta(days=30), status=DEFAULT_STATUS))),
+    Bench("search", lambda ctx: ctx.storage.search("нет питания")),
+    Bench("daily_report", _daily_report),
+    Bench("period_report", _period_report),
+    Bench("registry_refresh", _registry_refresh),
+]
+
+def _measure(bench: Bench, ctx: SimpleNamespace, repeat: int) -> Dict[str, Any]:
+    if bench.setup is None:
+        bench.run(ctx)
+    times = []
+    for _ in range(repeat):
+        if bench.setup is not None:
+            bench.setup(ctx)
+        t0 = time.perf_counter()
+        bench.run(ctx)
+        times.append(time.perf_counter() - t0)
+    # память — отдельным прогоном: под tracemalloc время заметно больше
+    if bench.setup is not None:
+        bench.setup(ctx)
+    tracemalloc.start()
+    try:
+        bench.run(ctx)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "median_ms": round(statistics.median(times) * 1000, 3),
+        "min_ms": round(min(times) * 1000, 3),
+        "max_ms": round(max(times) * 1000, 3),
+        "peak_kib": round(peak / 1024, 1),
+        "repeat": repeat,
+    }
+
+# ---- Прогон ----
+def _meta(args: argparse.Namespace) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = ""
+    return {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "days": args.days,
+        "locations": args.locations,
+    }
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    ops = set(args.ops.split(",")) if args.ops else None
+    benches = [b for b in BENCHES if ops is None or b.name in ops]
+    if RegistryWindow is None:
+        benches = [b for b in benches if b.name != "registry_refresh"]
+    locations = make_locations(args.locations, args.addresses)
+    end = date.today()
+    results = []
+    work = Path(args.workdir or tempfile.mkdtemp(prefix="incidents-bench-"))
+    try:
+        for rows in args.rows:
+            incidents = make_incidents(rows, locations, days=args.days, end=end, seed=args.seed)
+            workbook = work / f"base-{rows}.xlsx"
+            write_workbook(workbook, incidents, locations)
+            for engine in args.engines:
+                storage = _prepare(engine, work / f"{engine}-{rows}", workbook, incidents, locations)
+                ctx = SimpleNamespace(storage=storage, reporter=ReportGenerator(DEFAULT_CONFIG), rows=rows,
+                                      locations=locations, end=end, n=0,
+                                      rng=np.random.default_rng(args.seed))
+                try:
+                    for bench in benches:
+                        if bench.engines is not None and engine not in bench.engines:
+                            continue
+                        res = {"engine": engine, "rows": rows, "op": bench.name, **_measure(bench, ctx, args.repeat)}
+                        results.append(res)
+                        print(f"{engine:14} {rows:>7} {bench.name:17} {res['median_ms']:11.2f} мс "
+                              f"{res['peak_kib']:11.0f} КиБ", flush=True)
+                finally:
+                    storage.close()
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+    return {"meta": _meta(args), "results": results}
+
+def compare(current: Dict[str, Any], base_path: str, threshold: Optional[float]) -> int:
+    """Отношение медиан к прошлому прогону; 1 — есть замедление сильнее порога."""
+    with open(base_path, "r", encoding="utf-8") as f:
+        base = {(r["engine"], r["rows"], r["op"]): r for r in json.load(f)["results"]}
+    worse = 0
+    print(f"\nСравнение с {base_path}:")
+    for r in current["results"]:
+        old = base.get((r["engine"], r["rows"], r["op"]))
+        if old is None or not old["median_ms"]:
+            continue
+        ratio = r["median_ms"] / old["median_ms"]
+        flag = ""
+        if threshold and ratio > threshold:
+            flag = "  ← медленнее"
+            worse += 1
+        print(f"{r['engine']:14} {r['rows']:>7} {r['op']:17} {old['median_ms']:11.2f} → "
+              f"{r['median_ms']:11.2f} мс  ×{ratio:.2f}{flag}")
+    return 1 if worse else 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(prog="python -m benchmarks.run", description="Замеры реестра инцидентов.")
+    p.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000], help="размеры реестра")
+    p.add_argument("--engines", nargs="+", choices=sorted(ENGINES), default=sorted(ENGINES))
+    p.add_argument("--ops", help="операции через запятую: " + ",".join(b.name for b in BENCHES))
+    p.add_argument("--repeat", type=int, default=5, help="повторов каждой операции")
+    p.add_argument("--days", type=int, default=365, help="за сколько дней до сегодня распределены записи")
+    p.add_argument("--locations", type=int, default=20, help="число локаций")
+    p.add_argument("--addresses", type=int, default=5, help="адресов у локации")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", help="файл результатов (по умолчанию benchmarks/results/<время>-<коммит>.json)")
+    p.add_argument("--compare", help="прошлый файл результатов для сравнения")
+    p.add_argument("--threshold", type=float, help="допустимое замедление, например 1.2")
+    p.add_argument("--workdir", help="папка для данных (по умолчанию временная)")
+    p.add_argument("--keep", action="store_true", help="не удалять данные после прогона")
+    args = p.parse_args(argv)
+
+    data = run(args)
+    out = Path(args.out) if args.out else RESULTS_DIR / (
+        f"{datetime.now():%Y%m%d-%H%M%S}" + (f"-{data['meta']['commit']}" if data["meta"]["commit"] else "") + ".json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    print(f"Результаты: {out}")
+    return compare(data, args.compare, args.threshold) if args.compare else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
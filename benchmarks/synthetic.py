@@ -0,0 +1,70 @@
+# benchmarks/synthetic.py
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Optional
+import numpy as np
+import pandas as pd
+from storage import (
+    CLOSED_STATUS, DEFAULT_STATUS, INCIDENT_SHEET, LOCATIONS_SHEET, ensure_incidents_schema, to_excel_frame,
+)
+
+# Словарь описаний: поиск и индексы видят похожее на живые данные распределение слов
+WORDS = (
+    "нет питания связи света воды отопления авария линии счетчика щита насоса кабеля "
+    "сбой сервера камеры доступа домофона лифта утечка замена ремонт проверка обрыв "
+    "перегрев шум вибрация датчик ворота шлагбаум пожарная сигнализация вентиляция"
+).split()
+TYPES = ("Электроснабжение", "Связь", "Водоснабжение", "Отопление", "Оборудование", "Без типа")
+DUTIES = ("Иванов И.И.", "Петров П.П.", "Сидорова А.А.", "Кузнецов Д.В.")
+
+def make_locations(locations: int = 20, addresses: int = 5) -> pd.DataFrame:
+    """Справочник: locations локаций по addresses адресов."""
+    return pd.DataFrame(
+        [(f"Объект {i + 1}", f"ул. Тестовая, {i + 1}/{j + 1}") for i in range(locations) for j in range(addresses)],
+        columns=["location", "address"],
+    )
+
+def make_incidents(rows: int, locations: Optional[pd.DataFrame] = None, days: int = 365,
+                   end: Optional[date] = None, closed_share: float = 0.8, seed: int = 0) -> pd.DataFrame:
+    """Типизированный реестр из rows записей за days дней до end (по умолчанию — сегодня).
+
+    id идут по возрастанию даты, как при обычной работе; закрыто около
+    closed_share записей, время закрытия — до двух суток после инцидента.
+    Одинаковые аргументы дают одинаковые данные.
+    """
+    rng = np.random.default_rng(seed)
+    locations = make_locations() if locations is None else locations
+    end = end or date.today()
+    start = pd.Timestamp(end - timedelta(days=days - 1))
+    day = np.sort(rng.integers(0, days, rows))
+    minutes = rng.integers(0, 24 * 60, rows)
+    loc = locations.iloc[rng.integers(0, len(locations), rows)].reset_index(drop=True)
+    words = np.array(WORDS, dtype=object)
+    n_words = rng.integers(2, 7, rows)
+    picks = words[rng.integers(0, len(words), n_words.sum())]
+    description = [" ".join(p).capitalize() for p in np.split(picks, np.cumsum(n_words)[:-1])]
+    closed = rng.random(rows) < closed_share
+    dates = start + pd.to_timedelta(day, unit="D")
+    times = pd.to_timedelta(minutes, unit="m")
+    resolved = (dates + times + pd.to_timedelta(rng.integers(5, 48 * 60, rows), unit="m")).where(closed)
+    df = pd.DataFrame({
+        "id": np.arange(1, rows + 1),
+        "date": dates,
+        "time": times,
+        "location": loc["location"],
+        "address": loc["address"],
+        "duty": np.array(DUTIES, dtype=object)[rng.integers(0, len(DUTIES), rows)],
+        "type": np.array(TYPES, dtype=object)[rng.integers(0, len(TYPES), rows)],
+        "description": description,
+        "status": np.where(closed, CLOSED_STATUS, DEFAULT_STATUS),
+        "resolved_at": resolved,
+        "comment": np.where(rng.random(rows) < 0.3, "Принято в работу", ""),
+    })
+    return ensure_incidents_schema(df)
+
+def write_workbook(path: Path, incidents: pd.DataFrame, locations: pd.DataFrame):
+    """Книга реестра в формате IncidentStorage (листы инцидентов и локаций)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with pd.ExcelWriter(path, engine="openpyxl") as w:
+        to_excel_frame(incidents).to_excel(w, sheet_name=INCIDENT_SHEET, index=False)
+        locations.to_excel(w, sheet_name=LOCATIONS_SHEET, index=False)
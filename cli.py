@@ -0,0 +1,377 @@
+# cli.py
+"""Командная строка без окна: инциденты, выборки, доклады, импорт/экспорт.
+
+    python cli.py add --location "Склад" --address "ул. Ленина, 1" --description "Нет питания" --notify
+    python cli.py close 42 --comment "Заменён автомат"
+    python cli.py query --from 01.10.2026 --status Открыт
+    python cli.py export incidents.csv --archive
+    python cli.py report --send
+    python cli.py daemon
+
+Если запущен демон (python cli.py daemon), команды выполняет он: реестр,
+индексы и справочник уже в памяти, книга не разбирается заново на каждый
+вызов, а очередь Telegram работает постоянно. Без демона команда
+выполняется в своём процессе (--local — всегда так). Демон принимает
+только запросы с общим токеном: daemon.token из конфигурации или
+случайный, который демон при запуске пишет в daemon.token_path.
+"""
+import argparse
+import hmac
+import io
+import json
+import os
+import secrets
+import signal
+import socket
+import socketserver
+import sys
+import threading
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, TextIO
+from config import load_config
+from core import Core
+from exporter import export_incidents, jsonl_text
+from locking import StorageBusyError
+from metrics import METRICS
+from query import IncidentQuery
+from report_generator import TEMPLATES
+from storage import (
+    CLOSED_STATUS, fmt_datetime, format_dates, format_times, read_incidents_file,
+    to_excel_frame,
+)
+
+SEND_TIMEOUT = 30.0   # сколько ждать отправки сообщений при запуске без демона
+
+def _parse_date(s: str) -> date:
+    try:
+        return datetime.strptime(s, "%d.%m.%Y").date()
+    except ValueError:
+        raise ValueError(f"Неверная дата «{s}». Используйте ДД.ММ.ГГГГ.")
+
+def _parse_time(s: str):
+    try:
+        return datetime.strptime(s, "%H:%M").time()
+    except ValueError:
+        raise ValueError(f"Неверное время «{s}». Используйте ЧЧ:ММ.")
+
+def _query(args: argparse.Namespace) -> IncidentQuery:
+    return IncidentQuery(
+        date_from=_parse_date(args.date_from) if args.date_from else None,
+        date_to=_parse_date(args.date_to) if args.date_to else None,
+        status=args.status, location=args.location, address=args.address,
+        type=args.type, duty=args.duty, text=args.text, archive=args.archive,
+    )
+
+# ---- Команды: (ядро, аргументы, вывод) → код возврата ----
+def cmd_add(core: Core, args: argparse.Namespace, out: TextIO) -> int:
+    rec = core.new_record(
+        args.location, args.address, args.description,
+        day=_parse_date(args.date) if args.date else None,
+        at=_parse_time(args.time) if args.time else None,
+        duty=args.duty, type=args.type, comment=args.comment,
+    )
+    out.write(f"{core.add_incident(rec, notify=args.notify)}\n")
+    return 0
+
+def cmd_close(core: Core, args: argparse.Namespace, out: TextIO) -> int:
+    if args.at:
+        try:
+            resolved_at = datetime.strptime(args.at, "%d.%m.%Y %H:%M")
+        except ValueError:
+            raise ValueError("Неверное время исправления. Используйте \"ДД.ММ.ГГГГ ЧЧ:ММ\".")
+    else:
+        resolved_at = datetime.now().replace(second=0, microsecond=0)
+    fields: Dict[str, Any] = {"status": CLOSED_STATUS, "resolved_at": resolved_at}
+    if args.comment is not None:
+        fields["comment"] = args.comment
+    core.storage.update_incident(args.id, fields)
+    out.write(f"Инцидент id={args.id} закрыт.\n")
+    return 0
+
+def cmd_query(core: Core, args: argparse.Namespace, out: TextIO) -> int:
+    q = _query(args)
+    if args.search:
+        df = core.storage.search(args.search, q, limit=args.limit).drop(columns="score")
+    else:
+        df = core.storage.query(q).sort_values(by=["date", "time", "id"], ascending=False)
+        if args.limit:
+            df = df.head(args.limit)
+    if args.format == "csv":
+        to_excel_frame(df).to_csv(out, index=False)
+    elif args.format == "jsonl":
+        out.write(jsonl_text(df))
+    elif df.empty:
+        out.write("Записей не найдено.\n")
+    else:
+        view = df[["id", "location", "address", "status", "description"]].astype(object)
+        view.insert(1, "date", format_dates(df["date"]))
+        view.insert(2, "time", format_times(df["time"]))
+        out.write(view.to_string(index=False) + "\n")
+    return 0
+
+def cmd_export(core: Core, args: argparse.Namespace, out: TextIO) -> int:
+    n = export_incidents(core.storage, args.path, _query(args))
+    out.write(f"Выгружено записей: {n} → {args.path}\n")
+    return 0
+
+def cmd_import(core: Core, args: argparse.Namespace, out: TextIO) -> int:
+    ids = core.storage.append_incidents(read_incidents_file(args.path))
+    out.write(f"Импортировано записей: {len(ids)}\n")
+    return 0
+
+def cmd_report(core: Core, args: argparse.Namespace, out: TextIO) -> int:
+    day = _parse_date(args.date) if args.date else date.today()
+    df = core.daily_frame(day)
+    out.write(core.reporter.build_daily_report(df, TEMPLATES[args.template], day) + "\n")
+    if args.send:
+        core.send_daily_report(df, day)
+        out.write("Доклад поставлен в очередь отправки в Telegram.\n")
+    return 0
+
+def cmd_period(core: Core, args: argparse.Namespace, out: TextIO) -> int:
+    st = core.period_stats(_parse_date(args.date_from), _parse_date(args.date_to))
+    out.write("\n".join(core.reporter.render_period(st, TEMPLATES[args.template])) + "\n")
+    if args.send:
+        core.send_period_report(st)
+        out.write("Доклад поставлен в очередь отправки в Telegram.\n")
+    return 0
+
+def cmd_archive(core: Core, args: argparse.Namespace, out: TextIO) -> int:
+    out.write(f"Перенесено в архив: {core.storage.move_to_archive()}\n")
+    return 0
+
+def cmd_status(core: Core, args: argparse.Namespace, out: TextIO) -> int:
+    cache = core.storage.cache_stats()
+    tg = core.outbox.stats()
+    out.write(
+        f"Записей в памяти: {cache['rows']} (попаданий в кэш {cache['hits']}, чтений {cache['misses']})\n"
+        f"Telegram: в очереди {tg['depth']}, не отправлено {tg['failed']}, отправлено {tg['sent']}\n"
+    )
+    nxt = core.scheduler.next_run()
+    if nxt is not None:
+        out.write(f"Доклад по расписанию: {fmt_datetime(nxt)}\n")
+    if core.scheduler.last_error:
+        out.write(f"Ошибка доклада по расписанию: {core.scheduler.last_error}\n")
+    return 0
+
+def cmd_metrics(core: Core, args: argparse.Namespace, out: TextIO) -> int:
+    # через демон — его накопленные замеры, без демона — замеры этого вызова
+    out.write(METRICS.to_prometheus() if args.format == "prom" else METRICS.to_json() + "\n")
+    return 0
+
+COMMANDS: Dict[str, Callable[[Core, argparse.Namespace, TextIO], int]] = {
+    "add": cmd_add, "close": cmd_close, "query": cmd_query, "export": cmd_export,
+    "import": cmd_import, "report": cmd_report, "period": cmd_period,
+    "archive": cmd_archive, "status": cmd_status, "metrics": cmd_metrics,
+}
+# команды, после которых без демона нужно дождаться отправки в Telegram
+_SENDS = ("notify", "send")
+
+def execute(core: Core, args: argparse.Namespace, out: TextIO, err: TextIO) -> int:
+    try:
+        return COMMANDS[args.command](core, args, out)
+    except (ValueError, OSError, StorageBusyError) as e:
+        err.write(f"Ошибка: {e}\n")
+        return 1
+
+# ---- Разбор аргументов ----
+def _add_filters(p: argparse.ArgumentParser, dates_required: bool = False):
+    p.add_argument("--from", dest="date_from", required=dates_required, help="дата с (ДД.ММ.ГГГГ)")
+    p.add_argument("--to", dest="date_to", required=dates_required, help="дата по (ДД.ММ.ГГГГ)")
+    for f, label in (("status", "статус"), ("location", "локация"), ("address", "адрес"),
+                     ("type", "тип"), ("duty", "дежурный")):
+        p.add_argument(f"--{f}", help=f"{label} (точное значение)")
+    p.add_argument("--text", help="подстрока описания")
+    p.add_argument("--archive", action="store_true", help="без --from/--to читать и весь архив, не только рабочий реестр")
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli.py", description="Реестр инцидентов и доклады без окна.")
+    parser.add_argument("--config", default="config.yaml", help="файл настроек (по умолчанию config.yaml)")
+    parser.add_argument("--local", action="store_true", help="выполнить в этом процессе, не обращаясь к демону")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("add", help="создать инцидент")
+    p.add_argument("--date", help="дата (ДД.ММ.ГГГГ, по умолчанию сегодня)")
+    p.add_argument("--time", help="время (ЧЧ:ММ, по умолчанию сейчас)")
+    p.add_argument("--location", required=True)
+    p.add_argument("--address", required=True)
+    p.add_argument("--duty", help="дежурный (по умолчанию ui.default_duty)")
+    p.add_argument("--type", help="тип инцидента")
+    p.add_argument("--description", required=True)
+    p.add_argument("--comment")
+    p.add_argument("--notify", action="store_true", help="отправить уведомление в Telegram")
+
+    p = sub.add_parser("close", help="закрыть инцидент")
+    p.add_argument("id", type=int)
+    p.add_argument("--at", help="время исправления \"ДД.ММ.ГГГГ ЧЧ:ММ\" (по умолчанию сейчас)")
+    p.add_argument("--comment")
+
+    p = sub.add_parser("query", help="выборка из реестра")
+    _add_filters(p)
+    p.add_argument("--search", help="полнотекстовый поиск по описанию и комментарию")
+    p.add_argument("--limit", type=int, default=None, help="не больше стольких записей")
+    p.add_argument("--format", choices=("table", "csv", "jsonl"), default="table")
+
+    p = sub.add_parser("export", help="выгрузить реестр в файл (.csv, .jsonl, .xlsx)")
+    p.add_argument("path", type=os.path.abspath)
+    _add_filters(p)
+
+    p = sub.add_parser("import", help="добавить инциденты из файла (.csv, .xlsx)")
+    p.add_argument("path", type=os.path.abspath)
+
+    p = sub.add_parser("report", help="доклад за день")
+    p.add_argument("--date", help="день (ДД.ММ.ГГГГ, по умолчанию сегодня)")
+    p.add_argument("--template", choices=sorted(TEMPLATES), default="plain", help="оформление вывода")
+    p.add_argument("--send", action="store_true", help="отправить в Telegram (оформление из настроек)")
+
+    p = sub.add_parser("period", help="сводный доклад за период")
+    p.add_argument("--from", dest="date_from", required=True, help="дата с (ДД.ММ.ГГГГ)")
+    p.add_argument("--to", dest="date_to", required=True, help="дата по (ДД.ММ.ГГГГ)")
+    p.add_argument("--template", choices=sorted(TEMPLATES), default="plain", help="оформление вывода")
+    p.add_argument("--send", action="store_true", help="отправить в Telegram (оформление из настроек)")
+
+    sub.add_parser("archive", help="перенести старые закрытые инциденты в архив")
+    sub.add_parser("status", help="состояние кэша и очереди Telegram")
+    p = sub.add_parser("metrics", help="замеры времени операций")
+    p.add_argument("--format", choices=("json", "prom"), default="json")
+
+    p = sub.add_parser("daemon", help="держать хранилище открытым и выполнять команды других вызовов")
+    p.add_argument("--port", type=int, help="порт (по умолчанию daemon.port из настроек)")
+    return parser
+
+# ---- Демон ----
+def _request_args(args: argparse.Namespace) -> Dict[str, Any]:
+    return {k: v for k, v in vars(args).items() if k not in ("config", "local")}
+
+class _DaemonHandler(socketserver.StreamRequestHandler):
+    # Одна строка JSON на запрос и на ответ
+    def handle(self):
+        try:
+            req = json.loads(self.rfile.readline().decode("utf-8"))
+            token = str(req.get("token") or "")
+            args = argparse.Namespace(**req["args"])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return
+        out, err = io.StringIO(), io.StringIO()
+        if not hmac.compare_digest(token.encode("utf-8"), self.server.token.encode("utf-8")):
+            err.write("Ошибка: неверный токен демона (daemon.token).\n")
+            code = 1
+        elif args.command not in COMMANDS:
+            err.write(f"Ошибка: демон не знает команду {args.command}\n")
+            code = 1
+        else:
+            try:
+                code = execute(self.server.core, args, out, err)
+            except Exception as e:
+                err.write(f"Ошибка: {e}\n")
+                code = 1
+        resp = {"code": code, "out": out.getvalue(), "err": err.getvalue()}
+        self.wfile.write(json.dumps(resp, ensure_ascii=False).encode("utf-8") + b"\n")
+
+class _DaemonServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    core: Core
+    token: str
+
+def _daemon_address(cfg: Dict[str, Any], port: Optional[int] = None):
+    d = cfg.get("daemon", {})
+    return d.get("host", "127.0.0.1"), int(port or d.get("port", 8765))
+
+def _read_token(cfg: Dict[str, Any]) -> str:
+    # Токен из конфигурации или из файла, который записал запущенный демон
+    d = cfg.get("daemon", {})
+    if d.get("token"):
+        return str(d["token"])
+    try:
+        with open(d.get("token_path") or "data/daemon.token", "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+def _daemon_token(cfg: Dict[str, Any]) -> str:
+    # Без token в конфигурации — случайный, в файл с доступом только владельцу
+    d = cfg.get("daemon", {})
+    if d.get("token"):
+        return str(d["token"])
+    token = secrets.token_hex(16)
+    path = d.get("token_path") or "data/daemon.token"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token)
+    os.chmod(path, 0o600)   # файл мог остаться от прошлого запуска с другими правами
+    return token
+
+def run_daemon(cfg: Dict[str, Any], port: Optional[int] = None) -> int:
+    core = Core(cfg, start_scheduler=True, start_metrics_dump=True)
+    # прогрев: реестр, индексы, сводка по дням и справочник — в память сразу
+    core.storage.distinct_values("status")
+    core.storage.daily_rollup(date.today(), date.today())
+    core.storage.directory()
+    server = _DaemonServer(_daemon_address(cfg, port), _DaemonHandler)
+    server.core = core
+    server.token = _daemon_token(cfg)
+    api = None
+    if cfg["api"]["enabled"]:
+        from api import start_api
+        api = start_api(core)
+
+    def stop(*_):
+        # shutdown() ждёт выхода serve_forever — вызываем из другого потока
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    signal.signal(signal.SIGTERM, stop)
+    host, p = server.server_address[:2]
+    print(f"Демон слушает {host}:{p}; остановка — Ctrl+C", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if api is not None:
+            api.shutdown()
+            api.server_close()
+        core.close()
+    return 0
+
+def call_daemon(cfg: Dict[str, Any], args: argparse.Namespace) -> Optional[Dict[str, Any]]:
+    """Выполнить команду в запущенном демоне; None — демон не запущен."""
+    try:
+        sock = socket.create_connection(_daemon_address(cfg), timeout=0.5)
+    except OSError:
+        return None
+    with sock:
+        # команда может выполняться долго (импорт, выгрузка) — ответ ждём без ограничения
+        sock.settimeout(None)
+        req = {"token": _read_token(cfg), "args": _request_args(args)}
+        sock.sendall(json.dumps(req, ensure_ascii=False).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    return json.loads(line.decode("utf-8")) if line else None
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    cfg = load_config(args.config)
+    if args.command == "daemon":
+        return run_daemon(cfg, args.port)
+    if not args.local:
+        resp = call_daemon(cfg, args)
+        if resp is not None:
+            sys.stdout.write(resp["out"])
+            sys.stderr.write(resp["err"])
+            return int(resp["code"])
+
+    sends = any(getattr(args, k, False) for k in _SENDS)
+    core = Core(cfg, start_outbox=sends)
+    try:
+        code = execute(core, args, sys.stdout, sys.stderr)
+        # своего демона нет — дожидаемся отправки здесь; остаток уйдёт при следующем запуске
+        if sends and not core.outbox.flush(SEND_TIMEOUT):
+            sys.stderr.write(f"Не все сообщения отправлены: в очереди {core.outbox.depth()}.\n")
+        return code
+    finally:
+        core.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
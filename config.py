@@ -3,9 +3,31 @@ import os
 import yaml
 
 DEFAULT_CONFIG = {
-    "telegram": {"token": "", "chat_id": ""},
-    "storage": {"excel_path": "data/incidents.xlsx"},
-    "ui": {"default_duty": ""}
+    "telegram": {
+        "token": "",
+        "chat_id": "",
+        "queue_path": "data/telegram_outbox.db",
+        "min_interval": 1.0,
+        "per_minute": 20,
+        "merge_delay": 2.0,
+        "max_attempts": 8,
+    },
+    "storage": {
+        "engine": "excel",
+        "excel_path": "data/incidents.xlsx",
+        "sqlite_path": "data/incidents.db",
+        "journal": False,
+        "journal_compact_every": 500,
+        "snapshot": True,
+        "lock_timeout": 30.0,
+        "archive_days": 0,
+    },
+    "report": {"template": "plain", "max_chunks": 3, "attach_format": "csv"},
+    "schedule": {"daily_report": [], "state_path": "data/schedule_state.json", "catch_up_minutes": 60},
+    "metrics": {"dump_path": "", "dump_every": 60},
+    "ui": {"default_duty": ""},
+    "daemon": {"host": "127.0.0.1", "port": 8765, "token": "", "token_path": "data/daemon.token"},
+    "api": {"enabled": False, "host": "127.0.0.1", "port": 8766, "token": "", "max_limit": 5000},
 }
 
 def load_config(path: str = "config.yaml"):
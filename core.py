@@ -0,0 +1,110 @@
+# core.py
+from datetime import date, datetime, time
+from typing import Any, Dict, Optional
+import pandas as pd
+from metrics import METRICS, MetricsDumper
+from report_generator import PeriodStats, ReportGenerator, incident_message
+from scheduler import ReportScheduler, parse_slots
+from storage import DEFAULT_STATUS, create_storage
+from telegram_client import TelegramClient
+from telegram_outbox import TelegramOutbox
+
+class Core:
+    """Хранилище, генератор докладов и очередь Telegram без интерфейса.
+
+    Общая часть окна (app.py), командной строки и демона (cli.py): одна
+    конфигурация, один движок хранилища с его кэшами, одна очередь отправки.
+    """
+
+    def __init__(self, cfg: Dict[str, Any], start_outbox: bool = True, start_scheduler: bool = False,
+                 start_metrics_dump: bool = False):
+        self.cfg = cfg
+        self.storage = create_storage(cfg)
+        self.reporter = ReportGenerator(cfg)
+        tg = cfg["telegram"]
+        self.telegram = TelegramClient(tg["token"], tg["chat_id"])
+        # Уведомления уходят через дисковую очередь с повторами и лимитами Bot API
+        self.outbox = TelegramOutbox(
+            self.telegram, tg["queue_path"],
+            min_interval=float(tg["min_interval"]), per_minute=int(tg["per_minute"]),
+            merge_delay=float(tg["merge_delay"]), max_attempts=int(tg["max_attempts"]),
+        )
+        if start_outbox:
+            self.outbox.start()
+        # Суточный доклад по расписанию — только в окне и демоне, не в разовых командах
+        sch = cfg["schedule"]
+        self.scheduler = ReportScheduler(self, parse_slots(sch["daily_report"]), sch["state_path"],
+                                         catch_up_minutes=int(sch["catch_up_minutes"]))
+        if start_scheduler:
+            self.scheduler.start()
+        # Замеры в файл (JSON или .prom для Prometheus), если задан metrics.dump_path, —
+        # только в окне, демоне и API: разовая команда затёрла бы файл своими замерами
+        m = cfg["metrics"]
+        self.metrics_dumper: Optional[MetricsDumper] = None
+        if start_metrics_dump and m["dump_path"]:
+            self.metrics_dumper = MetricsDumper(METRICS, m["dump_path"], float(m["dump_every"]))
+            self.metrics_dumper.start()
+
+    # ---- Инциденты ----
+    def new_record(self, location: str, address: str, description: str, day: Optional[date] = None,
+                   at: Optional[time] = None, duty: Optional[str] = None, type: Optional[str] = None,
+                   comment: Optional[str] = None) -> Dict[str, Any]:
+        """Новый инцидент с проверкой по справочнику и значениями по умолчанию, как в окне."""
+        directory = self.storage.directory()
+        if location not in directory:
+            raise ValueError(f"Неизвестная локация «{location}» (справочник «Локации и адреса»).")
+        if address not in directory[location]:
+            raise ValueError(f"У локации «{location}» нет адреса «{address}».")
+        description = (description or "").strip()
+        if not description:
+            raise ValueError("Описание не может быть пустым.")
+        return {
+            "id": None,
+            "date": day or date.today(),
+            "time": at or datetime.now().time().replace(second=0, microsecond=0),
+            "location": location,
+            "address": address,
+            "duty": (duty or self.cfg.get("ui", {}).get("default_duty") or "").strip(),
+            "type": (type or "").strip() or "Без типа",
+            "description": description,
+            "status": DEFAULT_STATUS,
+            "resolved_at": None,
+            "comment": comment or "",
+        }
+
+    def add_incident(self, rec: Dict[str, Any], notify: bool = False) -> int:
+        """Записать инцидент и (по желанию) поставить уведомление в очередь Telegram."""
+        incident_id = self.storage.append_incident(rec)
+        if notify:
+            self.outbox.enqueue(incident_message(rec))
+        return incident_id
+
+    # ---- Доклады ----
+    def daily_frame(self, day: Optional[date] = None) -> pd.DataFrame:
+        day = day or date.today()
+        return self.storage.load_day_range(day, day)
+
+    def send_daily_report(self, df: pd.DataFrame, day: Optional[date] = None):
+        # длинный доклад — несколько сообщений по порядку, при избытке частей — файлом
+        chunks, attachment = self.reporter.build_daily_messages(df, day)
+        self.outbox.enqueue_many(chunks, parse_mode=self.reporter.template.parse_mode)
+        if attachment:
+            self.outbox.enqueue_document(*attachment)
+
+    def period_stats(self, start: date, end: date) -> PeriodStats:
+        # счётчики — из сводки по дням, сами записи нужны только для времени закрытия
+        return self.reporter.period_stats(self.storage.load_day_range(start, end), start, end,
+                                          rollup=self.storage.daily_rollup(start, end))
+
+    def send_period_report(self, st: PeriodStats):
+        chunks = self.reporter.period_messages(st)
+        self.outbox.enqueue_many(chunks, parse_mode=self.reporter.template.parse_mode)
+
+    def close(self):
+        # неотправленные сообщения остаются в очереди до следующего запуска
+        self.scheduler.stop()
+        self.outbox.close()
+        self.telegram.close()
+        self.storage.close()
+        if self.metrics_dumper is not None:
+            self.metrics_dumper.stop()
@@ -0,0 +1,102 @@
+# exporter.py
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+import pandas as pd
+from openpyxl import Workbook
+from query import IncidentQuery
+from storage import StorageEngine, INCIDENT_COLUMNS, INCIDENT_SHEET, to_excel_frame
+
+EXPORT_FORMATS = ("csv", "jsonl", "xlsx")
+CHUNK_ROWS = 5000
+
+def export_format(path: str) -> str:
+    fmt = Path(path).suffix.lower().lstrip(".")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неподдерживаемый формат выгрузки: {Path(path).name} (нужен .csv, .jsonl или .xlsx)")
+    return fmt
+
+def _cells(chunk: pd.DataFrame) -> pd.DataFrame:
+    # Ячейки как в книге реестра; пропуски — None (пустая ячейка)
+    out = to_excel_frame(chunk).astype(object)
+    return out.where(out.notna(), None)
+
+def _write_csv(path: Path, chunks, on_chunk):
+    # BOM, чтобы Excel открыл кириллицу без мастера импорта (как в докладах)
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        pd.DataFrame(columns=INCIDENT_COLUMNS).to_csv(f, index=False)
+        for chunk in chunks:
+            to_excel_frame(chunk).to_csv(f, index=False, header=False)
+            on_chunk(len(chunk))
+
+def _json_frame(chunk: pd.DataFrame) -> pd.DataFrame:
+    # даты ISO, время "ЧЧ:ММ:СС"
+    out = to_excel_frame(chunk)
+    out["date"] = chunk["date"].dt.strftime("%Y-%m-%d")
+    out["resolved_at"] = chunk["resolved_at"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    return out
+
+def jsonl_text(chunk: pd.DataFrame) -> str:
+    """Записи → строки JSON Lines (даты ISO, время "ЧЧ:ММ:СС")."""
+    if chunk.empty:
+        return ""
+    text = _json_frame(chunk).to_json(orient="records", lines=True, force_ascii=False)
+    return text if text.endswith("\n") else text + "\n"
+
+def incident_records(chunk: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Записи → список словарей для JSON (как в jsonl_text)."""
+    if chunk.empty:
+        return []
+    return json.loads(_json_frame(chunk).to_json(orient="records", force_ascii=False))
+
+def _write_jsonl(path: Path, chunks, on_chunk):
+    with open(path, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write(jsonl_text(chunk))
+            on_chunk(len(chunk))
+
+def _write_xlsx(path: Path, chunks, on_chunk):
+    # write-only книга пишет строки в поток, не держа лист в памяти
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(INCIDENT_SHEET)
+    ws.append(INCIDENT_COLUMNS)
+    for chunk in chunks:
+        for row in _cells(chunk).itertuples(index=False, name=None):
+            ws.append(row)
+        on_chunk(len(chunk))
+    wb.save(path)
+
+_WRITERS = {"csv": _write_csv, "jsonl": _write_jsonl, "xlsx": _write_xlsx}
+
+def export_incidents(storage: StorageEngine, path: str, q: Optional[IncidentQuery] = None,
+                     progress: Optional[Callable[[int, int], None]] = None,
+                     chunk_rows: int = CHUNK_ROWS) -> int:
+    """Выгрузить записи реестра под фильтром q в файл (формат — по расширению).
+
+    Записи читаются из хранилища кусками по chunk_rows и сразу пишутся в файл,
+    так что память не растёт с размером реестра; книгу реестра выгрузка не
+    открывает. progress(выгружено, всего) вызывается после каждого куска.
+    Файл пишется рядом под временным именем и подменяется в конце —
+    прерванная выгрузка не оставляет недописанного файла.
+    Возвращает число выгруженных записей.
+    """
+    fmt = export_format(path)
+    total, chunks = storage.query_chunks(q or IncidentQuery(), chunk_rows)
+    done = 0
+
+    def on_chunk(n: int):
+        nonlocal done
+        done += n
+        if progress:
+            progress(done, total)
+
+    target = Path(path)
+    tmp = target.with_name(target.name + ".part")
+    try:
+        _WRITERS[fmt](tmp, chunks, on_chunk)
+        os.replace(tmp, target)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return done
@@ -0,0 +1,113 @@
+# locking.py
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, TypeVar
+
+if os.name == "nt":
+    import msvcrt
+    fcntl = None
+else:
+    import fcntl
+    msvcrt = None
+
+T = TypeVar("T")
+
+class StorageBusyError(RuntimeError):
+    """Файл реестра занят другим рабочим местом дольше допустимого."""
+
+class FileLock:
+    """Межпроцессная блокировка через файл-замок (flock / msvcrt.locking).
+
+    Повторный вход из того же потока разрешён; другие потоки процесса ждут
+    на обычной блокировке, другие процессы — на блокировке файла (с опросом
+    до timeout секунд, затем StorageBusyError).
+    """
+
+    def __init__(self, path: Path, timeout: float = 30.0, poll: float = 0.05):
+        self.path = Path(path)
+        self.timeout = timeout
+        self.poll = poll
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    def _try_lock(self, fd: int) -> bool:
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def _unlock(self, fd: int):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+    def acquire(self):
+        self._rlock.acquire()
+        if self._depth:
+            self._depth += 1
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o666)
+            deadline = time.monotonic() + self.timeout
+            while not self._try_lock(fd):
+                if time.monotonic() >= deadline:
+                    os.close(fd)
+                    raise StorageBusyError(
+                        f"Реестр занят другим рабочим местом более {self.timeout:.0f} с. Повторите попытку позже."
+                    )
+                time.sleep(self.poll)
+        except BaseException:
+            self._rlock.release()
+            raise
+        self._fd = fd
+        self._depth = 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            try:
+                self._unlock(self._fd)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+        self._rlock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+_LOCKS: Dict[str, FileLock] = {}
+_LOCKS_GUARD = threading.Lock()
+
+def shared_file_lock(path: Path, timeout: float = 30.0) -> FileLock:
+    """Одна блокировка на файл в пределах процесса (как и кэш реестра)."""
+    with _LOCKS_GUARD:
+        lock = _LOCKS.get(str(Path(path).resolve()))
+        if lock is None:
+            lock = _LOCKS[str(Path(path).resolve())] = FileLock(path, timeout)
+        lock.timeout = timeout
+        return lock
+
+def retry_io(fn: Callable[[], T], attempts: int = 6, delay: float = 0.2) -> T:
+    """Повторить файловую операцию при PermissionError (файл открыт в Excel/антивирусом)."""
+    for i in range(attempts):
+        try:
+            return fn()
+        except PermissionError:
+            if i == attempts - 1:
+                raise
+            time.sleep(delay * (2 ** i))
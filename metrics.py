@@ -0,0 +1,205 @@
+# metrics.py
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Optional, TypeVar
+
+RECENT = 256   # по скольким последним замерам считать медиану и 95-й процентиль
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+class _Series:
+    __slots__ = ("count", "total", "max", "last", "rows", "bytes", "errors", "recent")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.errors = 0
+        self.recent: Deque[float] = deque(maxlen=RECENT)
+
+class Timing:
+    """Замер внутри with METRICS.timer(...): rows и bytes можно задать по ходу."""
+    __slots__ = ("rows", "bytes")
+
+    def __init__(self, rows: Optional[int] = None):
+        self.rows = rows
+        self.bytes: Optional[int] = None
+
+class _Timer:
+    __slots__ = ("registry", "name", "timing", "t0")
+
+    def __init__(self, registry: "MetricsRegistry", name: str, rows: Optional[int]):
+        self.registry = registry
+        self.name = name
+        self.timing = Timing(rows)
+
+    def __enter__(self) -> Timing:
+        self.t0 = time.perf_counter()
+        return self.timing
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.name, time.perf_counter() - self.t0,
+                              rows=self.timing.rows, nbytes=self.timing.bytes, error=exc_type is not None)
+
+def _quantile(values, q: float) -> float:
+    s = sorted(values)
+    return s[min(len(s) - 1, int(q * len(s)))] if s else 0.0
+
+class MetricsRegistry:
+    """Замеры горячих путей в памяти процесса: время, строки и байты по операциям.
+
+    Операция — имя с точками ("storage.parse_xlsx", "telegram.sendMessage").
+    Запись — одна блокировка и несколько сложений, так что замеры можно
+    оставлять включёнными. Смотреть — окно «Диагностика», /metrics API,
+    cli.py metrics или файл из metrics.dump_path.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series: Dict[str, _Series] = {}
+        self.started = time.time()
+
+    def observe(self, name: str, seconds: float, rows: Optional[int] = None,
+                nbytes: Optional[int] = None, error: bool = False):
+        with self._lock:
+            s = self._series.get(name)
+            if s is None:
+                s = self._series[name] = _Series()
+            s.count += 1
+            s.total += seconds
+            s.last = seconds
+            if seconds > s.max:
+                s.max = seconds
+            s.recent.append(seconds)
+            if rows:
+                s.rows += int(rows)
+            if nbytes:
+                s.bytes += int(nbytes)
+            if error:
+                s.errors += 1
+
+    def timer(self, name: str, rows: Optional[int] = None) -> _Timer:
+        return _Timer(self, name, rows)
+
+    def timed(self, name: str, rows: Optional[Callable[[Any], int]] = None) -> Callable[[F], F]:
+        """Декоратор: каждый вызов функции — замер name; rows(результат) — число строк."""
+        def wrap(fn: F) -> F:
+            @functools.wraps(fn)
+            def inner(*args, **kwargs):
+                with self.timer(name) as t:
+                    result = fn(*args, **kwargs)
+                    if rows is not None:
+                        t.rows = rows(result)
+                    return result
+            return inner  # type: ignore[return-value]
+        return wrap
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self.started = time.time()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """операция → {"count", "total_s", "avg_ms", "p50_ms", "p95_ms", "max_ms", "last_ms", "rows", "bytes", "errors"}."""
+        with self._lock:
+            items = [(name, s, list(s.recent)) for name, s in sorted(self._series.items())]
+        return {
+            name: {
+                "count": s.count,
+                "total_s": round(s.total, 6),
+                "avg_ms": round(s.total / s.count * 1000, 3) if s.count else 0.0,
+                "p50_ms": round(_quantile(recent, 0.5) * 1000, 3),
+                "p95_ms": round(_quantile(recent, 0.95) * 1000, 3),
+                "max_ms": round(s.max * 1000, 3),
+                "last_ms": round(s.last * 1000, 3),
+                "rows": s.rows,
+                "bytes": s.bytes,
+                "errors": s.errors,
+            }
+            for name, s, recent in items
+        }
+
+    # ---- Выгрузка ----
+    def to_json(self) -> str:
+        return json.dumps({"started": self.started, "taken": time.time(), "operations": self.snapshot()},
+                          ensure_ascii=False, indent=1)
+
+    def to_prometheus(self) -> str:
+        """Текстовый формат Prometheus (для node_exporter textfile или /metrics)."""
+        snap = self.snapshot()
+        lines = [
+            "# HELP incidents_operation_seconds Время операций реестра.",
+            "# TYPE incidents_operation_seconds summary",
+        ]
+        for name, m in snap.items():
+            op = name.replace("\\", "\\\\").replace('"', '\\"')
+            lines += [
+                f'incidents_operation_seconds{{op="{op}",quantile="0.5"}} {m["p50_ms"] / 1000:.6f}',
+                f'incidents_operation_seconds{{op="{op}",quantile="0.95"}} {m["p95_ms"] / 1000:.6f}',
+                f'incidents_operation_seconds_sum{{op="{op}"}} {m["total_s"]:.6f}',
+                f'incidents_operation_seconds_count{{op="{op}"}} {m["count"]}',
+            ]
+        for metric, field, help_text in (
+            ("incidents_operation_seconds_max", "max_ms", "Наибольшее время операции."),
+            ("incidents_operation_rows_total", "rows", "Обработано строк."),
+            ("incidents_operation_bytes_total", "bytes", "Записано байт."),
+            ("incidents_operation_errors_total", "errors", "Операций с ошибкой."),
+        ):
+            kind = "gauge" if field == "max_ms" else "counter"
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+            for name, m in snap.items():
+                op = name.replace("\\", "\\\\").replace('"', '\\"')
+                value = m[field] / 1000 if field == "max_ms" else m[field]
+                lines.append(f'{metric}{{op="{op}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        """Записать замеры в файл: .prom — формат Prometheus, иначе JSON."""
+        p = Path(path)
+        text = self.to_prometheus() if p.suffix == ".prom" else self.to_json()
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_name(p.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, p)
+
+class MetricsDumper:
+    """Фоновая запись замеров в файл раз в every секунд и при остановке."""
+
+    def __init__(self, registry: MetricsRegistry, path: str, every: float = 60.0):
+        self.registry = registry
+        self.path = path
+        self.every = every
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self):
+        while not self._stop.wait(self.every):
+            try:
+                self.registry.dump(self.path)
+            except OSError:
+                pass
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="metrics-dump", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5.0)
+        try:
+            self.registry.dump(self.path)
+        except OSError:
+            pass
+
+# Общий реестр процесса
+METRICS = MetricsRegistry()
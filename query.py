@@ -0,0 +1,206 @@
+# query.py
+from typing import Any, Dict, List, NamedTuple, Optional, Set
+import numpy as np
+import pandas as pd
+
+# Поля с поиском по точному значению (хеш-индекс значение → позиции строк)
+EQUALITY_FIELDS = ("status", "location", "address", "type", "duty")
+
+_NAT_KEY = np.iinfo(np.int64).max   # строки без даты — в конце сортированного индекса
+
+class IncidentQuery(NamedTuple):
+    """Фильтр реестра. None или "" — без ограничения; даты включительно,
+    text — подстрока описания без учёта регистра. archive — запрос без дат
+    читает и весь архив (иначе только рабочий реестр)."""
+    date_from: Optional[pd.Timestamp] = None
+    date_to: Optional[pd.Timestamp] = None
+    status: Optional[str] = None
+    location: Optional[str] = None
+    address: Optional[str] = None
+    type: Optional[str] = None
+    duty: Optional[str] = None
+    text: Optional[str] = None
+    archive: bool = False
+
+    def is_empty(self) -> bool:
+        # archive выбирает источники, а не строки — фильтром не считается
+        return not any(v is not None and v != "" for v in self[:-1])
+
+    def matches(self, row: Dict[str, Any]) -> bool:
+        """Проверка одной строки (для точечных обновлений списка)."""
+        d = row.get("date")
+        if self.date_from is not None and (d is None or pd.isna(d) or d < self.date_from):
+            return False
+        if self.date_to is not None and (d is None or pd.isna(d) or d > self.date_to):
+            return False
+        for f in EQUALITY_FIELDS:
+            v = getattr(self, f)
+            if v and _value(row.get(f)) != v:
+                return False
+        if self.text:
+            return self.text.casefold() in _value(row.get("description")).casefold()
+        return True
+
+def _value(v: Any) -> str:
+    return "" if v is None or (not isinstance(v, str) and pd.isna(v)) else str(v)
+
+def _date_key(v: Any) -> int:
+    return _NAT_KEY if v is None or pd.isna(v) else pd.Timestamp(v).normalize().value
+
+def _date_keys(s: pd.Series) -> np.ndarray:
+    keys = s.to_numpy(dtype="datetime64[ns]").view("i8").copy()
+    keys[s.isna().to_numpy()] = _NAT_KEY
+    return keys
+
+class IncidentIndex:
+    """Вторичные индексы по позициям строк в DataFrame кэша.
+
+    Дата — отсортированный массив ключей с позициями (диапазон = два
+    searchsorted), поля EQUALITY_FIELDS — словари значение → множество
+    позиций. Запрос берёт самый узкий индекс, остальные условия проверяются
+    только на его кандидатах. Индекс обновляется на каждой записи вместе
+    с кэшем; новые строки дописываются в конец DataFrame.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self._by: Dict[str, Dict[str, Set[int]]] = {f: {} for f in EQUALITY_FIELDS}
+        self._pos_of_id: Dict[int, int] = {}
+        self._date_keys = np.empty(0, dtype=np.int64)
+        self._date_pos = np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "IncidentIndex":
+        ix = cls()
+        ix.n = len(df)
+        for f in EQUALITY_FIELDS:
+            values = df[f].astype(object).where(df[f].notna(), "").astype(str)
+            codes, uniques = pd.factorize(values)
+            order = np.argsort(codes, kind="stable")
+            bounds = np.cumsum(np.bincount(codes, minlength=len(uniques)))
+            start = 0
+            for value, end in zip(uniques, bounds):
+                ix._by[f][value] = set(order[start:end].tolist())
+                start = end
+        ids = df["id"]
+        valid = ids.notna().to_numpy()
+        ix._pos_of_id = dict(zip(ids[valid].astype(int).tolist(), np.flatnonzero(valid).tolist()))
+        keys = _date_keys(df["date"])
+        order = np.argsort(keys, kind="stable")
+        ix._date_keys = keys[order]
+        ix._date_pos = order.astype(np.int64)
+        return ix
+
+    # ---- Синхронизация с записью ----
+    def apply(self, old_row: Optional[Dict[str, Any]], new_row: Optional[Dict[str, Any]]) -> bool:
+        """Учесть вставку (old_row=None) или правку строки. False — индекс надо перестроить."""
+        if old_row is None:
+            if new_row is None:
+                return True
+            pos = self.n
+            self.n += 1
+        else:
+            pos = self._pos_of_id.get(int(old_row["id"])) if old_row.get("id") is not None else None
+            if pos is None:
+                return False
+            self._remove(pos, old_row)
+        if new_row is not None:
+            self._add(pos, new_row)
+        return True
+
+    def _add(self, pos: int, row: Dict[str, Any]):
+        for f in EQUALITY_FIELDS:
+            self._by[f].setdefault(_value(row.get(f)), set()).add(pos)
+        rid = row.get("id")
+        if rid is not None and not pd.isna(rid):
+            self._pos_of_id[int(rid)] = pos
+        key = _date_key(row.get("date"))
+        i = int(np.searchsorted(self._date_keys, key, side="right"))
+        self._date_keys = np.insert(self._date_keys, i, key)
+        self._date_pos = np.insert(self._date_pos, i, pos)
+
+    def _remove(self, pos: int, row: Dict[str, Any]):
+        for f in EQUALITY_FIELDS:
+            bucket = self._by[f].get(_value(row.get(f)))
+            if bucket is not None:
+                bucket.discard(pos)
+                if not bucket:
+                    del self._by[f][_value(row.get(f))]
+        key = _date_key(row.get("date"))
+        lo = int(np.searchsorted(self._date_keys, key, side="left"))
+        hi = int(np.searchsorted(self._date_keys, key, side="right"))
+        hit = np.flatnonzero(self._date_pos[lo:hi] == pos)
+        if len(hit):
+            i = lo + int(hit[0])
+            self._date_keys = np.delete(self._date_keys, i)
+            self._date_pos = np.delete(self._date_pos, i)
+
+    # ---- Запросы ----
+    def values(self, field: str) -> List[str]:
+        """Встречающиеся значения поля (для выпадающих списков фильтра)."""
+        return sorted(v for v, s in self._by[field].items() if s and v != "")
+
+    def _date_range(self, q: IncidentQuery) -> np.ndarray:
+        lo = 0 if q.date_from is None else np.searchsorted(self._date_keys, _date_key(q.date_from), side="left")
+        if q.date_to is None:
+            hi = np.searchsorted(self._date_keys, _NAT_KEY, side="left")
+        else:
+            hi = np.searchsorted(self._date_keys, _date_key(q.date_to), side="right")
+        return self._date_pos[lo:hi]
+
+    def positions(self, df: pd.DataFrame, q: IncidentQuery) -> np.ndarray:
+        """Позиции строк df, подходящих под запрос, по возрастанию."""
+        candidates: List[tuple] = []   # (размер, поле, кандидаты)
+        if q.date_from is not None or q.date_to is not None:
+            r = self._date_range(q)
+            candidates.append((len(r), "date", r))
+        for f in EQUALITY_FIELDS:
+            v = getattr(q, f)
+            if v:
+                s = self._by[f].get(v, ())
+                candidates.append((len(s), f, s))
+        candidates.sort(key=lambda c: c[0])
+        if not candidates or candidates[0][0] > self.n // 8:
+            # индекс почти ничего не отсекает — дешевле проверить колонки целиком
+            pos = np.arange(self.n, dtype=np.int64)
+            rest = candidates
+        else:
+            _, _, best = candidates[0]
+            pos = best if isinstance(best, np.ndarray) else np.fromiter(best, dtype=np.int64, count=len(best))
+            rest = candidates[1:]
+        # остальные условия — только по кандидатам самого узкого индекса
+        return np.sort(_filter(df, pos, q, [f for _, f, _ in rest]))
+
+def scan_positions(df: pd.DataFrame, q: IncidentQuery) -> np.ndarray:
+    """Позиции строк под запрос полным просмотром колонок (для фреймов без индекса)."""
+    fields = [f for f in EQUALITY_FIELDS if getattr(q, f)]
+    if q.date_from is not None or q.date_to is not None:
+        fields.append("date")
+    return _filter(df, np.arange(len(df), dtype=np.int64), q, fields)
+
+def _filter(df: pd.DataFrame, pos: np.ndarray, q: IncidentQuery, fields: List[str]) -> np.ndarray:
+    for f in fields:
+        if not len(pos):
+            break
+        if f == "date":
+            keys = _date_keys(df["date"].iloc[pos])
+            ok = np.ones(len(pos), dtype=bool)
+            if q.date_from is not None:
+                ok &= keys >= _date_key(q.date_from)
+            if q.date_to is not None:
+                ok &= keys <= _date_key(q.date_to)
+            pos = pos[ok]
+        else:
+            pos = pos[_column_equals(df[f], pos, getattr(q, f))]
+    if q.text and len(pos):
+        desc = pd.Series(df["description"].to_numpy(dtype=object)[pos])
+        pos = pos[desc.str.contains(q.text, case=False, regex=False, na=False).to_numpy()]
+    return pos
+
+def _column_equals(col: pd.Series, pos: np.ndarray, value: str) -> np.ndarray:
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        cats = col.cat.categories
+        if value not in cats:
+            return np.zeros(len(pos), dtype=bool)
+        return col.cat.codes.to_numpy()[pos] == cats.get_loc(value)
+    return col.to_numpy(dtype=object)[pos] == value
@@ -1,33 +1,363 @@
 # report_generator.py
+import html
+import io
+import string
 from datetime import date
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 import pandas as pd
+from metrics import METRICS
+from rollup import DailyRollup
+from storage import CLOSED_STATUS, fmt_date, fmt_time, format_times, to_excel_frame
+from telegram_client import TEXT_LIMIT
+
+def _safe_cut(line: str, limit: int, parse_mode: Optional[str]) -> int:
+    """Место разреза строки не дальше limit, где разметка parse_mode закрыта.
+
+    Не режем посреди экранирования «\\x» (MarkdownV2), тега или сущности
+    «&…;» (HTML) и внутри незакрытого выделения — иначе Telegram отклонит
+    часть целиком. Без разметки или без такого места — ровно по limit.
+    """
+    if parse_mode not in ("MarkdownV2", "HTML"):
+        return limit
+    best = 0
+    i = 0
+    if parse_mode == "MarkdownV2":
+        open_marks: List[str] = []
+        while i < limit:
+            c = line[i]
+            if c == "\\":
+                i += 2
+            else:
+                if c == "`" or (c in "*_~" and (not open_marks or open_marks[-1] != "`")):
+                    if open_marks and open_marks[-1] == c:
+                        open_marks.pop()
+                    else:
+                        open_marks.append(c)
+                i += 1
+            if i <= limit and not open_marks:
+                best = i
+    else:
+        depth = 0
+        while i < limit:
+            c = line[i]
+            if c == "<":
+                end = line.find(">", i)
+                if end < 0 or end + 1 > limit:
+                    break
+                depth += -1 if line.startswith("</", i) else 1
+                i = end + 1
+            elif c == "&":
+                end = line.find(";", i)
+                i = end + 1 if 0 <= end < limit else limit + 1
+            else:
+                i += 1
+            if i <= limit and depth == 0:
+                best = i
+    return best or limit
+
+def chunk_lines(lines: Iterable[str], limit: int = TEXT_LIMIT, parse_mode: Optional[str] = None) -> Iterator[str]:
+    """Собрать строки в сообщения не длиннее limit, разрывая только между строками.
+
+    Строка длиннее limit (огромное описание) режется на куски до limit
+    символов там, где разметка parse_mode не разорвётся (_safe_cut).
+    """
+    buf: List[str] = []
+    size = 0
+    for line in lines:
+        while len(line) > limit:
+            if buf:
+                yield "\n".join(buf)
+                buf, size = [], 0
+            cut = _safe_cut(line, limit, parse_mode)
+            yield line[:cut]
+            line = line[cut:]
+        extra = len(line) + (1 if buf else 0)
+        if buf and size + extra > limit:
+            yield "\n".join(buf)
+            buf, size = [], 0
+            extra = len(line)
+        buf.append(line)
+        size += extra
+    if buf:
+        yield "\n".join(buf)
+
+# MarkdownV2: все служебные символы экранируются обратной косой чертой
+_MARKDOWN_ESCAPES = str.maketrans({c: "\\" + c for c in "_*[]()~`>#+-=|{}.!\\"})
+
+def _escape_markdown(s: pd.Series) -> pd.Series:
+    return s.str.translate(_MARKDOWN_ESCAPES)
+
+def _escape_html(s: pd.Series) -> pd.Series:
+    return s.map(html.escape, na_action="ignore")
+
+class ReportTemplate(NamedTuple):
+    """Оформление доклада. Поля строки: time, type, location, address, duty,
+    status (уже обёрнутый в status_fmt или пустой), description; в заголовке — date.
+
+    Каждая строка доклада — самостоятельный фрагмент разметки, поэтому доклад
+    можно резать между строками.
+    """
+    title: str
+    empty: str
+    line: str
+    status_fmt: str
+    escape: Optional[Callable[[pd.Series], pd.Series]] = None
+    parse_mode: Optional[str] = None   # для Telegram Bot API
+    heading: str = "{text}"            # заголовок раздела сводного доклада
+
+TEMPLATES: Dict[str, ReportTemplate] = {
+    "plain": ReportTemplate(
+        title="Суточный отчёт за {date}",
+        empty="Инцидентов не зарегистрировано.",
+        line="- {time} | {type} | {location} / {address} | {duty}{status} | {description}",
+        status_fmt=" [{status}]",
+    ),
+    "markdown": ReportTemplate(
+        title="*Суточный отчёт за {date}*",
+        empty="Инцидентов не зарегистрировано\\.",
+        line="• `{time}` \\| *{type}* \\| {location} / {address} \\| {duty}{status} \\| {description}",
+        status_fmt=" \\[{status}\\]",
+        escape=_escape_markdown,
+        parse_mode="MarkdownV2",
+        heading="*{text}*",
+    ),
+    "html": ReportTemplate(
+        title="<b>Суточный отчёт за {date}</b>",
+        empty="Инцидентов не зарегистрировано.",
+        line="• <code>{time}</code> | <b>{type}</b> | {location} / {address} | {duty}{status} | {description}",
+        status_fmt=" [<i>{status}</i>]",
+        escape=_escape_html,
+        parse_mode="HTML",
+        heading="<b>{text}</b>",
+    ),
+}
+
+def _text(s: pd.Series) -> pd.Series:
+    # категории/текст → строки без NaN
+    return s.astype(object).where(s.notna(), "").astype(str)
+
+def _escape_values(s: pd.Series, escape) -> pd.Series:
+    # экранируем только различные значения: локации, типы, дежурные повторяются
+    codes, uniques = pd.factorize(s)
+    escaped = escape(pd.Series(uniques, dtype=object)).to_numpy(dtype=object)
+    return pd.Series(escaped[codes], index=s.index)
+
+def render_columns(fmt: str, cols: Dict[str, pd.Series]) -> pd.Series:
+    """Подставить колонки в шаблон строки целиком, без цикла по записям."""
+    index = next(iter(cols.values())).index
+    out = pd.Series("", index=index, dtype=object)
+    for literal, field, _, _ in string.Formatter().parse(fmt):
+        if literal:
+            out = out + literal
+        if field is not None:
+            out = out + cols[field]
+    return out
+
+class PeriodStats(NamedTuple):
+    """Сводка за период; длительности закрытия — в часах."""
+    start: date
+    end: date
+    total: int
+    open: int
+    closed: int
+    by_type: pd.DataFrame        # count, closed, mean_h, p50_h, p90_h
+    by_location: pd.Series
+    by_duty: pd.Series
+    resolve_hours: pd.Series     # по закрытым инцидентам с корректным resolved_at
+
+def _fmt_hours(h: float) -> str:
+    if h is None or pd.isna(h):
+        return "-"
+    minutes = int(round(h * 60))
+    return f"{minutes // 60} ч {minutes % 60:02d} мин"
+
+def incident_message(rec: Dict[str, Any]) -> str:
+    """Уведомление о новом инциденте (простой текст)."""
+    return (
+        "ИНЦИДЕНТ\n"
+        f"Дата: {fmt_date(rec.get('date'))}\n"
+        f"Время: {fmt_time(rec.get('time'))}\n"
+        f"Локация: {rec.get('location', '')}\n"
+        f"Адрес: {rec.get('address', '')}\n"
+        f"Дежурный: {rec.get('duty', '')}\n"
+        f"Тип: {rec.get('type', '')}\n"
+        f"Описание: {rec.get('description', '')}"
+    )
 
 class ReportGenerator:
     def __init__(self, cfg):
         self.cfg = cfg
+        rep = cfg.get("report", {})
+        self.template = self.get_template(rep.get("template", "plain"))
+        # больше стольких сообщений не шлём: остальное — файлом
+        self.max_chunks = int(rep.get("max_chunks", 3))
+        self.attach_format = (rep.get("attach_format") or "").lower()
+
+    @staticmethod
+    def get_template(name: str) -> ReportTemplate:
+        try:
+            return TEMPLATES[name]
+        except KeyError:
+            raise ValueError(f"Неизвестный шаблон доклада: {name}. Доступны: {', '.join(TEMPLATES)}")
+
+    def daily_incidents(self, df: pd.DataFrame, day: Optional[date] = None) -> pd.DataFrame:
+        day = day or date.today()
+        if df is None or df.empty or "date" not in df.columns:
+            return df
+        return df[df["date"] == pd.Timestamp(day)]
 
-    def build_daily_report(self, df: pd.DataFrame) -> str:
-        today = date.today()
-        title = f"Суточный отчёт за {today.strftime('%d.%m.%Y')}"
+    def render_lines(self, df: pd.DataFrame, title: str, template: Optional[ReportTemplate] = None) -> List[str]:
+        """Заголовок и строки доклада по инцидентам df (все колонки форматируются разом)."""
+        tpl = template or self.template
+        esc = (lambda s: _escape_values(s, tpl.escape)) if tpl.escape else (lambda s: s)
+        head = tpl.title.format(date=esc(pd.Series([title])).iloc[0])
         if df is None or df.empty:
-            return f"{title}\nИнцидентов не зарегистрировано."
+            return [head, tpl.empty]
+        cols = {c: esc(_text(df[c])) for c in ("type", "location", "address", "duty", "description")}
+        cols["time"] = esc(format_times(df["time"]).replace("", "-"))
+        status = _text(df["status"])
+        cols["status"] = render_columns(tpl.status_fmt, {"status": esc(status)}).where(status != "", "")
+        return [head] + render_columns(tpl.line, cols).tolist()
 
-        if "date" in df.columns:
-            day_df = df[df["date"] == today]
+    def daily_report_lines(self, df: pd.DataFrame, template: Optional[ReportTemplate] = None,
+                           day: Optional[date] = None) -> List[str]:
+        day = day or date.today()
+        return self.render_lines(self.daily_incidents(df, day), day.strftime("%d.%m.%Y"), template)
+
+    @METRICS.timed("report.daily")
+    def build_daily_report(self, df: pd.DataFrame, template: Optional[ReportTemplate] = None,
+                           day: Optional[date] = None) -> str:
+        return "\n".join(self.daily_report_lines(df, template, day))
+
+    @METRICS.timed("report.daily_messages")
+    def build_daily_messages(self, df: pd.DataFrame,
+                             day: Optional[date] = None) -> Tuple[List[str], Optional[Tuple[str, bytes, str]]]:
+        """Доклад для Telegram: части по TEXT_LIMIT и, если частей слишком много, файл.
+
+        Возвращает (сообщения, вложение); вложение — (имя файла, содержимое, подпись) или None.
+        Число запросов ограничено: при вложении отправляется только первая часть.
+        Разметка частей — self.template.parse_mode.
+        """
+        day = day or date.today()
+        chunks = list(chunk_lines(self.daily_report_lines(df, day=day), parse_mode=self.template.parse_mode))
+        if not self.attach_format or len(chunks) <= self.max_chunks:
+            return chunks, None
+        day_df = self.daily_incidents(df, day)
+        name = f"report_{day.strftime('%Y-%m-%d')}"
+        caption = f"Полный доклад: {len(day_df)} инцидентов (в тексте — {len(chunks)} сообщений)."
+        return chunks[:1], (*self.export_incidents(day_df, name), caption)
+
+    def export_incidents(self, df: pd.DataFrame, name: str) -> Tuple[str, bytes]:
+        """Инциденты → (имя файла, содержимое) в формате attach_format (csv | xlsx)."""
+        out = to_excel_frame(df)
+        if self.attach_format == "xlsx":
+            buf = io.BytesIO()
+            out.to_excel(buf, index=False, engine="openpyxl")
+            return f"{name}.xlsx", buf.getvalue()
+        # BOM, чтобы Excel открыл кириллицу без мастера импорта
+        return f"{name}.csv", out.to_csv(index=False).encode("utf-8-sig")
+
+    # ---- Сводные доклады за период ----
+    @METRICS.timed("report.period_stats")
+    def period_stats(self, df: pd.DataFrame, start: date, end: date,
+                     rollup: Optional[DailyRollup] = None) -> PeriodStats:
+        """Статистика за [start, end] включительно; всё считается groupby по колонкам.
+
+        Со сводкой по дням (rollup) счётчики берутся из неё, а записи df нужны
+        только для времени закрытия — достаточно передать записи периода.
+        """
+        if start > end:
+            raise ValueError("Начало периода позже конца.")
+        mask = df["date"].between(pd.Timestamp(start), pd.Timestamp(end))
+        part = df[mask]
+        closed = (part["status"] == CLOSED_STATUS).to_numpy()
+
+        # время закрытия: resolved_at − (date + time); отрицательные (ошибки ввода) не учитываем
+        opened = part["date"] + part["time"].fillna(pd.Timedelta(0))
+        hours = (part["resolved_at"] - opened).dt.total_seconds() / 3600.0
+        hours = hours[closed & (hours >= 0).to_numpy()]
+
+        def counts(col: str) -> pd.Series:
+            if rollup is not None:
+                return rollup.counts(col, start, end)
+            c = _text(part[col]).value_counts()
+            return c[c > 0]
+
+        # строковые значения, чтобы счётчики из сводки совпадали по индексу с groupby
+        types = _text(part["type"])
+        g = hours.groupby(types[hours.index], observed=True)
+        by_type = pd.DataFrame({
+            "count": counts("type"),
+            "closed": pd.Series(closed, index=part.index).groupby(types, observed=True).sum(),
+            "mean_h": g.mean(),
+            "p50_h": g.median(),
+            "p90_h": g.quantile(0.9),
+        })
+        by_type = by_type[by_type["count"] > 0].sort_values("count", ascending=False, kind="stable")
+        by_type[["count", "closed"]] = by_type[["count", "closed"]].fillna(0).astype(int)
+
+        if rollup is not None:
+            total = rollup.total(start, end)
+            n_closed = int(rollup.counts("status", start, end).get(CLOSED_STATUS, 0))
         else:
-            day_df = df
+            total, n_closed = len(part), int(closed.sum())
+        return PeriodStats(
+            start=start, end=end, total=total, open=total - n_closed, closed=n_closed,
+            by_type=by_type, by_location=counts("location"), by_duty=counts("duty"),
+            resolve_hours=hours,
+        )
+
+    @METRICS.timed("report.period_render")
+    def render_period(self, st: PeriodStats, template: Optional[ReportTemplate] = None) -> List[str]:
+        """Строки сводного доклада (каждая — законченный фрагмент разметки)."""
+        tpl = template or self.template
+
+        def plain(lines: pd.Series) -> List[str]:
+            # строки разделов — простой текст: экранируем целиком, разметка только в заголовках
+            lines = lines.astype(object)
+            return (_escape_values(lines, tpl.escape) if tpl.escape else lines).tolist()
+
+        def counts(c: pd.Series, detail: Optional[pd.Series] = None) -> List[str]:
+            names = _text(pd.Series(c.index, dtype=object))
+            names = names.where(names != "", "(не указано)")
+            text = "- " + names + ": " + c.astype(str).to_numpy()
+            if detail is not None:
+                text = text + detail.to_numpy()
+            return plain(text)
 
-        lines = [title]
-        if day_df.empty:
-            lines.append("Инцидентов не зарегистрировано.")
+        def head(title: str) -> str:
+            return tpl.heading.format(text=plain(pd.Series([title]))[0])
+
+        period = f"{st.start.strftime('%d.%m.%Y')} — {st.end.strftime('%d.%m.%Y')}"
+        summary = []
+        if st.total == 0:
+            summary.append("Инцидентов не зарегистрировано.")
         else:
-            for _, row in day_df.iterrows():
-                t = row.get("time")
-                t_str = t.strftime("%H:%M") if pd.notna(t) and t else "-"
-                duty = row.get("duty","")
-                loc = row.get("location","")
-                addr = row.get("address","")
-                status = row.get("status","")
-                extra = f" [{status}]" if status else ""
-                lines.append(f"- {t_str} | {row.get('type','?')} | {loc} / {addr} | {duty}{extra} | {row.get('description','')}")
-        return "\n".join(lines)
+            share = st.closed / st.total * 100
+            summary.append(f"Всего: {st.total}; закрыто: {st.closed} ({share:.0f}%), открыто: {st.open}")
+            h = st.resolve_hours
+            if len(h):
+                summary.append(f"Время закрытия: среднее {_fmt_hours(h.mean())}, "
+                               f"медиана {_fmt_hours(h.median())}, 90% — {_fmt_hours(h.quantile(0.9))}")
+        lines = [head(f"Сводка за период {period}")] + plain(pd.Series(summary, dtype=object))
+        if st.total == 0:
+            return lines
+
+        bt = st.by_type
+        detail = (" (закрыто " + bt["closed"].astype(str) + ", среднее " + bt["mean_h"].map(_fmt_hours)
+                  + ", 90% — " + bt["p90_h"].map(_fmt_hours) + ")")
+        for title, rows in (("По типам", counts(bt["count"], detail)),
+                            ("По локациям", counts(st.by_location)),
+                            ("По дежурным", counts(st.by_duty))):
+            lines.append(head(title))
+            lines += rows
+        return lines
+
+    def build_period_report(self, df: pd.DataFrame, start: date, end: date,
+                            template: Optional[ReportTemplate] = None,
+                            rollup: Optional[DailyRollup] = None) -> str:
+        return "\n".join(self.render_period(self.period_stats(df, start, end, rollup), template))
+
+    def period_messages(self, st: PeriodStats) -> List[str]:
+        """Сводка для Telegram частями по TEXT_LIMIT (разметка — self.template.parse_mode)."""
+        return list(chunk_lines(self.render_period(st), parse_mode=self.template.parse_mode))
@@ -0,0 +1,153 @@
+# rollup.py
+from collections import Counter
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple, Union
+import pandas as pd
+
+DateLike = Union[date, pd.Timestamp]
+
+class _Day:
+    __slots__ = ("total", "min_id", "max_id", "counts")
+
+    def __init__(self):
+        self.total = 0
+        self.min_id: Optional[int] = None
+        self.max_id: Optional[int] = None
+        self.counts: Dict[str, Counter] = {dim: Counter() for dim in DailyRollup.DIMENSIONS}
+
+def _value(v: Any) -> str:
+    return "" if v is None or (not isinstance(v, str) and pd.isna(v)) else str(v)
+
+def _day_key(v: Any) -> Optional[pd.Timestamp]:
+    if v is None or pd.isna(v):
+        return None
+    return pd.Timestamp(v).normalize()
+
+class DailyRollup:
+    """Сводка реестра по дням: число записей, счётчики по статусу/типу/локации/дежурному
+    и границы id записей дня.
+
+    Строится один раз по реестру (groupby), дальше обновляется на каждой
+    вставке/правке за O(1). Отчёты за период читают только дни периода.
+    Границы id — охватывающие: после переноса записи на другой день старый
+    день их не сужает.
+    """
+
+    DIMENSIONS = ("status", "type", "location", "duty")
+
+    def __init__(self):
+        self._days: Dict[pd.Timestamp, _Day] = {}
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "DailyRollup":
+        r = cls()
+        d = df[df["date"].notna()]
+        if d.empty:
+            return r
+        g = d.groupby("date")
+        stats = pd.DataFrame({"total": g.size(), "min_id": g["id"].min(), "max_id": g["id"].max()})
+        for day, total, lo, hi in stats.itertuples(name=None):
+            e = r._days[day] = _Day()
+            e.total = int(total)
+            e.min_id = None if pd.isna(lo) else int(lo)
+            e.max_id = None if pd.isna(hi) else int(hi)
+        for dim in cls.DIMENSIONS:
+            values = d[dim].astype(object).where(d[dim].notna(), "").astype(str)
+            sizes = values.groupby([d["date"], values]).size()
+            for (day, value), n in sizes.items():
+                r._days[day].counts[dim][value] = int(n)
+        return r
+
+    # ---- Инкрементальное обновление ----
+    def add(self, row: Dict[str, Any]):
+        day = _day_key(row.get("date"))
+        if day is None:
+            return
+        e = self._days.get(day)
+        if e is None:
+            e = self._days[day] = _Day()
+        e.total += 1
+        rid = row.get("id")
+        if rid is not None and not pd.isna(rid):
+            rid = int(rid)
+            e.min_id = rid if e.min_id is None else min(e.min_id, rid)
+            e.max_id = rid if e.max_id is None else max(e.max_id, rid)
+        for dim in self.DIMENSIONS:
+            e.counts[dim][_value(row.get(dim))] += 1
+
+    def remove(self, row: Dict[str, Any]):
+        day = _day_key(row.get("date"))
+        e = self._days.get(day) if day is not None else None
+        if e is None:
+            return
+        e.total -= 1
+        if e.total <= 0:
+            del self._days[day]
+            return
+        for dim in self.DIMENSIONS:
+            c = e.counts[dim]
+            v = _value(row.get(dim))
+            c[v] -= 1
+            if c[v] <= 0:
+                del c[v]
+
+    def apply(self, old_row: Optional[Dict[str, Any]], new_row: Optional[Dict[str, Any]]):
+        """Учесть изменение строки: old_row → new_row (None — строки не было/нет)."""
+        if old_row is not None:
+            self.remove(old_row)
+        if new_row is not None:
+            self.add(new_row)
+
+    def merge(self, other: "DailyRollup"):
+        """Добавить дни другой сводки (записи сводок не пересекаются, например архив и реестр)."""
+        for d, o in other._days.items():
+            e = self._days.get(d)
+            if e is None:
+                e = self._days[d] = _Day()
+                e.min_id, e.max_id = o.min_id, o.max_id
+            elif e.min_id is None or o.min_id is None:
+                # у одной из частей id неизвестны — границы дня тоже
+                e.min_id = e.max_id = None
+            else:
+                e.min_id, e.max_id = min(e.min_id, o.min_id), max(e.max_id, o.max_id)
+            e.total += o.total
+            for dim, cnt in o.counts.items():
+                e.counts[dim].update(cnt)
+
+    # ---- Запросы ----
+    def slice(self, start: DateLike, end: DateLike) -> "DailyRollup":
+        """Независимая копия дней периода (для чтения вне блокировки хранилища)."""
+        r = DailyRollup()
+        for d, e in self._range(start, end):
+            c = r._days[d] = _Day()
+            c.total, c.min_id, c.max_id = e.total, e.min_id, e.max_id
+            c.counts = {dim: Counter(cnt) for dim, cnt in e.counts.items()}
+        return r
+
+    def _range(self, start: DateLike, end: DateLike) -> List[Tuple[pd.Timestamp, _Day]]:
+        lo, hi = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+        return sorted((d, e) for d, e in self._days.items() if lo <= d <= hi)
+
+    def days(self, start: DateLike, end: DateLike) -> pd.DataFrame:
+        """По дню на строку: total, min_id, max_id."""
+        rows = [(d, e.total, e.min_id, e.max_id) for d, e in self._range(start, end)]
+        df = pd.DataFrame(rows, columns=["date", "total", "min_id", "max_id"])
+        return df.set_index("date")
+
+    def total(self, start: DateLike, end: DateLike) -> int:
+        return sum(e.total for _, e in self._range(start, end))
+
+    def counts(self, dim: str, start: DateLike, end: DateLike) -> pd.Series:
+        """Число записей за период по значениям dim (по убыванию)."""
+        acc: Counter = Counter()
+        for _, e in self._range(start, end):
+            acc.update(e.counts[dim])
+        s = pd.Series(dict(acc), dtype="int64")
+        return s.sort_values(ascending=False, kind="stable")
+
+    def id_bounds(self, start: DateLike, end: DateLike) -> Optional[Tuple[int, int]]:
+        """Наименьший и наибольший id записей периода (None — записей нет или id неизвестны)."""
+        ids = [(e.min_id, e.max_id) for _, e in self._range(start, end)]
+        if not ids or any(lo is None for lo, _ in ids):
+            return None
+        return min(lo for lo, _ in ids), max(hi for _, hi in ids)
@@ -0,0 +1,166 @@
+# scheduler.py
+import json
+import os
+import threading
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from locking import StorageBusyError, retry_io, shared_file_lock
+
+CHECK_INTERVAL = 20.0            # как часто (с) проверять расписание
+WARM_AHEAD = timedelta(minutes=5)  # за сколько до отправки подгрузить данные дня
+KEEP_DAYS = 14                   # сколько дней хранить отметки об отправке
+
+class ReportSlot(NamedTuple):
+    at: time
+    yesterday: bool   # доклад за прошедшие сутки (утренняя пересменка)
+
+def parse_slots(items: List[Any]) -> List[ReportSlot]:
+    """Расписание из настроек: "ЧЧ:ММ" или {"time": "ЧЧ:ММ", "day": "today" | "yesterday"}."""
+    slots = []
+    for item in items or []:
+        if isinstance(item, dict):
+            at, day = str(item.get("time", "")), str(item.get("day", "today"))
+        else:
+            at, day = str(item), "today"
+        try:
+            t = datetime.strptime(at.strip(), "%H:%M").time()
+        except ValueError:
+            raise ValueError(f"schedule.daily_report: неверное время «{at}», нужно ЧЧ:ММ.")
+        if day not in ("today", "yesterday"):
+            raise ValueError(f"schedule.daily_report: day должен быть today или yesterday, а не «{day}».")
+        slots.append(ReportSlot(t, day == "yesterday"))
+    return sorted(slots)
+
+class ReportScheduler:
+    """Отправка суточного доклада по расписанию (окно и демон cli.py).
+
+    Каждая отправка отмечается в файле состояния под межпроцессной
+    блокировкой до постановки в очередь Telegram: после перезапуска, а также
+    при нескольких запущенных копиях с общим файлом доклад не уходит дважды.
+    Пропущенное время (программа была закрыта) догоняется не позже
+    catch_up минут после него. За WARM_AHEAD до отправки данные дня
+    подгружаются в кэш, чтобы сам доклад собирался из памяти.
+    """
+
+    def __init__(self, core, slots: List[ReportSlot], state_path: str, catch_up_minutes: int = 60):
+        self.core = core
+        self.slots = slots
+        self.path = Path(state_path)
+        self.catch_up = timedelta(minutes=catch_up_minutes)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._warmed: set = set()
+        self.last_run: Optional[str] = None
+        self.last_error: Optional[str] = None
+
+    # ---- Расписание ----
+    @staticmethod
+    def _key(when: datetime) -> str:
+        return when.strftime("%Y-%m-%d %H:%M")
+
+    def _moments(self, now: datetime) -> List[Tuple[datetime, ReportSlot]]:
+        # вчерашние слоты — для догона после полуночи
+        out = []
+        for d in (now.date() - timedelta(days=1), now.date()):
+            out.extend((datetime.combine(d, s.at), s) for s in self.slots)
+        return out
+
+    def report_day(self, when: datetime, slot: ReportSlot) -> date:
+        return when.date() - timedelta(days=1) if slot.yesterday else when.date()
+
+    def next_run(self, now: Optional[datetime] = None) -> Optional[datetime]:
+        if not self.slots:
+            return None
+        now = now or datetime.now()
+        done = self._read_state()
+        for d in (now.date(), now.date() + timedelta(days=1)):
+            for s in self.slots:
+                when = datetime.combine(d, s.at)
+                if when + self.catch_up > now and self._key(when) not in done:
+                    return when
+        return None
+
+    # ---- Файл состояния ----
+    def _read_state(self) -> Dict[str, str]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f).get("daily_report", {})
+        except (OSError, ValueError):
+            return {}
+
+    def _write_state(self, done: Dict[str, str]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"daily_report": done}, f, ensure_ascii=False, indent=1, sort_keys=True)
+        retry_io(lambda: os.replace(tmp, self.path))
+
+    def _claim(self, key: str, now: datetime) -> bool:
+        """Отметить слот как отправленный; False — его уже отправил кто-то другой."""
+        with shared_file_lock(self.path.with_name(self.path.name + ".lock")):
+            done = self._read_state()
+            if key in done:
+                return False
+            oldest = self._key(now - timedelta(days=KEEP_DAYS))
+            done = {k: v for k, v in done.items() if k >= oldest}
+            done[key] = now.strftime("%Y-%m-%d %H:%M:%S")
+            self._write_state(done)
+            return True
+
+    def _release(self, key: str):
+        with shared_file_lock(self.path.with_name(self.path.name + ".lock")):
+            done = self._read_state()
+            if done.pop(key, None) is not None:
+                self._write_state(done)
+
+    # ---- Выполнение ----
+    def run_pending(self, now: Optional[datetime] = None) -> int:
+        """Отправить наступившие доклады; возвращает число отправленных."""
+        now = now or datetime.now()
+        sent = 0
+        for when, slot in self._moments(now):
+            key = self._key(when)
+            day = self.report_day(when, slot)
+            if when - WARM_AHEAD <= now < when and key not in self._warmed:
+                # подгрузка заранее: на пересменке книгу не разбираем
+                self._warmed.add(key)
+                self.core.storage.daily_rollup(day, day)
+                self.core.daily_frame(day)
+            if not (when <= now < when + self.catch_up) or not self._claim(key, now):
+                continue
+            try:
+                self.core.send_daily_report(self.core.daily_frame(day), day)
+            except Exception:
+                # отметку снимаем — следующая проверка попробует снова
+                self._release(key)
+                raise
+            self.last_run = key
+            sent += 1
+        self._warmed = {k for k in self._warmed if k >= self._key(now - timedelta(days=1))}
+        return sent
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_pending()
+                self.last_error = None
+            except (OSError, ValueError, StorageBusyError) as e:
+                self.last_error = str(e)
+            except Exception as e:
+                # неожиданная ошибка не должна останавливать расписание
+                self.last_error = f"{type(e).__name__}: {e}"
+            self._stop.wait(CHECK_INTERVAL)
+
+    def start(self):
+        if not self.slots or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="report-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
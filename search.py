@@ -0,0 +1,171 @@
+# search.py
+import bisect
+import math
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import pandas as pd
+
+# Поля, по которым ищет полнотекстовый поиск
+SEARCH_FIELDS = ("description", "comment")
+
+_TOKEN = re.compile(r"\w+")
+MAX_PREFIX_TERMS = 64   # сколько словоформ раскрывать для одного слова запроса
+
+def normalize(text: str) -> str:
+    # регистр (casefold) и «ё» → «е»: «Счётчик» находится по «счетчик»
+    return text.casefold().replace("ё", "е")
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(normalize(text))
+
+def _stem(word: str) -> str:
+    # Грубая замена стемминга: длинные слова ищутся без двух последних букв,
+    # так «линия» находит «линии», а «счетчик» — «счетчика»
+    return word if len(word) <= 4 else word[:max(4, len(word) - 2)]
+
+def _row_text(row: Dict[str, Any]) -> str:
+    parts = []
+    for f in SEARCH_FIELDS:
+        v = row.get(f)
+        if v is not None and not (not isinstance(v, str) and pd.isna(v)):
+            parts.append(str(v))
+    return " ".join(parts)
+
+class SearchIndex:
+    """Инвертированный индекс описаний и комментариев: слово → {позиция строки: частота}.
+
+    Поиск — все слова запроса; каждое ищется по префиксу основы (окончания
+    и недописанное слово не мешают), ранжирование BM25, точная словоформа
+    весит больше. Как и IncidentIndex, работает с
+    позициями строк DataFrame кэша и обновляется на каждой записи.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.n = 0
+        self._post: Dict[str, Dict[int, int]] = {}
+        self._len: Dict[int, int] = {}
+        self._total_len = 0
+        self._pos_of_id: Dict[int, int] = {}
+        self._vocab: Optional[List[str]] = None   # отсортированный словарь для префиксов
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "SearchIndex":
+        ix = cls()
+        ix.n = len(df)
+        text = pd.Series("", index=range(len(df)), dtype=object)
+        for f in SEARCH_FIELDS:
+            col = df[f].astype(object).where(df[f].notna(), "").astype(str).to_numpy()
+            text = text + " " + col
+        tokens = text.str.casefold().str.replace("ё", "е", regex=False).str.findall(r"\w+")
+        lengths = tokens.str.len()
+        ix._len = {p: n for p, n in lengths.items() if n}
+        ix._total_len = int(lengths.sum())
+        words = tokens.explode().dropna()
+        if len(words):
+            pairs = words.groupby([words.index, words.to_numpy()]).size()
+            post = ix._post
+            for (pos, word), tf in pairs.items():
+                post.setdefault(word, {})[pos] = int(tf)
+        ids = df["id"]
+        valid = ids.notna().to_numpy()
+        positions = [i for i, ok in enumerate(valid) if ok]
+        ix._pos_of_id = dict(zip(ids[valid].astype(int).tolist(), positions))
+        return ix
+
+    # ---- Синхронизация с записью ----
+    def apply(self, old_row: Optional[Dict[str, Any]], new_row: Optional[Dict[str, Any]]) -> bool:
+        """Учесть вставку (old_row=None) или правку строки. False — индекс надо перестроить."""
+        if old_row is None:
+            if new_row is None:
+                return True
+            pos = self.n
+            self.n += 1
+        else:
+            pos = self._pos_of_id.get(int(old_row["id"])) if old_row.get("id") is not None else None
+            if pos is None:
+                return False
+            self._remove(pos, old_row)
+        if new_row is not None:
+            self._add(pos, new_row)
+        return True
+
+    def _add(self, pos: int, row: Dict[str, Any]):
+        tokens = tokenize(_row_text(row))
+        rid = row.get("id")
+        if rid is not None and not pd.isna(rid):
+            self._pos_of_id[int(rid)] = pos
+        if not tokens:
+            return
+        self._len[pos] = len(tokens)
+        self._total_len += len(tokens)
+        for t in tokens:
+            docs = self._post.get(t)
+            if docs is None:
+                docs = self._post[t] = {}
+                self._vocab = None
+            docs[pos] = docs.get(pos, 0) + 1
+
+    def _remove(self, pos: int, row: Dict[str, Any]):
+        # старая версия строки из кэша — ровно то, что было проиндексировано
+        self._total_len -= self._len.pop(pos, 0)
+        for t in set(tokenize(_row_text(row))):
+            docs = self._post.get(t)
+            if docs is None or docs.pop(pos, None) is None:
+                continue
+            if not docs:
+                del self._post[t]
+                self._vocab = None
+
+    # ---- Поиск ----
+    def _expand(self, prefix: str) -> List[str]:
+        if self._vocab is None:
+            self._vocab = sorted(self._post)
+        i = bisect.bisect_left(self._vocab, prefix)
+        out = []
+        while i < len(self._vocab) and self._vocab[i].startswith(prefix):
+            out.append(self._vocab[i])
+            i += 1
+        # самые частые слова важнее для недописанного запроса
+        out.sort(key=lambda t: -len(self._post[t]))
+        return out[:MAX_PREFIX_TERMS]
+
+    def search(self, text: str, allowed: Optional[Iterable[int]] = None,
+               limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        """(позиция, оценка) по убыванию оценки; allowed — ограничение по позициям."""
+        words = tokenize(text)
+        if not words:
+            return []
+        avg = self._total_len / max(len(self._len), 1)
+        n_docs = max(len(self._len), 1)
+        scores: Optional[Dict[int, float]] = None
+        for w in words:
+            terms = self._expand(_stem(w))
+            if w in self._post and w not in terms:
+                terms.append(w)
+            word_scores: Dict[int, float] = {}
+            for t in terms:
+                docs = self._post[t]
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                # точное совпадение весомее продолжения слова
+                weight = idf if t == w else idf * 0.8
+                for pos, tf in docs.items():
+                    if scores is not None and pos not in scores:
+                        continue
+                    dl = self._len.get(pos, 1)
+                    s = weight * tf * (self.K1 + 1) / (tf + self.K1 * (1 - self.B + self.B * dl / avg))
+                    if s > word_scores.get(pos, 0.0):
+                        word_scores[pos] = s
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {p: scores[p] + s for p, s in word_scores.items()}
+            if not scores:
+                return []
+        if allowed is not None:
+            allowed_set: Set[int] = allowed if isinstance(allowed, set) else set(allowed)
+            scores = {p: s for p, s in scores.items() if p in allowed_set}
+        ranked = sorted(scores.items(), key=lambda ps: (-ps[1], -ps[0]))
+        return ranked[:limit] if limit else ranked
@@ -0,0 +1,260 @@
+# sqlite_storage.py
+import sqlite3
+import threading
+from datetime import date, time, datetime
+from pathlib import Path
+from typing import Dict, Any, Iterable, List, Optional, Union
+import pandas as pd
+from metrics import METRICS
+from storage import (
+    StorageEngine, INCIDENT_COLUMNS, LOCATION_COLUMNS,
+    INCIDENT_SHEET, LOCATIONS_SHEET, as_time, to_excel_frame,
+    ensure_incidents_schema, row_dict,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS incidents (
+    id          INTEGER PRIMARY KEY,
+    date        TEXT,
+    time        TEXT,
+    location    TEXT,
+    address     TEXT,
+    duty        TEXT,
+    type        TEXT,
+    description TEXT,
+    status      TEXT,
+    resolved_at TEXT,
+    comment     TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_incidents_date ON incidents(date);
+CREATE INDEX IF NOT EXISTS ix_incidents_status ON incidents(status);
+CREATE INDEX IF NOT EXISTS ix_incidents_location ON incidents(location);
+CREATE TABLE IF NOT EXISTS locations (
+    location TEXT NOT NULL,
+    address  TEXT NOT NULL
+);
+"""
+
+def _to_sql(v: Any, col: str = "") -> Any:
+    # Значение ячейки → значение для SQLite (даты/время храним текстом ISO)
+    if v is None or v is pd.NaT:
+        return None
+    if isinstance(v, float) and pd.isna(v):
+        return None
+    if v is pd.NA:
+        return None
+    if isinstance(v, (pd.Timestamp, datetime)):
+        if col == "date":
+            return v.strftime("%Y-%m-%d")
+        return v.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(v, pd.Timedelta):
+        return as_time(v).strftime("%H:%M:%S")
+    if isinstance(v, date):
+        return v.isoformat()
+    if isinstance(v, time):
+        return v.strftime("%H:%M:%S")
+    if hasattr(v, "item"):
+        # numpy-скаляры
+        return v.item()
+    return v
+
+class SqliteStorage(StorageEngine):
+    """Хранилище в SQLite (WAL): вставка и правка — одна строка по индексу.
+
+    Книга Excel используется только для импорта/экспорта.
+    """
+
+    def __init__(self, db_path: str, import_from: Optional[str] = None, lock_timeout: float = 30.0):
+        super().__init__()
+        self.path = Path(db_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._locations_version = 0
+        # timeout — сколько ждать, пока база занята записью с другого рабочего места
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=lock_timeout)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+        # Первый запуск: перенесём данные из существующей книги
+        if import_from and Path(import_from).exists() and self._is_empty():
+            self.import_excel(import_from)
+
+    def _is_empty(self) -> bool:
+        with self._lock:
+            n_inc = self._conn.execute("SELECT COUNT(*) FROM incidents").fetchone()[0]
+            n_loc = self._conn.execute("SELECT COUNT(*) FROM locations").fetchone()[0]
+        return n_inc == 0 and n_loc == 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ---- Incidents ----
+    def _source_key(self):
+        # data_version меняется при коммитах других соединений, total_changes — при своих
+        with self._lock:
+            dv = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            return (dv, self._conn.total_changes)
+
+    def _directory_key(self):
+        # свои вставки инцидентов справочник не меняют — считаем только свои правки локаций
+        with self._lock:
+            dv = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            return (dv, self._locations_version)
+
+    def _read_incidents(self) -> pd.DataFrame:
+        cols = ", ".join(INCIDENT_COLUMNS)
+        with METRICS.timer("storage.read") as m:
+            with self._lock:
+                df = pd.read_sql_query(f"SELECT {cols} FROM incidents ORDER BY id", self._conn)
+            m.rows = len(df)
+            return self._ensure_incidents_schema(df)
+
+    def _fetch_row(self, incident_id: int) -> Optional[Dict[str, Any]]:
+        cols = ", ".join(INCIDENT_COLUMNS)
+        with self._lock:
+            df = pd.read_sql_query(f"SELECT {cols} FROM incidents WHERE id = ?", self._conn,
+                                   params=[int(incident_id)])
+        return row_dict(ensure_incidents_schema(df), incident_id)
+
+    @METRICS.timed("storage.append")
+    def append_incident(self, record: Dict[str, Any]) -> int:
+        self._prepare_record(record)
+        if record.get("id") is None or pd.isna(record.get("id")):
+            record.pop("id", None)
+        cols = [c for c in INCIDENT_COLUMNS if c in record]
+        sql = f"INSERT INTO incidents ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+        cache = self._cache
+        with cache.lock, self._lock:
+            try:
+                with self._conn:
+                    # Блокировка записи берётся до проверки кэша: чужая вставка
+                    # между проверкой и своей не пропадёт из кэша
+                    self._conn.execute("BEGIN IMMEDIATE")
+                    fresh = self._cache_fresh()
+                    cur = self._conn.execute(sql, [_to_sql(record[c], c) for c in cols])
+            except sqlite3.IntegrityError:
+                raise ValueError(f"Инцидент id={record.get('id')} уже существует.")
+            record["id"] = cur.lastrowid
+            new_row = ensure_incidents_schema(pd.DataFrame([record]))
+            row = row_dict(new_row, record["id"])
+            # Кэш дополняем одной строкой вместо перечитывания таблицы
+            if fresh:
+                self._cache_append(new_row, (None, row))
+        self._emit("inserted", record["id"], row)
+        return int(record["id"])
+
+    @METRICS.timed("storage.append_many", rows=len)
+    def append_incidents(self, records: Union[pd.DataFrame, Iterable[Dict[str, Any]]]) -> List[int]:
+        sql = (f"INSERT INTO incidents ({', '.join(INCIDENT_COLUMNS)}) "
+               f"VALUES ({', '.join('?' * len(INCIDENT_COLUMNS))})")
+        cache = self._cache
+        with cache.lock, self._lock:
+            with self._conn:
+                # id выдаются по таблице под блокировкой записи — без гонки с другими рабочими местами
+                self._conn.execute("BEGIN IMMEDIATE")
+                fresh = self._cache_fresh()
+                existing = pd.read_sql_query("SELECT id FROM incidents", self._conn)["id"]
+                batch = self._prepare_batch(records, existing.astype("Int64"))
+                if batch.empty:
+                    return []
+                rows = ([_to_sql(v, c) for c, v in zip(INCIDENT_COLUMNS, r)]
+                        for r in batch.itertuples(index=False, name=None))
+                self._conn.executemany(sql, rows)
+            if fresh:
+                self._cache_append(batch)
+                cache.reset_derived()
+            else:
+                self._cache_store(None)
+        ids = batch["id"].astype(int).tolist()
+        self._emit("imported", ids[0], {"count": len(ids)})
+        return ids
+
+    @METRICS.timed("storage.update")
+    def update_incident(self, incident_id: int, fields: Dict[str, Any]):
+        self._check_fields(fields)
+        if not fields:
+            return
+        parsed = {k: self._parse_field(k, v) for k, v in fields.items()}
+        keys = list(parsed)
+        values = [_to_sql(parsed[k], k) for k in keys]
+        sql = f"UPDATE incidents SET {', '.join(f'{k} = ?' for k in keys)} WHERE id = ?"
+        cache = self._cache
+        with cache.lock, self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                fresh = self._cache_fresh()
+                cur = self._conn.execute(sql, values + [int(incident_id)])
+            if cur.rowcount == 0:
+                raise ValueError(f"Инцидент id={incident_id} не найден.")
+            if fresh:
+                # Одна строка правится прямо в кэше
+                df = cache.frame()
+                old = row_dict(df, incident_id)
+                df = self._apply_fields(df, incident_id, parsed)
+                row = {**old, **parsed}
+                self._cache_store(df, (old, row))
+            else:
+                self._cache_store(None)
+                row = self._fetch_row(incident_id)
+        self._emit("updated", incident_id, row)
+
+    # ---- Locations ----
+    def load_locations(self) -> pd.DataFrame:
+        with self._lock:
+            df = pd.read_sql_query("SELECT location, address FROM locations ORDER BY rowid", self._conn)
+        return self._clean_locations(df)
+
+    def save_locations(self, df: pd.DataFrame):
+        clean = self._validate_locations(df)
+        rows = list(clean.itertuples(index=False, name=None))
+        cache = self._cache
+        with cache.lock, self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                fresh = self._cache_fresh()
+                self._conn.execute("DELETE FROM locations")
+                self._conn.executemany("INSERT INTO locations (location, address) VALUES (?, ?)", rows)
+            self._locations_version += 1
+            self._store_directory(clean)
+            if fresh:
+                self._cache_store(cache.frame())
+
+    # ---- Импорт/экспорт Excel ----
+    def import_excel(self, excel_path: str):
+        """Загрузить инциденты и локации из книги (записи с тем же id заменяются)."""
+        inc = pd.read_excel(excel_path, sheet_name=INCIDENT_SHEET, engine="openpyxl")
+        inc = self._ensure_incidents_schema(inc)
+        inc = inc[inc["id"].notna()]
+        try:
+            loc = pd.read_excel(excel_path, sheet_name=LOCATIONS_SHEET, engine="openpyxl")
+        except ValueError:
+            loc = pd.DataFrame(columns=LOCATION_COLUMNS)
+        loc = self._clean_locations(loc)
+
+        sql = (f"INSERT OR REPLACE INTO incidents ({', '.join(INCIDENT_COLUMNS)}) "
+               f"VALUES ({', '.join('?' * len(INCIDENT_COLUMNS))})")
+        rows = ([_to_sql(v, c) for c, v in zip(INCIDENT_COLUMNS, r)]
+                for r in inc.itertuples(index=False, name=None))
+        self.invalidate_cache()
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(sql, rows)
+                if not loc.empty:
+                    self._conn.execute("DELETE FROM locations")
+                    self._conn.executemany(
+                        "INSERT INTO locations (location, address) VALUES (?, ?)",
+                        list(loc.itertuples(index=False, name=None)),
+                    )
+            self._locations_version += 1
+
+    def export_excel(self, excel_path: str):
+        """Выгрузить реестр и справочник в книгу того же формата, что IncidentStorage."""
+        inc = self.load_incidents()
+        loc = self.load_locations()
+        Path(excel_path).parent.mkdir(parents=True, exist_ok=True)
+        with pd.ExcelWriter(excel_path, engine="openpyxl") as w:
+            to_excel_frame(inc).to_excel(w, sheet_name=INCIDENT_SHEET, index=False)
+            loc.to_excel(w, sheet_name=LOCATIONS_SHEET, index=False)
@@ -1,8 +1,28 @@
 # storage.py
+import json
+import os
+import threading
 from pathlib import Path
-from typing import Dict, Any, List, Optional, Tuple
+from typing import TYPE_CHECKING, Dict, Any, Iterable, Iterator, List, Optional, Tuple, Callable, NamedTuple, Union
+import numpy as np
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, date, time
+from locking import retry_io, shared_file_lock
+from metrics import METRICS
+from query import IncidentIndex, IncidentQuery, scan_positions
+from rollup import DailyRollup
+from search import SearchIndex
+
+if TYPE_CHECKING:
+    from archive import ArchivePartitions   # archive импортирует storage
+
+try:
+    # Необязательная зависимость: колоночный снимок реестра (Arrow IPC)
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+    feather = None
 
 INCIDENT_SHEET = "Incidents"
 LOCATIONS_SHEET = "Locations"
@@ -14,172 +34,1235 @@ INCIDENT_COLUMNS = [
     "status", "resolved_at", "comment",
 ]
 
+LOCATION_COLUMNS = ["location", "address"]
+
 # Значения по умолчанию
 DEFAULT_STATUS = "Открыт"
 CLOSED_STATUS = "Закрыт"
 
-class IncidentStorage:
-    def __init__(self, excel_path: str):
-        self.path = Path(excel_path)
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-        if not self.path.exists():
-            self._create_empty()
+JOURNAL_SUFFIX = ".journal.jsonl"
+SNAPSHOT_SUFFIX = ".snapshot.arrow"
+LOCK_SUFFIX = ".lock"
 
-    def _create_empty(self):
-        # Пустые листы
-        inc_df = pd.DataFrame(columns=INCIDENT_COLUMNS)
-        loc_df = pd.DataFrame(columns=["location", "address"])
-        with pd.ExcelWriter(self.path, engine="openpyxl") as w:
-            inc_df.to_excel(w, sheet_name=INCIDENT_SHEET, index=False)
-            loc_df.to_excel(w, sheet_name=LOCATIONS_SHEET, index=False)
+# ---- Типизированная схема ----
+# date — datetime64 (полночь), time — timedelta64 от начала суток,
+# resolved_at — datetime64; справочные поля — категории, тексты — str ("" вместо NaN).
+# В date/time объекты Python превращаются только при показе/выгрузке.
+CATEGORICAL_COLUMNS = ["location", "duty", "type", "status"]
+TEXT_COLUMNS = ["address", "description", "comment"]
 
-    # Универсальная запись одного листа без перезаписи других
-    def _write_sheet(self, sheet_name: str, df: pd.DataFrame):
-        if not self.path.exists():
-            # если файла нет — создаём и пишем только этот лист
-            with pd.ExcelWriter(self.path, engine="openpyxl") as w:
-                df.to_excel(w, sheet_name=sheet_name, index=False)
+# Явные форматы строк (после ISO 8601)
+DATE_FORMATS = ("%d.%m.%Y",)
+DATETIME_FORMATS = ("%d.%m.%Y %H:%M", "%d.%m.%Y %H:%M:%S")
+
+def _parse_datetimes(s: pd.Series, formats: Tuple[str, ...]) -> pd.Series:
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    kind = pd.api.types.infer_dtype(s, skipna=True)
+    if kind in ("datetime", "datetime64", "date", "empty"):
+        return pd.to_datetime(s, errors="coerce")
+    txt = s.astype("string").str.strip()
+    out = pd.to_datetime(txt, format="ISO8601", errors="coerce")
+    for fmt in formats:
+        miss = out.isna() & txt.notna() & (txt != "")
+        if not miss.any():
+            break
+        out[miss] = pd.to_datetime(txt[miss], format=fmt, errors="coerce")
+    return out
+
+def _parse_times(s: pd.Series) -> pd.Series:
+    if pd.api.types.is_timedelta64_dtype(s):
+        return s
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s - s.dt.normalize()
+    # time → "ЧЧ:ММ:СС", datetime → "ГГГГ-ММ-ДД ЧЧ:ММ:СС" (берём часть после пробела)
+    txt = s.astype("string").str.strip().str.rsplit(" ", n=1).str[-1].astype("string")
+    short = txt.str.fullmatch(r"\d{1,2}:\d{2}").fillna(False)
+    txt = txt.where(~short, txt + ":00")
+    return pd.to_timedelta(txt, errors="coerce")
+
+def _as_category(s: pd.Series) -> pd.Series:
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return s
+    s = s.where(s.notna(), "")
+    return s.astype(str).astype("category")
+
+def ensure_incidents_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """Привести DataFrame к типизированной схеме реестра (векторно).
+
+    Уже приведённые колонки не трогаются, поэтому повторный вызов дешёвый.
+    """
+    # Добавить недостающие колонки
+    for c in INCIDENT_COLUMNS:
+        if c not in df.columns:
+            df[c] = pd.NA
+
+    if df["id"].dtype != "Int64":
+        df["id"] = pd.to_numeric(df["id"], errors="coerce").astype("Int64")
+    df["date"] = _parse_datetimes(df["date"], DATE_FORMATS).dt.normalize()
+    df["time"] = _parse_times(df["time"])
+    df["resolved_at"] = _parse_datetimes(df["resolved_at"], DATETIME_FORMATS)
+    # Статус по умолчанию
+    if not isinstance(df["status"].dtype, pd.CategoricalDtype):
+        df["status"] = df["status"].fillna(DEFAULT_STATUS)
+    for c in CATEGORICAL_COLUMNS:
+        df[c] = _as_category(df[c])
+    for c in TEXT_COLUMNS:
+        if df[c].dtype != object or df[c].isna().any():
+            df[c] = df[c].where(df[c].notna(), "").astype(str)
+
+    # Переупорядочить колонки
+    return df[INCIDENT_COLUMNS]
+
+def concat_incidents(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """Склеить типизированные фреймы, не теряя категорий (без повторного приведения)."""
+    # поверхностные копии: входные фреймы (в т.ч. срезы) не меняются
+    frames = [ensure_incidents_schema(f.copy(deep=False)) for f in frames]
+    for c in CATEGORICAL_COLUMNS:
+        cats = frames[0][c].cat.categories
+        for f in frames[1:]:
+            cats = cats.union(f[c].cat.categories)
+        for f in frames:
+            f[c] = f[c].cat.set_categories(cats)
+    return pd.concat(frames, ignore_index=True)
+
+def append_rows(df: pd.DataFrame, *parts: pd.DataFrame) -> pd.DataFrame:
+    """Дописать к типизированному реестру типизированные строки (один concat на все части).
+
+    В отличие от concat_incidents реестр заново не приводится: новые
+    категории добавляются в конец, коды существующих строк не меняются.
+    """
+    df, parts = df.copy(deep=False), [p.copy(deep=False) for p in parts]
+    for c in CATEGORICAL_COLUMNS:
+        known = df[c].cat.categories
+        extra = list(dict.fromkeys(v for p in parts for v in p[c].cat.categories.difference(known)))
+        if extra:
+            df[c] = df[c].cat.add_categories(extra)
+        for p in parts:
+            p[c] = p[c].cat.set_categories(df[c].cat.categories)
+    return pd.concat([df, *parts], ignore_index=True)
+
+def to_excel_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Типизированный реестр → фрейм для записи в книгу (ячейки даты и времени Excel)."""
+    out = df.copy()
+    out["date"] = out["date"].dt.date
+    # время pandas всё равно пишет в книгу текстом "ЧЧ:ММ:СС"
+    out["time"] = (pd.Timestamp(0) + out["time"]).dt.strftime("%H:%M:%S")
+    for c in CATEGORICAL_COLUMNS:
+        out[c] = out[c].astype(object)
+    return out
+
+# ---- Показ (край UI/отчётов) ----
+def as_date(v: Any) -> Optional[date]:
+    if v is None or pd.isna(v):
+        return None
+    return pd.Timestamp(v).date()
+
+def as_time(v: Any) -> Optional[time]:
+    if v is None or pd.isna(v):
+        return None
+    if isinstance(v, datetime):
+        return v.time()
+    if isinstance(v, time):
+        return v
+    return (datetime.min + pd.Timedelta(v).to_pytimedelta()).time()
+
+def fmt_date(v: Any) -> str:
+    return "" if v is None or pd.isna(v) else pd.Timestamp(v).strftime("%d.%m.%Y")
+
+def fmt_time(v: Any) -> str:
+    t = as_time(v)
+    return t.strftime("%H:%M") if t else ""
+
+def fmt_datetime(v: Any) -> str:
+    return "" if v is None or pd.isna(v) else pd.Timestamp(v).strftime("%d.%m.%Y %H:%M")
+
+def _format_unique(s: pd.Series, fmt: Callable[[pd.Series], pd.Series]) -> pd.Series:
+    # strftime медленный: форматируем только различные значения (дней и минут немного)
+    codes, uniques = pd.factorize(s)
+    text = fmt(pd.Series(uniques)).to_numpy(dtype=object)
+    out = pd.Series("", index=s.index, dtype=object)
+    found = codes >= 0
+    out[found] = text[codes[found]]
+    return out
+
+def format_dates(s: pd.Series) -> pd.Series:
+    return _format_unique(s, lambda u: u.dt.strftime("%d.%m.%Y"))
+
+def format_times(s: pd.Series) -> pd.Series:
+    return _format_unique(s, lambda u: (pd.Timestamp(0) + u).dt.strftime("%H:%M"))
+
+def format_datetimes(s: pd.Series) -> pd.Series:
+    return _format_unique(s, lambda u: u.dt.strftime("%d.%m.%Y %H:%M"))
+
+class IncidentEvent(NamedTuple):
+    """Изменение реестра этим процессом: kind — "inserted", "updated" или "imported".
+
+    Для "imported" (пакетная вставка) id — первый id пакета, row — {"count": число записей}.
+    """
+    kind: str
+    id: int
+    row: Dict[str, Any]   # строка в типах схемы
+
+def row_dict(df: pd.DataFrame, incident_id: int) -> Optional[Dict[str, Any]]:
+    rows = df[df["id"] == incident_id]
+    if rows.empty:
+        return None
+    return rows.iloc[-1].to_dict()
+
+class _IncidentsCache:
+    """Типизированный DataFrame инцидентов и ключ источника, с которого он прочитан."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.df: Optional[pd.DataFrame] = None
+        self.key: Optional[Tuple] = None
+        # Вставки, ещё не дописанные к df: дописываются одним concat при следующем чтении
+        self.pending: List[pd.DataFrame] = []
+        # Производные структуры строятся по df при первом запросе и обновляются на записи
+        self.rollup: Optional[DailyRollup] = None
+        self.index: Optional[IncidentIndex] = None
+        self.search: Optional[SearchIndex] = None
+        # Справочник локаций (локация → адреса) и ключ источника, с которого он прочитан
+        self.directory: Optional[Dict[str, List[str]]] = None
+        self.directory_key: Optional[Tuple] = None
+        self.hits = 0
+        self.misses = 0
+
+    def frame(self) -> Optional[pd.DataFrame]:
+        # df вместе с отложенными вставками; вызывать под lock
+        if self.pending:
+            self.df = append_rows(self.df, *self.pending)
+            self.pending = []
+        return self.df
+
+    def reset_derived(self):
+        self.rollup = None
+        self.index = None
+        self.search = None
+
+    def apply_change(self, old_row: Optional[Dict[str, Any]], new_row: Optional[Dict[str, Any]]):
+        if self.rollup is not None:
+            self.rollup.apply(old_row, new_row)
+        if self.index is not None and not self.index.apply(old_row, new_row):
+            self.index = None
+        if self.search is not None and not self.search.apply(old_row, new_row):
+            self.search = None
+
+# Кэш на процесс: все хранилища с одним и тем же файлом делят одну запись
+_CACHES: Dict[str, _IncidentsCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+def _shared_cache(path: Path) -> _IncidentsCache:
+    with _CACHES_LOCK:
+        return _CACHES.setdefault(str(path.resolve()), _IncidentsCache())
+
+class StorageEngine:
+    """Интерфейс хранилища инцидентов.
+
+    Движок отвечает за чтение/запись инцидентов и справочника локаций;
+    приведение схемы, разбор значений полей и кэш общие для всех движков.
+    Движок реализует _read_incidents() и _source_key() — ключ, меняющийся
+    при любом изменении источника (в т.ч. другим процессом).
+
+    Если у движка есть помесячный архив (archive), запросы с датами
+    дополняются записями архивных месяцев своего диапазона; запрос без дат
+    читает только рабочий реестр, весь архив — лишь с IncidentQuery.archive.
+    """
+
+    path: Path
+
+    def __init__(self):
+        self._subscribers: List[Callable[[IncidentEvent], None]] = []
+        self.archive: Optional["ArchivePartitions"] = None
+
+    # ---- События ----
+    def subscribe(self, callback: Callable[[IncidentEvent], None]) -> Callable[[], None]:
+        """Подписаться на вставки/правки; возвращает функцию отписки."""
+        self._subscribers.append(callback)
+
+        def unsubscribe():
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+        return unsubscribe
+
+    def _emit(self, kind: str, incident_id: int, row: Optional[Dict[str, Any]]):
+        # Вызывается после снятия блокировок записи
+        if row is None:
             return
-        # если файл есть — заменяем только нужный лист
-        with pd.ExcelWriter(self.path, engine="openpyxl", mode="a", if_sheet_exists="replace") as w:
-            df.to_excel(w, sheet_name=sheet_name, index=False)
+        event = IncidentEvent(kind, int(incident_id), row)
+        for cb in list(self._subscribers):
+            cb(event)
 
-    # ---- Incidents ----
-    def _ensure_incidents_schema(self, df: pd.DataFrame) -> pd.DataFrame:
-        # Добавить недостающие колонки
-        for c in INCIDENT_COLUMNS:
-            if c not in df.columns:
-                df[c] = pd.NA
-
-        # Типы
-        if "id" in df.columns:
-            # безопасно привести к Int64 (nullable)
-            df["id"] = pd.to_numeric(df["id"], errors="coerce").astype("Int64")
-        if "date" in df.columns:
-            df["date"] = pd.to_datetime(df["date"], errors="coerce").dt.date
-        if "time" in df.columns:
-            df["time"] = pd.to_datetime(df["time"], errors="coerce").dt.time
-        if "resolved_at" in df.columns:
-            df["resolved_at"] = pd.to_datetime(df["resolved_at"], errors="coerce")
-        # Статус по умолчанию
-        if "status" in df.columns:
-            df["status"] = df["status"].fillna(DEFAULT_STATUS)
-
-        # Переупорядочить колонки
-        df = df[INCIDENT_COLUMNS]
-        return df
+    @property
+    def _cache(self) -> _IncidentsCache:
+        return _shared_cache(self.path)
+
+    def _read_incidents(self) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def _source_key(self) -> Tuple:
+        raise NotImplementedError
+
+    def _cached_df(self) -> pd.DataFrame:
+        # Актуальный DataFrame кэша без копии; вызывать под cache.lock
+        cache = self._cache
+        key = self._source_key()
+        if cache.df is not None and cache.key == key:
+            cache.hits += 1
+        else:
+            cache.misses += 1
+            cache.df = self._read_incidents()
+            cache.pending = []
+            cache.key = key
+            cache.reset_derived()
+        return cache.frame()
 
     def load_incidents(self) -> pd.DataFrame:
-        if not self.path.exists():
-            self._create_empty()
-        df = pd.read_excel(self.path, sheet_name=INCIDENT_SHEET, engine="openpyxl")
-        return self._ensure_incidents_schema(df)
+        with self._cache.lock:
+            # копия: вызывающий код может менять свой DataFrame
+            return self._cached_df().copy()
 
-    def _next_id(self, df: pd.DataFrame) -> int:
-        if df.empty or df["id"].isna().all():
-            return 1
-        return int(df["id"].max()) + 1
-
-    def append_incident(self, record: Dict[str, Any]):
-        df = self.load_incidents()
-        if pd.isna(record.get("id")) or record.get("id") is None:
-            record["id"] = self._next_id(df)
-        # Значения по умолчанию
+    def get_incident(self, incident_id: int) -> Optional[Dict[str, Any]]:
+        """Запись по id (рабочий реестр, затем архив) или None."""
+        with self._cache.lock:
+            row = row_dict(self._cached_df(), incident_id)
+        if row is None and self.archive is not None:
+            month = self.archive.find(int(incident_id))
+            if month is not None:
+                row = row_dict(self.archive.load(month), incident_id)
+        return row
+
+    def _rollup(self) -> DailyRollup:
+        # Сводка для текущего cache.df; вызывать под cache.lock
+        cache = self._cache
+        df = self._cached_df()
+        if cache.rollup is None:
+            cache.rollup = DailyRollup.from_frame(df)
+        return cache.rollup
+
+    def daily_rollup(self, start, end) -> DailyRollup:
+        """Копия сводки по дням за [start, end] — O(дней), без просмотра записей."""
+        with self._cache.lock:
+            r = self._rollup().slice(start, end)
+        for m in self._archive_months(start, end):
+            r.merge(self.archive.rollup(m).slice(start, end))
+        return r
+
+    def _archive_months(self, start, end, whole: bool = False) -> List[str]:
+        # Архивные месяцы, пересекающие [start, end]; без дат — только если
+        # весь архив запрошен явно (whole), иначе реестр по умолчанию его не читает
+        if self.archive is None or (start is None and end is None and not whole):
+            return []
+        return self.archive.months_between(start, end)
+
+    def _archive_scan(self, start, end, whole: bool = False, search: bool = False):
+        # (записи, поисковый индекс) нужных месяцев архива
+        months = self._archive_months(start, end, whole)
+        return self.archive.scan(months, search) if months else iter(())
+
+    def _with_archive(self, hot: pd.DataFrame, parts: List[pd.DataFrame]) -> pd.DataFrame:
+        # Архивные записи старше рабочих — идут первыми, порядок реестра сохраняется
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return hot
+        return concat_incidents(parts + [hot])
+
+    def _index(self) -> IncidentIndex:
+        # Индексы для текущего cache.df; вызывать под cache.lock
+        cache = self._cache
+        df = self._cached_df()
+        if cache.index is None:
+            cache.index = IncidentIndex.from_frame(df)
+        return cache.index
+
+    @METRICS.timed("storage.query", rows=len)
+    def query(self, q: IncidentQuery) -> pd.DataFrame:
+        """Инциденты, подходящие под фильтр (в порядке реестра), через вторичные индексы."""
+        with self._cache.lock:
+            ix = self._index()
+            df = self._cache.df
+            hot = df.copy() if q.is_empty() else df.iloc[ix.positions(df, q)].copy()
+        parts = []
+        for mdf, _ in self._archive_scan(q.date_from, q.date_to, q.archive):
+            parts.append(mdf.iloc[scan_positions(mdf, q)])
+        return self._with_archive(hot, parts)
+
+    def query_chunks(self, q: IncidentQuery, chunk_rows: int = 5000) -> Tuple[int, Iterator[pd.DataFrame]]:
+        """Число подходящих записей и итератор по ним кусками по chunk_rows (копии).
+
+        Выборка фиксируется при вызове; кусок копируется под блокировкой,
+        поэтому между кусками запись в реестр не ждёт, а в памяти лежит
+        только текущий кусок.
+        """
+        cache = self._cache
+        with cache.lock:
+            df = self._cached_df()
+            pos = np.arange(len(df)) if q.is_empty() else self._index().positions(df, q)
+        # архивные месяцы не меняются на месте (запись заменяет фрейм) — блокировка им не нужна
+        archived = []
+        for mdf, _ in self._archive_scan(q.date_from, q.date_to, q.archive):
+            archived.append((mdf, scan_positions(mdf, q)))
+
+        def chunks() -> Iterator[pd.DataFrame]:
+            for mdf, mpos in archived:
+                for start in range(0, len(mpos), chunk_rows):
+                    yield mdf.iloc[mpos[start:start + chunk_rows]].copy()
+            for start in range(0, len(pos), chunk_rows):
+                with cache.lock:
+                    part = df.iloc[pos[start:start + chunk_rows]].copy()
+                yield part
+        return len(pos) + sum(len(p) for _, p in archived), chunks()
+
+    @METRICS.timed("storage.search", rows=len)
+    def search(self, text: str, q: Optional[IncidentQuery] = None, limit: Optional[int] = 500) -> pd.DataFrame:
+        """Полнотекстовый поиск по описанию и комментарию; результат по убыванию
+        релевантности с колонкой score. q дополнительно ограничивает выборку."""
+        cache = self._cache
+        with cache.lock:
+            df = self._cached_df()
+            if cache.search is None:
+                cache.search = SearchIndex.from_frame(df)
+            allowed = None
+            if q is not None and not q.is_empty():
+                allowed = set(self._index().positions(df, q).tolist())
+            hits = cache.search.search(text, allowed, limit)
+            out = df.iloc[[p for p, _ in hits]].copy()
+        out["score"] = [s for _, s in hits]
+        q = q or IncidentQuery()
+        parts = []
+        for mdf, index in self._archive_scan(q.date_from, q.date_to, q.archive, search=True):
+            allowed = set(scan_positions(mdf, q).tolist())
+            mhits = index.search(text, allowed, limit)
+            part = mdf.iloc[[p for p, _ in mhits]].copy()
+            part["score"] = [s for _, s in mhits]
+            parts.append(part)
+        if not any(len(p) for p in parts):
+            return out
+        # оценки месяцев считаются по своему корпусу — для слияния этого достаточно
+        merged = self._with_archive(out.drop(columns="score"), [p.drop(columns="score") for p in parts])
+        merged["score"] = [s for p in parts for s in p["score"]] + out["score"].tolist()
+        merged = merged.sort_values("score", ascending=False, kind="stable")
+        return merged.head(limit) if limit else merged
+
+    def distinct_values(self, field: str) -> List[str]:
+        """Значения поля, встречающиеся в реестре (status, location, address, type, duty)."""
+        with self._cache.lock:
+            return self._index().values(field)
+
+    @METRICS.timed("storage.load_day_range", rows=len)
+    def load_day_range(self, start, end) -> pd.DataFrame:
+        """Инциденты с датой в [start, end]: по сводке дней берётся только диапазон id."""
+        cache = self._cache
+        with cache.lock:
+            rollup = self._rollup()
+            df = cache.df
+            if rollup.total(start, end) == 0:
+                hot = df.iloc[:0].copy()
+            else:
+                bounds = rollup.id_bounds(start, end)
+                if bounds is not None and df["id"].is_monotonic_increasing:
+                    ids = df["id"].to_numpy()
+                    a = ids.searchsorted(bounds[0], side="left")
+                    b = ids.searchsorted(bounds[1], side="right")
+                    df = df.iloc[a:b]
+                hot = df[df["date"].between(pd.Timestamp(start), pd.Timestamp(end))].copy()
+        parts = []
+        for mdf, _ in self._archive_scan(start, end):
+            parts.append(mdf[mdf["date"].between(pd.Timestamp(start), pd.Timestamp(end))])
+        return self._with_archive(hot, parts)
+
+    def _cache_fresh(self) -> bool:
+        cache = self._cache
+        return cache.df is not None and cache.key == self._source_key()
+
+    def _cache_store(self, df: Optional[pd.DataFrame], change: Optional[Tuple] = None):
+        # После собственной записи: запоминаем новое состояние и новый ключ источника.
+        # change = (старая строка, новая строка) — для обновления сводки, индексов и поиска
+        cache = self._cache
+        cache.df = df
+        cache.pending = []
+        cache.key = self._source_key() if df is not None else None
+        if df is None:
+            cache.reset_derived()
+        elif change is not None:
+            cache.apply_change(*change)
+
+    def _cache_append(self, rows: pd.DataFrame, change: Optional[Tuple] = None):
+        # После собственной вставки в свежий кэш: строки откладываются в cache.pending,
+        # чтобы вставка не копировала весь реестр; сводка, индексы и поиск — сразу
+        cache = self._cache
+        cache.pending.append(rows)
+        cache.key = self._source_key()
+        if change is not None:
+            cache.apply_change(*change)
+
+    def invalidate_cache(self):
+        with self._cache.lock:
+            self._cache_store(None)
+
+    def cache_stats(self) -> Dict[str, int]:
+        """Счётчики кэша без блокировки: окно «Диагностика» опрашивает их из потока
+        интерфейса и не должно ждать записи книги. Значения могут отстать на одну операцию."""
+        cache = self._cache
+        df, pending = cache.df, list(cache.pending)
+        return {
+            "hits": cache.hits,
+            "misses": cache.misses,
+            "rows": 0 if df is None else len(df) + sum(len(p) for p in pending),
+        }
+
+    def append_incident(self, record: Dict[str, Any]) -> int:
+        raise NotImplementedError
+
+    def update_incident(self, incident_id: int, fields: Dict[str, Any]):
+        raise NotImplementedError
+
+    def append_incidents(self, records: Union[pd.DataFrame, Iterable[Dict[str, Any]]]) -> List[int]:
+        """Добавить пакет записей одной записью в хранилище; возвращает выданные id."""
+        raise NotImplementedError
+
+    def load_locations(self) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def save_locations(self, df: pd.DataFrame):
+        raise NotImplementedError
+
+    # ---- Общие помощники ----
+    def _ensure_incidents_schema(self, df: pd.DataFrame) -> pd.DataFrame:
+        with METRICS.timer("storage.coerce", rows=len(df)):
+            return ensure_incidents_schema(df)
+
+    def _prepare_record(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        # Значения по умолчанию для новой записи
         record.setdefault("status", DEFAULT_STATUS)
         record.setdefault("resolved_at", pd.NaT)
         record.setdefault("comment", "")
+        return record
 
-        # Создаём DataFrame и записываем
-        new_row = pd.DataFrame([record])
-        df = pd.concat([df, new_row], ignore_index=True)
-        # Приведение типов/схемы перед записью
-        df = self._ensure_incidents_schema(df)
-        self._write_sheet(INCIDENT_SHEET, df)
+    def _prepare_batch(self, records: Union[pd.DataFrame, Iterable[Dict[str, Any]]],
+                       existing_ids: pd.Series, reserved_max: int = 0) -> pd.DataFrame:
+        """Пакет записей → типизированный фрейм с id (векторно).
 
-    def update_incident(self, incident_id: int, fields: Dict[str, Any]):
-        df = self.load_incidents()
+        Записи без id получают id одним блоком после наибольшего известного
+        (reserved_max — наибольший id, занятый вне existing_ids, например в архиве).
+        Ошибки всех записей собираются в один ValueError (номера записей с 1).
+        """
+        raw = records.copy() if isinstance(records, pd.DataFrame) else pd.DataFrame(list(records))
+        raw = raw.reset_index(drop=True)
+        for c in INCIDENT_COLUMNS:
+            if c not in raw.columns:
+                raw[c] = pd.NA
+        raw = raw[INCIDENT_COLUMNS]
+        blank = {c: raw[c].isna() | (raw[c].astype(str).str.strip() == "") for c in INCIDENT_COLUMNS}
+        # Полностью пустые строки файла записями не считаются
+        empty = pd.concat(blank.values(), axis=1).all(axis=1)
+        raw, blank = raw[~empty].reset_index(drop=True), {c: b[~empty].reset_index(drop=True) for c, b in blank.items()}
+        if raw.empty:
+            return ensure_incidents_schema(raw)
+        raw["status"] = raw["status"].where(~blank["status"], DEFAULT_STATUS)
+        raw["comment"] = raw["comment"].where(~blank["comment"], "")
+
+        batch = ensure_incidents_schema(raw.copy())
+        errors = []
+
+        def check(bad: pd.Series, what: str):
+            if bad.any():
+                nums = (np.flatnonzero(bad.to_numpy()) + 1).tolist()
+                more = f" и ещё {len(nums) - 10}" if len(nums) > 10 else ""
+                errors.append(f"{what}: записи {', '.join(map(str, nums[:10]))}{more}")
+
+        check(blank["date"], "Не указана дата")
+        check(blank["description"], "Пустое описание")
+        for c, what in (("date", "Неверная дата"), ("time", "Неверное время"),
+                        ("resolved_at", "Неверное время закрытия"), ("id", "Неверный id")):
+            check(~blank[c] & batch[c].isna(), what)
+
+        ids = batch["id"]
+        given = ids.dropna()
+        check(ids.notna() & ids.duplicated(keep=False), "Повторяющийся id")
+        check(ids.isin(existing_ids.dropna()).fillna(False), "id уже есть в реестре")
+        if errors:
+            raise ValueError("Записи не импортированы:\n" + "\n".join(errors))
+
+        # id одним блоком: без повторов с реестром и с явными id пакета
+        missing = ids.isna().to_numpy()
+        if missing.any():
+            known = existing_ids.dropna()
+            start = max(int(known.max()) if len(known) else 0,
+                        int(given.max()) if len(given) else 0, reserved_max) + 1
+            ids = ids.copy()
+            ids[missing] = np.arange(start, start + int(missing.sum()))
+            batch["id"] = ids
+        return batch
+
+    def _parse_field(self, key: str, v: Any) -> Any:
+        # Разбор значения поля (строки из UI/журнала, объекты Python) в тип схемы;
+        # неразборчивое значение — ValueError, а не молчаливый NaT
+        if key == "resolved_at":
+            # допускаем None/пусто для очистки
+            if v is None or v == "" or v is pd.NaT:
+                return pd.NaT
+            # поддержка строки "ДД.ММ.ГГГГ ЧЧ:ММ"
+            if isinstance(v, str):
+                try:
+                    return pd.Timestamp(datetime.strptime(v, "%d.%m.%Y %H:%M"))
+                except ValueError:
+                    # альтернативный ISO
+                    ts = pd.to_datetime(v, errors="coerce")
+                    if pd.isna(ts):
+                        raise ValueError(f"Неверное время закрытия «{v}»: нужно ДД.ММ.ГГГГ ЧЧ:ММ.")
+                    return ts
+            return pd.Timestamp(v)
+        if key == "date":
+            if v is None or v == "" or v is pd.NaT:
+                return pd.NaT
+            if isinstance(v, str):
+                try:
+                    return pd.Timestamp(datetime.strptime(v, "%d.%m.%Y"))
+                except ValueError:
+                    ts = pd.to_datetime(v, errors="coerce")
+                    if pd.isna(ts):
+                        raise ValueError(f"Неверная дата «{v}»: нужно ДД.ММ.ГГГГ.")
+                    return ts.normalize()
+            return pd.Timestamp(v).normalize()
+        if key == "time":
+            if v is None or v == "":
+                return pd.NaT
+            if isinstance(v, time):
+                return pd.Timedelta(hours=v.hour, minutes=v.minute, seconds=v.second)
+            if isinstance(v, str):
+                td = _parse_times(pd.Series([v])).iloc[0]
+                if pd.isna(td):
+                    raise ValueError(f"Неверное время «{v}»: нужно ЧЧ:ММ.")
+                return td
+            return pd.Timedelta(v)
+        if key in CATEGORICAL_COLUMNS or key in TEXT_COLUMNS:
+            return "" if v is None or (not isinstance(v, str) and pd.isna(v)) else str(v)
+        return v
+
+    def _set_field(self, df: pd.DataFrame, mask, key: str, v: Any):
+        v = self._parse_field(key, v)
+        col = df[key]
+        if isinstance(col.dtype, pd.CategoricalDtype) and v not in col.cat.categories:
+            df[key] = col.cat.add_categories([v])
+        df.loc[mask, key] = v
+
+    def _check_fields(self, fields: Dict[str, Any]):
+        unknown = [k for k in fields if k not in INCIDENT_COLUMNS or k == "id"]
+        if unknown:
+            raise ValueError(f"Неизвестные поля инцидента: {', '.join(unknown)}")
+
+    def _apply_fields(self, df: pd.DataFrame, incident_id: int, fields: Dict[str, Any]) -> pd.DataFrame:
+        # Правка на месте: значения разбираются в типы схемы, остальные строки не приводятся
         if df.empty:
             raise ValueError("Реестр инцидентов пуст.")
         mask = df["id"] == incident_id
         if not mask.any():
             raise ValueError(f"Инцидент id={incident_id} не найден.")
-
         for k, v in fields.items():
-            if k == "resolved_at":
-                # допускаем None/пусто для очистки
-                if v in (None, "", pd.NaT):
-                    df.loc[mask, "resolved_at"] = pd.NaT
-                else:
-                    # поддержка строки "ДД.ММ.ГГГГ ЧЧ:ММ"
-                    if isinstance(v, str):
-                        try:
-                            v_parsed = datetime.strptime(v, "%d.%m.%Y %H:%M")
-                        except ValueError:
-                            # альтернативный ISO
-                            v_parsed = pd.to_datetime(v, errors="coerce")
-                        df.loc[mask, "resolved_at"] = v_parsed
-                    else:
-                        df.loc[mask, "resolved_at"] = v
-            elif k in ("date",):
-                if isinstance(v, str) and v:
-                    try:
-                        df.loc[mask, "date"] = datetime.strptime(v, "%d.%m.%Y").date()
-                    except ValueError:
-                        df.loc[mask, "date"] = pd.to_datetime(v, errors="coerce").date()
-                else:
-                    df.loc[mask, "date"] = v
-            elif k in ("time",):
-                if isinstance(v, str) and v:
-                    try:
-                        df.loc[mask, "time"] = datetime.strptime(v, "%H:%M").time()
-                    except ValueError:
-                        df.loc[mask, "time"] = pd.to_datetime(v, errors="coerce").time()
-                else:
-                    df.loc[mask, "time"] = v
-            else:
-                df.loc[mask, k] = v
-
-        df = self._ensure_incidents_schema(df)
-        self._write_sheet(INCIDENT_SHEET, df)
-
-    # ---- Locations ----
-    def load_locations(self) -> pd.DataFrame:
-        if not self.path.exists():
-            self._create_empty()
-        try:
-            df = pd.read_excel(self.path, sheet_name=LOCATIONS_SHEET, engine="openpyxl")
-        except ValueError:
-            # если листа нет — создадим
-            df = pd.DataFrame(columns=["location", "address"])
-            self._write_sheet(LOCATIONS_SHEET, df)
+            self._set_field(df, mask, k, v)
+        return df
 
+    def _clean_locations(self, df: pd.DataFrame) -> pd.DataFrame:
         # Приведение типов/колонок
-        for c in ["location", "address"]:
+        for c in LOCATION_COLUMNS:
             if c not in df.columns:
                 df[c] = ""
-        df = df[["location", "address"]]
+        df = df[LOCATION_COLUMNS].copy()
         df["location"] = df["location"].fillna("").astype(str)
         df["address"] = df["address"].fillna("").astype(str)
         return df
 
-    def save_locations(self, df: pd.DataFrame):
+    def _validate_locations(self, df: pd.DataFrame) -> pd.DataFrame:
         # Оставляем только нужные колонки
         if "location" not in df.columns or "address" not in df.columns:
             raise ValueError("Таблица локаций должна содержать колонки: location, address")
-        clean = df[["location", "address"]].copy()
+        clean = df[LOCATION_COLUMNS].copy()
         # Удалим пустые строки
         clean = clean[(clean["location"].str.strip() != "") & (clean["address"].str.strip() != "")]
-        self._write_sheet(LOCATIONS_SHEET, clean)
+        return clean
+
+    # ---- Справочник в памяти ----
+    def _directory_key(self) -> Tuple:
+        # Ключ источника справочника; по умолчанию — ключ реестра
+        return self._source_key()
+
+    def directory(self) -> Dict[str, List[str]]:
+        """Локация → отсортированные адреса. Читается из хранилища один раз и
+        перечитывается после изменения источника (не менять результат)."""
+        cache = self._cache
+        with cache.lock:
+            key = self._directory_key()
+            if cache.directory is None or cache.directory_key != key:
+                cache.directory = _build_directory(self.load_locations())
+                cache.directory_key = key
+            return cache.directory
+
+    def _store_directory(self, df: pd.DataFrame):
+        # После собственной записи справочника: новое состояние без перечитывания; под cache.lock
+        cache = self._cache
+        cache.directory = _build_directory(df)
+        cache.directory_key = self._directory_key()
 
     def get_locations(self) -> List[str]:
-        df = self.load_locations()
-        locs = sorted(df["location"].dropna().unique().tolist())
-        return locs
+        return list(self.directory())
 
     def get_addresses(self, location: str) -> List[str]:
-        df = self.load_locations()
         if not location:
             return []
-        subset = df[df["location"] == location]
-        addrs = sorted(subset["address"].dropna().unique().tolist())
-        return addrs
+        return list(self.directory().get(location, []))
+
+    def move_to_archive(self) -> int:
+        # Архив есть только у движка Excel
+        return 0
+
+    def close(self):
+        pass
+
+def _build_directory(df: pd.DataFrame) -> Dict[str, List[str]]:
+    return {
+        loc: sorted(set(addrs.dropna()))
+        for loc, addrs in df.dropna(subset=["location"]).groupby("location", sort=True)["address"]
+    }
+
+def _journal_value(v: Any) -> Any:
+    # Значение поля → JSON (даты/время строками ISO)
+    if v is None or v is pd.NaT or v is pd.NA:
+        return None
+    if isinstance(v, float) and pd.isna(v):
+        return None
+    if isinstance(v, (pd.Timestamp, datetime)):
+        return v.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(v, pd.Timedelta):
+        return as_time(v).strftime("%H:%M:%S")
+    if isinstance(v, (date, time)):
+        return v.isoformat()
+    if hasattr(v, "item"):
+        return v.item()
+    return v
+
+class IncidentStorage(StorageEngine):
+    """Хранилище в книге Excel (исходный формат реестра).
+
+    В режиме журнала (journal=True) каждая вставка/правка дописывается одной
+    строкой в файл <книга>.journal.jsonl с fsync, а книга перезаписывается
+    целиком только при уплотнении (compact) — через временный файл и os.replace.
+    Без журнала оставшийся файл журнала переносится в книгу при открытии,
+    а каждая запись книги его удаляет.
+
+    Если установлен pyarrow и snapshot=True, рядом с книгой хранится снимок
+    <книга>.snapshot.arrow (Arrow IPC без сжатия, читается через memory map).
+    Снимок помечен mtime/размером книги и используется вместо разбора xlsx,
+    пока книга не изменилась.
+
+    Книгу могут открывать несколько рабочих мест (общая папка): чтение и
+    запись идут под межпроцессной блокировкой <книга>.lock, а запись
+    перечитывает реестр под ней, так что id выдаются без повторов и чужие
+    вставки не теряются. Занятая блокировка ждёт до lock_timeout секунд.
+
+    При archive_days > 0 закрытые инциденты старше archive_days дней
+    переносятся в помесячный архив (archive.ArchivePartitions): при открытии,
+    при уплотнении журнала, при закрытии старого инцидента и при выходе.
+    В книге остаются открытые и недавние записи; архивные месяцы читаются,
+    когда их захватывает диапазон дат запроса или запрос явно просит весь
+    архив (IncidentQuery.archive).
+    """
+
+    def __init__(self, excel_path: str, journal: bool = False, compact_every: int = 500,
+                 snapshot: bool = True, lock_timeout: float = 30.0, archive_days: int = 0):
+        super().__init__()
+        self.path = Path(excel_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.journal = journal
+        self.journal_path = self.path.with_name(self.path.name + JOURNAL_SUFFIX)
+        self.compact_every = compact_every
+        self.snapshot = snapshot and pa is not None
+        self.snapshot_path = self.path.with_name(self.path.name + SNAPSHOT_SUFFIX)
+        self._journal_entries: Optional[int] = None
+        self._file_lock = shared_file_lock(self.path.with_name(self.path.name + LOCK_SUFFIX), lock_timeout)
+        if not self.path.exists():
+            self._create_empty()
+        self.archive_days = archive_days
+        if archive_days:
+            from archive import ArchivePartitions
+            self.archive = ArchivePartitions(self.path, snapshot=self.snapshot)
+            self.move_to_archive()
+        if not journal:
+            # журнал, оставшийся после работы с journal: true, переносим в книгу
+            self.compact()
+
+    def _create_empty(self):
+        with self._file_lock:
+            # другое рабочее место могло создать книгу, пока ждали блокировку
+            if self.path.exists():
+                return
+            # Пустые листы
+            inc_df = pd.DataFrame(columns=INCIDENT_COLUMNS)
+            loc_df = pd.DataFrame(columns=LOCATION_COLUMNS)
+            self._replace_workbook(inc_df, loc_df)
+
+    def _replace_workbook(self, inc_df: pd.DataFrame, loc_df: pd.DataFrame):
+        # Новая книга пишется рядом и подменяет старую атомарно:
+        # читатели без блокировки (Excel, резервное копирование) не видят её недописанной
+        self._store_directory(loc_df)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with METRICS.timer("storage.write_workbook", rows=len(inc_df)) as m:
+            with pd.ExcelWriter(tmp, engine="openpyxl") as w:
+                inc_df.to_excel(w, sheet_name=INCIDENT_SHEET, index=False)
+                loc_df.to_excel(w, sheet_name=LOCATIONS_SHEET, index=False)
+            with open(tmp, "rb") as f:
+                os.fsync(f.fileno())
+            m.bytes = tmp.stat().st_size
+        # книга может быть открыта в Excel/антивирусом — подменяем с повторами
+        retry_io(lambda: os.replace(tmp, self.path))
+        self._cache.directory_key = self._directory_key()
+
+    # Универсальная запись одного листа без перезаписи других
+    def _write_sheet(self, sheet_name: str, df: pd.DataFrame):
+        if not self.path.exists():
+            # если файла нет — создаём и пишем только этот лист
+            with pd.ExcelWriter(self.path, engine="openpyxl") as w:
+                df.to_excel(w, sheet_name=sheet_name, index=False)
+            return
+        # справочник в памяти переживает запись листа инцидентов (лист локаций тот же)
+        cache = self._cache
+        directory_fresh = cache.directory is not None and cache.directory_key == self._directory_key()
+        # если файл есть — заменяем только нужный лист
+        def write():
+            with pd.ExcelWriter(self.path, engine="openpyxl", mode="a", if_sheet_exists="replace") as w:
+                df.to_excel(w, sheet_name=sheet_name, index=False)
+        with METRICS.timer("storage.write_sheet", rows=len(df)) as m:
+            retry_io(write)
+            m.bytes = self.path.stat().st_size
+        if sheet_name == LOCATIONS_SHEET:
+            self._store_directory(self._clean_locations(df.copy()))
+        elif directory_fresh:
+            cache.directory_key = self._directory_key()
+
+    # ---- Incidents ----
+    def _source_key(self) -> Tuple:
+        if not self.path.exists():
+            self._create_empty()
+        st = self.path.stat()
+        key = (st.st_mtime_ns, st.st_size)
+        if self.journal_path.exists():
+            jst = self.journal_path.stat()
+            key += (jst.st_mtime_ns, jst.st_size)
+        return key
+
+    def _read_incidents(self) -> pd.DataFrame:
+        # под блокировкой: другое рабочее место не перепишет книгу/журнал посреди чтения
+        with METRICS.timer("storage.read") as m, self._file_lock:
+            df = self._read_snapshot()
+            if df is None:
+                with METRICS.timer("storage.parse_xlsx") as p:
+                    df = retry_io(lambda: pd.read_excel(self.path, sheet_name=INCIDENT_SHEET, engine="openpyxl"))
+                    p.rows = len(df)
+                df = self._ensure_incidents_schema(df)
+                self._write_snapshot(df)
+            df = self._replay_journal(df)
+            m.rows = len(df)
+            return df
+
+    def _directory_key(self) -> Tuple:
+        # Справочник лежит в книге; журнал его не касается
+        if not self.path.exists():
+            return ()
+        st = self.path.stat()
+        return (st.st_mtime_ns, st.st_size)
+
+    # ---- Снимок ----
+    def _workbook_key(self) -> str:
+        st = self.path.stat()
+        return f"{st.st_mtime_ns}:{st.st_size}"
+
+    def _read_snapshot(self) -> Optional[pd.DataFrame]:
+        if not self.snapshot or not self.snapshot_path.exists():
+            return None
+        try:
+            with METRICS.timer("storage.read_snapshot") as m:
+                table = feather.read_table(self.snapshot_path, memory_map=True)
+                meta = table.schema.metadata or {}
+                if meta.get(b"workbook_key", b"").decode() != self._workbook_key():
+                    return None
+                df = table.to_pandas()
+                m.rows = len(df)
+        except Exception:
+            # повреждённый/чужой снимок — просто читаем книгу
+            return None
+        return self._ensure_incidents_schema(df)
+
+    def _restamp_snapshot(self, old_key: str):
+        # Книга изменилась без изменения инцидентов (лист локаций): переносим метку
+        if not self.snapshot or not self.snapshot_path.exists():
+            return
+        try:
+            table = feather.read_table(self.snapshot_path)
+            meta = table.schema.metadata or {}
+            if meta.get(b"workbook_key", b"").decode() != old_key:
+                return
+            table = table.replace_schema_metadata({**meta, b"workbook_key": self._workbook_key().encode()})
+            tmp = self.snapshot_path.with_name(self.snapshot_path.name + ".tmp")
+            feather.write_feather(table, tmp, compression="uncompressed")
+            os.replace(tmp, self.snapshot_path)
+        except Exception:
+            pass
+
+    def _write_snapshot(self, df: pd.DataFrame):
+        # Снимок отражает только книгу (без журнала), поэтому пишется после записи книги
+        if not self.snapshot:
+            return
+        try:
+            # типы схемы (datetime64/timedelta64/категории) переносятся в Arrow как есть
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            table = table.replace_schema_metadata({
+                **(table.schema.metadata or {}),
+                b"workbook_key": self._workbook_key().encode(),
+            })
+            tmp = self.snapshot_path.with_name(self.snapshot_path.name + ".tmp")
+            with METRICS.timer("storage.write_snapshot", rows=len(df)) as m:
+                feather.write_feather(table, tmp, compression="uncompressed")
+                m.bytes = tmp.stat().st_size
+            os.replace(tmp, self.snapshot_path)
+        except Exception:
+            # снимок — лишь ускоритель; при ошибке удаляем устаревший файл
+            try:
+                self.snapshot_path.unlink()
+            except OSError:
+                pass
+
+    # ---- Журнал ----
+    def _read_journal(self) -> List[Dict[str, Any]]:
+        if not self.journal_path.exists():
+            return []
+        entries = []
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # недописанная строка после сбоя — пропускаем
+                    continue
+        return entries
+
+    def _replay_journal(self, df: pd.DataFrame) -> pd.DataFrame:
+        # Журнал накладывается поверх книги; повторное применение безопасно:
+        # вставка с уже существующим id пропускается, правка просто повторяется
+        with METRICS.timer("storage.read_journal") as m:
+            entries = self._read_journal()
+            m.rows = len(entries)
+        if not entries:
+            return df
+        known = set(df["id"].dropna().astype(int).tolist())
+        inserted: Dict[int, Dict[str, Any]] = {}
+        for e in entries:
+            if e.get("op") == "insert":
+                row = e.get("row") or {}
+                rid = row.get("id")
+                if rid is None or int(rid) in known or int(rid) in inserted:
+                    continue
+                inserted[int(rid)] = dict(row)
+            elif e.get("op") == "update":
+                rid = int(e.get("id"))
+                fields = e.get("fields") or {}
+                if rid in inserted:
+                    inserted[rid].update(fields)
+                elif rid in known:
+                    mask = df["id"] == rid
+                    for k, v in fields.items():
+                        self._set_field(df, mask, k, v)
+        if inserted:
+            df = concat_incidents([df, pd.DataFrame(list(inserted.values()))])
+        return self._ensure_incidents_schema(df)
+
+    def _journal_append(self, entry: Dict[str, Any]):
+        self._journal_append_many([entry])
+
+    def _journal_append_many(self, entries: List[Dict[str, Any]]):
+        # Пакет — одна запись в файл и один fsync
+        text = "".join(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in entries)
+        with METRICS.timer("storage.journal_append", rows=len(entries)) as m:
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            m.bytes = len(text.encode("utf-8"))
+
+    def journal_size(self) -> int:
+        return len(self._read_journal())
+
+    def _write_incidents(self, df: pd.DataFrame):
+        # Запись без журнала: df уже включает журнал (перечитан под блокировкой),
+        # поэтому журнал удаляется — иначе его правки легли бы поверх новых
+        self._write_sheet(INCIDENT_SHEET, to_excel_frame(df))
+        self._write_snapshot(df)
+        if self.journal_path.exists():
+            self.journal_path.unlink()
+        self._journal_entries = 0
+
+    @METRICS.timed("storage.compact")
+    def compact(self):
+        """Перенести журнал в книгу одной записью и очистить журнал."""
+        with self._cache.lock, self._file_lock:
+            if not self.journal_path.exists():
+                return
+            # перенос в архив сам перезаписывает книгу и очищает журнал
+            if self.move_to_archive():
+                return
+            df = self.load_incidents()
+            self._replace_workbook(to_excel_frame(df), self._read_locations_sheet())
+            self._write_snapshot(df)
+            self.journal_path.unlink()
+            self._journal_entries = 0
+            self._cache_store(df)
+
+    def _read_locations_sheet(self) -> pd.DataFrame:
+        try:
+            loc = pd.read_excel(self.path, sheet_name=LOCATIONS_SHEET, engine="openpyxl")
+        except ValueError:
+            loc = pd.DataFrame(columns=LOCATION_COLUMNS)
+        return self._clean_locations(loc)
+
+    def _archive_cutoff(self) -> pd.Timestamp:
+        return pd.Timestamp(date.today()) - pd.Timedelta(days=self.archive_days)
+
+    @METRICS.timed("storage.move_to_archive")
+    def move_to_archive(self) -> int:
+        """Перенести закрытые инциденты старше archive_days в архив; возвращает число записей."""
+        if self.archive is None:
+            return 0
+        from archive import archivable
+        with self._cache.lock, self._file_lock:
+            current = self._cached_df()
+            mask = archivable(current, self._archive_cutoff())
+            if not mask.any():
+                return 0
+            # Сначала архив, потом книга: после сбоя между ними записи окажутся
+            # в обоих местах, и следующий перенос перезапишет их в архиве
+            self.archive.add(current[mask])
+            hot = current[~mask].reset_index(drop=True)
+            self._replace_workbook(to_excel_frame(hot), self._read_locations_sheet())
+            self._write_snapshot(hot)
+            if self.journal_path.exists():
+                self.journal_path.unlink()
+            self._journal_entries = 0
+            self._cache_store(hot)
+            self._cache.reset_derived()
+            return int(mask.sum())
+
+    def _after_journal_write(self, count: int = 1):
+        if self._journal_entries is None:
+            self._journal_entries = self.journal_size()
+        else:
+            self._journal_entries += count
+        if self.compact_every and self._journal_entries >= self.compact_every:
+            self.compact()
+
+    def close(self):
+        # При закрытии приложения переносим накопленный журнал в книгу
+        # (и постаревшие закрытые инциденты — в архив)
+        self.move_to_archive()
+        if self.journal and self.journal_path.exists():
+            self.compact()
+
+    def _next_id(self, df: pd.DataFrame) -> int:
+        # Вызывается под файловой блокировкой по только что перечитанному реестру,
+        # поэтому max(id)+1 не совпадёт с id другого рабочего места;
+        # id архивных записей тоже заняты
+        top = self.archive.max_id() if self.archive is not None else 0
+        if not (df.empty or df["id"].isna().all()):
+            top = max(top, int(df["id"].max()))
+        return top + 1
+
+    def _id_taken(self, df: pd.DataFrame, incident_id: int) -> bool:
+        if (df["id"] == incident_id).any():
+            return True
+        return self.archive is not None and self.archive.find(incident_id) is not None
+
+    @METRICS.timed("storage.append")
+    def append_incident(self, record: Dict[str, Any]) -> int:
+        # Порядок блокировок везде один: кэш процесса, затем файл
+        with self._cache.lock, self._file_lock:
+            current = self._cached_df()
+            if pd.isna(record.get("id")) or record.get("id") is None:
+                record["id"] = self._next_id(current)
+            elif self._id_taken(current, int(record["id"])):
+                # иначе вставка молча потерялась бы при чтении журнала
+                raise ValueError(f"Инцидент id={record['id']} уже существует.")
+            self._prepare_record(record)
+
+            # Новая строка приводится к схеме отдельно и дописывается к типизированному реестру
+            new_row = ensure_incidents_schema(pd.DataFrame([record]))
+            row = row_dict(new_row, int(record["id"]))
+            df = append_rows(current, new_row)
+            if self.journal:
+                self._journal_append({"op": "insert", "row": {k: _journal_value(row.get(k)) for k in INCIDENT_COLUMNS}})
+            else:
+                self._write_incidents(df)
+            self._cache_store(df, (None, row))
+            if self.journal:
+                self._after_journal_write()
+        self._emit("inserted", record["id"], row)
+        return int(record["id"])
+
+    @METRICS.timed("storage.append_many", rows=len)
+    def append_incidents(self, records: Union[pd.DataFrame, Iterable[Dict[str, Any]]]) -> List[int]:
+        with self._cache.lock, self._file_lock:
+            current = self._cached_df()
+            reserved = self.archive.max_id() if self.archive is not None else 0
+            batch = self._prepare_batch(records, current["id"], reserved)
+            if batch.empty:
+                return []
+            if reserved:
+                taken = [i for i in batch["id"][batch["id"] <= reserved].astype(int) if self._id_taken(current, i)]
+                if taken:
+                    raise ValueError(f"Записи не импортированы:\nid уже есть в архиве: {', '.join(map(str, taken[:10]))}")
+            df = append_rows(current, batch)
+            if self.journal:
+                self._journal_append_many([
+                    {"op": "insert", "row": {k: _journal_value(v) for k, v in r.items()}}
+                    for r in batch.to_dict("records")
+                ])
+            else:
+                self._write_incidents(df)
+            self._cache_store(df)
+            # сводку и индексы дешевле перестроить по всему реестру, чем обновлять построчно
+            self._cache.reset_derived()
+            if self.journal:
+                self._after_journal_write(len(batch))
+        ids = batch["id"].astype(int).tolist()
+        self._emit("imported", ids[0], {"count": len(ids)})
+        return ids
+
+    @METRICS.timed("storage.update")
+    def update_incident(self, incident_id: int, fields: Dict[str, Any]):
+        self._check_fields(fields)
+        with self._cache.lock, self._file_lock:
+            current = self._cached_df()
+            old = row_dict(current, incident_id)
+            if old is None and self.archive is not None:
+                month = self.archive.find(int(incident_id))
+                if month is not None:
+                    row = self._update_archived(month, incident_id, fields)
+                    self._emit("updated", incident_id, row)
+                    return
+            if old is None:
+                raise ValueError(f"Инцидент id={incident_id} не найден.")
+            # Разбор до записи: ошибка в значении не оставит правку наполовину
+            values = {k: self._parse_field(k, v) for k, v in fields.items()}
+            # Строка правится прямо в кэше, без копии реестра; при ошибке записи — откат
+            df = self._apply_fields(current, incident_id, values)
+            try:
+                if self.journal:
+                    payload = {k: _journal_value(v) for k, v in values.items()}
+                    self._journal_append({"op": "update", "id": int(incident_id), "fields": payload})
+                else:
+                    self._write_incidents(df)
+            except BaseException:
+                self._apply_fields(df, incident_id, {k: old[k] for k in values})
+                raise
+            row = {**old, **values}
+            self._cache_store(df, (old, row))
+            if self.journal:
+                self._after_journal_write()
+            # закрытие давнего инцидента сразу отправляет его в архив
+            if self.archive is not None and row is not None and row.get("status") == CLOSED_STATUS \
+                    and not pd.isna(row.get("date")) and row["date"] < self._archive_cutoff():
+                self.move_to_archive()
+        self._emit("updated", incident_id, row)
+
+    def _update_archived(self, month: str, incident_id: int, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # Правка архивной записи; вызывать под блокировками записи
+        from archive import archivable, month_of
+        mdf = self._apply_fields(self.archive.load(month).copy(), incident_id, fields)
+        mask = (mdf["id"] == incident_id).to_numpy(dtype=bool, na_value=False)
+        moved = mdf[mask]
+        row = row_dict(mdf, incident_id)
+        if archivable(moved, self._archive_cutoff()).all() and month_of(row["date"]) == month:
+            self.archive.write(month, mdf)
+            return row
+        if archivable(moved, self._archive_cutoff()).all():
+            # дата перенесена в другой месяц
+            self.archive.add(moved)
+        else:
+            # инцидент снова открыт (или дата стала недавней) — возвращаем в рабочий реестр;
+            # сначала вставка, потом удаление из архива: при сбое запись не пропадёт
+            current = self._cached_df()
+            df = append_rows(current, moved)
+            if self.journal:
+                self._journal_append({"op": "insert", "row": {k: _journal_value(row.get(k)) for k in INCIDENT_COLUMNS}})
+            else:
+                self._write_incidents(df)
+            self._cache_store(df, (None, row))
+        self.archive.write(month, mdf[~mask].reset_index(drop=True))
+        if self.journal and not archivable(moved, self._archive_cutoff()).all():
+            self._after_journal_write()
+        return row
+
+    # ---- Locations ----
+    def load_locations(self) -> pd.DataFrame:
+        # под той же блокировкой, что и запись книги (запись может идти из рабочего потока)
+        with self._cache.lock, self._file_lock:
+            if not self.path.exists():
+                self._create_empty()
+            try:
+                df = retry_io(lambda: pd.read_excel(self.path, sheet_name=LOCATIONS_SHEET, engine="openpyxl"))
+            except ValueError:
+                # если листа нет — создадим
+                df = pd.DataFrame(columns=LOCATION_COLUMNS)
+                self._write_sheet(LOCATIONS_SHEET, df)
+        return self._clean_locations(df)
+
+    def save_locations(self, df: pd.DataFrame):
+        clean = self._validate_locations(df)
+        with self._cache.lock, self._file_lock:
+            # Запись листа меняет mtime книги; инциденты при этом не меняются
+            fresh = self._cache_fresh()
+            old_key = self._workbook_key()
+            self._write_sheet(LOCATIONS_SHEET, clean)
+            self._restamp_snapshot(old_key)
+            if fresh:
+                self._cache_store(self._cache.frame())
+
+def read_incidents_file(path: str) -> pd.DataFrame:
+    """Инциденты из CSV/XLSX для импорта (колонки — как в выгрузке реестра), без приведения типов."""
+    p = Path(path)
+    suffix = p.suffix.lower()
+    if suffix == ".csv":
+        # Excel с русской локалью сохраняет CSV через «;»
+        with open(p, "r", encoding="utf-8-sig") as f:
+            head = f.readline()
+        sep = ";" if head.count(";") > head.count(",") else ","
+        df = pd.read_csv(p, sep=sep, encoding="utf-8-sig", dtype=str, keep_default_na=False)
+    elif suffix in (".xlsx", ".xlsm"):
+        book = pd.ExcelFile(p, engine="openpyxl")
+        df = book.parse(INCIDENT_SHEET if INCIDENT_SHEET in book.sheet_names else 0)
+    else:
+        raise ValueError(f"Неподдерживаемый формат файла: {p.name} (нужен .csv или .xlsx)")
+    df.columns = [str(c).strip() for c in df.columns]
+    if not set(df.columns) & set(INCIDENT_COLUMNS):
+        raise ValueError(f"В файле нет колонок реестра ({', '.join(INCIDENT_COLUMNS)}).")
+    return df
+
+def create_storage(cfg: Dict[str, Any]) -> StorageEngine:
+    """Создать движок хранилища по секции storage конфигурации."""
+    st = cfg.get("storage", {})
+    engine = (st.get("engine") or "excel").lower()
+    if engine == "excel":
+        return IncidentStorage(
+            st["excel_path"],
+            journal=bool(st.get("journal", False)),
+            compact_every=int(st.get("journal_compact_every", 500)),
+            snapshot=bool(st.get("snapshot", True)),
+            lock_timeout=float(st.get("lock_timeout", 30.0)),
+            archive_days=int(st.get("archive_days", 0) or 0),
+        )
+    if engine == "sqlite":
+        from sqlite_storage import SqliteStorage
+        return SqliteStorage(st["sqlite_path"], import_from=st.get("excel_path"),
+                             lock_timeout=float(st.get("lock_timeout", 30.0)))
+    raise ValueError(f"Неизвестный движок хранилища: {engine}")
@@ -0,0 +1,125 @@
+# tasks.py
+import queue
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable, Dict, List, Optional
+
+class TaskRunner:
+    """Фоновое выполнение операций с файлами и сетью для Tk-приложения.
+
+    Функции выполняются в пуле потоков; результаты и ошибки складываются в
+    очередь, которую главный цикл Tk разбирает через after(), поэтому
+    колбэки on_done/on_error всегда вызываются в потоке интерфейса.
+    Задачи с одинаковым key не копятся: пока задача выполняется, повторные
+    запросы схлопываются в один перезапуск с последними аргументами.
+    """
+
+    def __init__(self, root, max_workers: int = 2, poll_ms: int = 50):
+        self.root = root
+        self.poll_ms = poll_ms
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="io")
+        self._results: "queue.Queue[Callable[[], None]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._running: Dict[str, Future] = {}
+        self._rerun: Dict[str, tuple] = {}
+        self._busy: List[str] = []
+        self._busy_listeners: List[Callable[[List[str]], None]] = []
+        self._closed = False
+        self.root.after(self.poll_ms, self._poll)
+
+    # ---- Публичный API ----
+    def submit(self, fn: Callable[..., Any], *args,
+               on_done: Optional[Callable[[Any], None]] = None,
+               on_error: Optional[Callable[[BaseException], None]] = None,
+               key: Optional[str] = None, label: str = "") -> Optional[Future]:
+        if self._closed:
+            return None
+        if key is not None:
+            with self._lock:
+                if key in self._running:
+                    # уже выполняется — запомним только последний запрос
+                    self._rerun[key] = (fn, args, on_done, on_error, label)
+                    return self._running[key]
+        return self._start(fn, args, on_done, on_error, key, label)
+
+    def call_in_ui(self, fn: Callable[..., None], *args):
+        """Выполнить fn(*args) в потоке интерфейса (можно вызывать из любого потока)."""
+        self._results.put(lambda: fn(*args))
+
+    def ui_callback(self, fn: Callable[..., None]) -> Callable[..., None]:
+        """Обёртка для подписок: вызов из рабочего потока переносится в поток Tk."""
+        def wrapper(*args):
+            self.call_in_ui(fn, *args)
+        return wrapper
+
+    def add_busy_listener(self, callback: Callable[[List[str]], None]):
+        self._busy_listeners.append(callback)
+
+    @property
+    def busy(self) -> bool:
+        return bool(self._busy)
+
+    def shutdown(self, wait: bool = True):
+        self._closed = True
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    # ---- Внутреннее ----
+    def _start(self, fn, args, on_done, on_error, key, label) -> Future:
+        self._busy.append(label)
+        self._notify_busy()
+        fut = self._executor.submit(fn, *args)
+        if key is not None:
+            with self._lock:
+                self._running[key] = fut
+
+        def done(f: Future):
+            self._results.put(lambda: self._finish(f, on_done, on_error, key, label))
+        fut.add_done_callback(done)
+        return fut
+
+    def _finish(self, fut: Future, on_done, on_error, key, label):
+        self._busy.remove(label)
+        self._notify_busy()
+        rerun = None
+        if key is not None:
+            with self._lock:
+                self._running.pop(key, None)
+                rerun = self._rerun.pop(key, None)
+        if rerun is not None:
+            # результат устарел — сразу запускаем последний запрос
+            fn, args, r_done, r_error, r_label = rerun
+            self._start(fn, args, r_done, r_error, key, r_label)
+            return
+        try:
+            result = fut.result()
+        except BaseException as e:
+            if on_error:
+                on_error(e)
+            return
+        if on_done:
+            on_done(result)
+
+    def _notify_busy(self):
+        for cb in list(self._busy_listeners):
+            cb(list(self._busy))
+
+    def _poll(self):
+        try:
+            while True:
+                try:
+                    cb = self._results.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    cb()
+                except Exception:
+                    # ошибка колбэка не должна останавливать разбор очереди
+                    traceback.print_exc()
+        finally:
+            if not self._closed:
+                try:
+                    self.root.after(self.poll_ms, self._poll)
+                except Exception:
+                    # окно уже уничтожено
+                    pass
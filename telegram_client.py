@@ -1,14 +1,59 @@
 # telegram_client.py
 import requests
-from typing import Union
+from typing import Optional, Union
+from metrics import METRICS
+
+API_URL = "https://api.telegram.org/bot{token}/{method}"
+TEXT_LIMIT = 4096      # длина текста sendMessage
+CAPTION_LIMIT = 1024   # длина подписи к документу
+
+class TelegramError(RuntimeError):
+    """Ошибка Bot API; retry_after задан для 429 Too Many Requests."""
+
+    def __init__(self, status: int, text: str, retry_after: Optional[float] = None):
+        super().__init__(f"Telegram API error: {status} {text}")
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        # 429 и ошибки сервера имеет смысл повторить, прочие 4xx — нет
+        return self.status == 429 or self.status >= 500
 
 class TelegramClient:
-    def __init__(self, token: str, chat_id: Union[int, str]):
+    def __init__(self, token: str, chat_id: Union[int, str], timeout: float = 10.0):
         self.token = token
         self.chat_id = chat_id
+        self.timeout = timeout
+        # одно соединение (keep-alive) на все запросы
+        self.session = requests.Session()
+
+    def _call(self, method: str, **kwargs) -> dict:
+        url = API_URL.format(token=self.token, method=method)
+        # сетевые ошибки и ответы не 200 считаются ошибками замера
+        with METRICS.timer(f"telegram.{method}"):
+            resp = self.session.post(url, timeout=self.timeout, **kwargs)
+            if resp.status_code != 200:
+                retry_after = None
+                try:
+                    retry_after = resp.json().get("parameters", {}).get("retry_after")
+                except ValueError:
+                    pass
+                raise TelegramError(resp.status_code, resp.text, retry_after)
+            return resp.json()
+
+    def send_message(self, text: str, chat_id: Union[int, str, None] = None, parse_mode: Optional[str] = None):
+        payload = {"chat_id": chat_id or self.chat_id, "text": text}
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        self._call("sendMessage", json=payload)
+
+    def send_document(self, filename: str, content: bytes, caption: str = "",
+                      chat_id: Union[int, str, None] = None):
+        data = {"chat_id": chat_id or self.chat_id}
+        if caption:
+            data["caption"] = caption[:CAPTION_LIMIT]
+        self._call("sendDocument", data=data, files={"document": (filename, content)})
 
-    def send_message(self, text: str):
-        url = f"https://api.telegram.org/bot{self.token}/sendMessage"
-        resp = requests.post(url, json={"chat_id": self.chat_id, "text": text})
-        if resp.status_code != 200:
-            raise RuntimeError(f"Telegram API error: {resp.status_code} {resp.text}")
+    def close(self):
+        self.session.close()
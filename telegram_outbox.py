@@ -0,0 +1,337 @@
+# telegram_outbox.py
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Union
+import requests
+from telegram_client import TelegramClient, TelegramError, TEXT_LIMIT
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id    TEXT NOT NULL,
+    text       TEXT NOT NULL,
+    mergeable  INTEGER NOT NULL DEFAULT 1,
+    created_at REAL NOT NULL,
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    next_at    REAL NOT NULL,
+    failed     INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_outbox_due ON outbox(failed, next_at);
+"""
+
+# Колонки, добавленные позже: документ (вложение) вместо текста, разметка текста,
+# захват отправителем (очередь делят окно, демон и разовые команды cli.py)
+MIGRATIONS = {
+    "filename": "ALTER TABLE outbox ADD COLUMN filename TEXT",
+    "document": "ALTER TABLE outbox ADD COLUMN document BLOB",
+    "parse_mode": "ALTER TABLE outbox ADD COLUMN parse_mode TEXT",
+    "claimed_until": "ALTER TABLE outbox ADD COLUMN claimed_until REAL NOT NULL DEFAULT 0",
+    "owner": "ALTER TABLE outbox ADD COLUMN owner TEXT",
+}
+
+CLAIM_TTL = 120.0   # сколько секунд захват держится, если отправитель упал посреди отправки
+
+class TelegramOutbox:
+    """Надёжная очередь исходящих сообщений Telegram.
+
+    Сообщения сначала записываются на диск (SQLite), затем фоновый поток
+    отправляет их через TelegramClient (один requests.Session). Учитываются
+    лимиты на чат (не чаще min_interval и не более per_minute в минуту) и
+    retry_after из ответа 429; сетевые ошибки и 5xx повторяются с
+    экспоненциальной задержкой. Подряд идущие короткие сообщения одного чата,
+    накопившиеся за merge_delay, склеиваются в одно.
+
+    Очередь на одном файле могут разбирать несколько процессов: перед
+    отправкой пачка захватывается одной транзакцией (claimed_until, owner),
+    и отправляет её только тот, кому захват удался.
+    """
+
+    def __init__(self, client: TelegramClient, queue_path: str,
+                 min_interval: float = 1.0, per_minute: int = 20,
+                 merge_delay: float = 2.0, max_attempts: int = 8,
+                 backoff_base: float = 2.0, backoff_max: float = 300.0):
+        self.client = client
+        self.path = Path(queue_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.min_interval = min_interval
+        self.per_minute = per_minute
+        self.merge_delay = merge_delay
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+            have = {r["name"] for r in self._conn.execute("PRAGMA table_info(outbox)")}
+            for col, sql in MIGRATIONS.items():
+                if col not in have:
+                    self._conn.execute(sql)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._sent_at: Dict[str, Deque[float]] = {}   # моменты отправки по чатам
+        self._blocked_until: Dict[str, float] = {}    # retry_after по чатам
+
+        self.sent = 0
+        self.merged = 0
+        self.last_latency: Optional[float] = None
+        self._latency_total = 0.0
+        self.last_error: Optional[str] = None
+        self._owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._errors = 0   # ошибок цикла отправки подряд — для паузы
+
+    # ---- Публичный API ----
+    def enqueue(self, text: str, chat_id: Union[int, str, None] = None, merge: bool = True,
+                parse_mode: Optional[str] = None) -> int:
+        """Поставить сообщение в очередь (сразу на диск); возвращает его номер."""
+        chat = str(chat_id or self.client.chat_id)
+        now = time.time()
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO outbox (chat_id, text, mergeable, created_at, next_at, parse_mode) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (chat, text, 1 if merge else 0, now, now, parse_mode),
+            )
+        self._wake.set()
+        return int(cur.lastrowid)
+
+    def enqueue_document(self, filename: str, content: bytes, caption: str = "",
+                         chat_id: Union[int, str, None] = None) -> int:
+        """Поставить в очередь файл; отправляется в общем порядке сообщений чата."""
+        chat = str(chat_id or self.client.chat_id)
+        now = time.time()
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO outbox (chat_id, text, mergeable, created_at, next_at, filename, document) "
+                "VALUES (?, ?, 0, ?, ?, ?, ?)",
+                (chat, caption, now, now, filename, sqlite3.Binary(content)),
+            )
+        self._wake.set()
+        return int(cur.lastrowid)
+
+    def enqueue_many(self, texts: List[str], chat_id: Union[int, str, None] = None,
+                     parse_mode: Optional[str] = None) -> List[int]:
+        """Поставить части одного текста подряд (без склейки с соседями)."""
+        chat = str(chat_id or self.client.chat_id)
+        now = time.time()
+        ids = []
+        # одна транзакция: чужое уведомление не вклинится между частями
+        with self._lock, self._conn:
+            for t in texts:
+                cur = self._conn.execute(
+                    "INSERT INTO outbox (chat_id, text, mergeable, created_at, next_at, parse_mode) "
+                    "VALUES (?, ?, 0, ?, ?, ?)",
+                    (chat, t, now, now, parse_mode),
+                )
+                ids.append(int(cur.lastrowid))
+        self._wake.set()
+        return ids
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="telegram-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox WHERE failed = 0").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            failed = self._conn.execute("SELECT COUNT(*) FROM outbox WHERE failed = 1").fetchone()[0]
+            oldest = self._conn.execute("SELECT MIN(created_at) FROM outbox WHERE failed = 0").fetchone()[0]
+        return {
+            "depth": self.depth(),
+            "failed": failed,
+            "sent": self.sent,
+            "merged": self.merged,
+            "oldest_age": None if oldest is None else time.time() - oldest,
+            "last_latency": self.last_latency,
+            "avg_latency": self._latency_total / self.sent if self.sent else None,
+            "last_error": self.last_error,
+        }
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Дождаться опустошения очереди (для CLI и остановки)."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.depth() == 0:
+                return True
+            self._wake.set()
+            time.sleep(0.1)
+        return self.depth() == 0
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            self._conn.close()
+
+    # ---- Фоновая отправка ----
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                delay = self._drain_once()
+                self._errors = 0
+            except Exception as e:
+                # очередь занята другим процессом, битая строка и т. п. — поток не должен умереть
+                self.last_error = f"{type(e).__name__}: {e}"
+                self._errors += 1
+                delay = min(self.backoff_max, self.backoff_base * (2 ** (self._errors - 1)))
+            self._wake.wait(timeout=delay)
+            self._wake.clear()
+
+    def _pending(self, now: float) -> List[sqlite3.Row]:
+        # захваченные другим отправителем строки пропускаем до истечения захвата
+        with self._lock:
+            return self._conn.execute(
+                "SELECT * FROM outbox WHERE failed = 0 AND claimed_until <= ? ORDER BY id", (now,)
+            ).fetchall()
+
+    def _claim(self, batch: List[sqlite3.Row], now: float) -> bool:
+        """Захватить пачку целиком; False — её уже взял (или отправил) другой процесс."""
+        ids = [m["id"] for m in batch]
+        marks = ", ".join("?" * len(ids))
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            cur = self._conn.execute(
+                f"UPDATE outbox SET claimed_until = ?, owner = ? "
+                f"WHERE id IN ({marks}) AND failed = 0 AND claimed_until <= ?",
+                [now + CLAIM_TTL, self._owner, *ids, now],
+            )
+            if cur.rowcount == len(ids):
+                return True
+            self._conn.rollback()
+        return False
+
+    def _release(self, batch: List[sqlite3.Row]):
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE outbox SET claimed_until = 0 WHERE id = ? AND owner = ?",
+                                   [(m["id"], self._owner) for m in batch])
+
+    def _chat_ready_at(self, chat: str, now: float) -> float:
+        ready = self._blocked_until.get(chat, 0.0)
+        sent = self._sent_at.get(chat)
+        if sent:
+            ready = max(ready, sent[-1] + self.min_interval)
+            while sent and sent[0] < now - 60:
+                sent.popleft()
+            if self.per_minute and len(sent) >= self.per_minute:
+                ready = max(ready, sent[0] + 60)
+        return ready
+
+    def _drain_once(self) -> float:
+        """Отправить всё, что можно сейчас; вернуть паузу до следующей попытки."""
+        now = time.time()
+        rows = self._pending(now)
+        if not rows:
+            return 60.0
+        next_wake = now + 60.0
+        by_chat: Dict[str, List[sqlite3.Row]] = {}
+        for r in rows:
+            by_chat.setdefault(r["chat_id"], []).append(r)
+
+        for chat, msgs in by_chat.items():
+            if self._stop.is_set():
+                break
+            head = msgs[0]
+            ready = max(self._chat_ready_at(chat, now), head["next_at"])
+            # ждём немного, чтобы собрать пачку уведомлений в одно сообщение
+            if head["mergeable"] and head["attempts"] == 0:
+                ready = max(ready, head["created_at"] + self.merge_delay)
+            if ready > now:
+                next_wake = min(next_wake, ready)
+                continue
+            batch = self._take_batch(msgs, now)
+            if not self._claim(batch, now):
+                continue
+            self._send_batch(chat, batch)
+            next_wake = min(next_wake, time.time() + self.min_interval)
+        return max(0.05, next_wake - time.time())
+
+    def _take_batch(self, msgs: List[sqlite3.Row], now: float) -> List[sqlite3.Row]:
+        batch = [msgs[0]]
+        if not msgs[0]["mergeable"]:
+            return batch
+        size = len(msgs[0]["text"])
+        for m in msgs[1:]:
+            if (not m["mergeable"] or m["next_at"] > now or m["parse_mode"] != msgs[0]["parse_mode"]
+                    or size + 2 + len(m["text"]) > TEXT_LIMIT):
+                break
+            batch.append(m)
+            size += 2 + len(m["text"])
+        return batch
+
+    def _send_batch(self, chat: str, batch: List[sqlite3.Row]):
+        ids = [m["id"] for m in batch]
+        text = "\n\n".join(m["text"] for m in batch)
+        try:
+            if batch[0]["filename"]:
+                self.client.send_document(batch[0]["filename"], bytes(batch[0]["document"]),
+                                          caption=text, chat_id=chat)
+            else:
+                self.client.send_message(text, chat_id=chat, parse_mode=batch[0]["parse_mode"])
+        except TelegramError as e:
+            self.last_error = str(e)
+            if e.status == 429:
+                wait = float(e.retry_after or self.backoff_base)
+                self._blocked_until[chat] = time.time() + wait
+                self._release(batch)
+                return
+            self._retry_later(batch, str(e), permanent=not e.retryable)
+            return
+        except requests.RequestException as e:
+            self.last_error = str(e)
+            self._retry_later(batch, str(e), permanent=False)
+            return
+
+        sent_at = time.time()
+        self._sent_at.setdefault(chat, deque()).append(sent_at)
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+        for m in batch:
+            latency = sent_at - m["created_at"]
+            self.last_latency = latency
+            self._latency_total += latency
+            self.sent += 1
+        self.merged += len(batch) - 1
+
+    def _retry_later(self, batch: List[sqlite3.Row], error: str, permanent: bool):
+        now = time.time()
+        with self._lock, self._conn:
+            if permanent and len(batch) > 1:
+                # склейку отклонили — отправим сообщения по одному, чтобы найти «плохое»
+                self._conn.executemany("UPDATE outbox SET mergeable = 0, claimed_until = 0 WHERE id = ?",
+                                       [(m["id"],) for m in batch])
+                return
+            for m in batch:
+                attempts = m["attempts"] + 1
+                if permanent or attempts >= self.max_attempts:
+                    self._conn.execute(
+                        "UPDATE outbox SET attempts = ?, failed = 1, claimed_until = 0, last_error = ? WHERE id = ?",
+                        (attempts, error, m["id"]),
+                    )
+                else:
+                    delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+                    self._conn.execute(
+                        "UPDATE outbox SET attempts = ?, next_at = ?, claimed_until = 0, last_error = ? "
+                        "WHERE id = ?",
+                        (attempts, now + delay, error, m["id"]),
+                    )
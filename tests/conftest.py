@@ -0,0 +1,59 @@
+# tests/conftest.py
+import copy
+import sys
+from pathlib import Path
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+# модули проекта лежат в корне, без пакета
+sys.path.insert(0, str(ROOT))
+
+from config import DEFAULT_CONFIG  # noqa: E402
+from core import Core  # noqa: E402
+from benchmarks.synthetic import make_incidents, make_locations, write_workbook  # noqa: E402
+from sqlite_storage import SqliteStorage  # noqa: E402
+from storage import DEFAULT_STATUS  # noqa: E402
+
+@pytest.fixture
+def locations():
+    return make_locations(3, 2)
+
+@pytest.fixture
+def incidents(locations):
+    # 400 дней: часть закрытых записей старше любого разумного archive_days
+    return make_incidents(300, locations, days=400, seed=1)
+
+@pytest.fixture
+def workbook(tmp_path, incidents, locations) -> Path:
+    path = tmp_path / "incidents.xlsx"
+    write_workbook(path, incidents, locations)
+    return path
+
+@pytest.fixture
+def sqlite_db(tmp_path, incidents, locations):
+    storage = SqliteStorage(str(tmp_path / "incidents.db"))
+    storage.save_locations(locations)
+    storage.append_incidents(incidents)
+    yield storage
+    storage.close()
+
+@pytest.fixture
+def core(tmp_path, workbook):
+    cfg = copy.deepcopy(DEFAULT_CONFIG)
+    cfg["storage"]["excel_path"] = str(workbook)
+    cfg["telegram"]["queue_path"] = str(tmp_path / "outbox.db")
+    cfg["schedule"]["state_path"] = str(tmp_path / "schedule.json")
+    core = Core(cfg, start_outbox=False)
+    yield core
+    core.close()
+
+def new_record(n: int, **fields):
+    """Запись для append_incident; новые локация и тип — чтобы проверить категории."""
+    from datetime import date
+    rec = {
+        "date": date.today(), "time": "10:15", "location": f"Новый объект {n}", "address": "ул. Новая, 1",
+        "duty": "Тестов Т.Т.", "type": "Новый тип", "description": f"Нет связи на узле {n}",
+        "status": DEFAULT_STATUS,
+    }
+    rec.update(fields)
+    return rec
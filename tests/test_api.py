@@ -0,0 +1,22 @@
+# tests/test_api.py
+import pytest
+from api import ApiError, create_incident, list_incidents
+
+@pytest.mark.parametrize("body", [[1, 2], [{"description": "ок"}, "строка"], [None]])
+def test_batch_with_non_objects_is_rejected(core, body):
+    rows = len(core.storage.load_incidents())
+    with pytest.raises(ApiError) as e:
+        create_incident(core, {}, body, None)
+    assert e.value.status == 400
+    assert len(core.storage.load_incidents()) == rows
+
+@pytest.mark.parametrize("params", [{"limit": "-5"}, {"offset": "-1"}, {"limit": "abc"}])
+def test_bad_paging_is_rejected(core, params):
+    with pytest.raises(ApiError) as e:
+        list_incidents(core, params, None, None)
+    assert e.value.status == 400
+
+def test_paging(core, incidents):
+    page = list_incidents(core, {"limit": "10", "offset": "5"}, None, None)
+    assert page["total"] == len(incidents)
+    assert len(page["items"]) == 10
@@ -0,0 +1,110 @@
+# tests/test_archive.py
+from datetime import date, timedelta
+import pandas as pd
+import archive
+from conftest import new_record
+from exporter import export_incidents
+from query import IncidentQuery
+from storage import CLOSED_STATUS, DEFAULT_STATUS, IncidentStorage
+
+ARCHIVE_DAYS = 60
+
+def _cutoff() -> pd.Timestamp:
+    return pd.Timestamp(date.today() - timedelta(days=ARCHIVE_DAYS))
+
+def _storage(workbook, **kw) -> IncidentStorage:
+    return IncidentStorage(str(workbook), archive_days=ARCHIVE_DAYS, **kw)
+
+def _archived_id(st: IncidentStorage) -> int:
+    return int(st.archive.load(st.archive.months()[0])["id"].iloc[0])
+
+def test_open_moves_old_closed_incidents(workbook, incidents):
+    st = _storage(workbook)
+    hot = st.load_incidents()
+    old_closed = (incidents["status"] == CLOSED_STATUS) & (incidents["date"] < _cutoff())
+
+    assert st.archive.months()
+    assert len(hot) == int((~old_closed).sum())
+    assert not ((hot["status"] == CLOSED_STATUS) & (hot["date"] < _cutoff())).any()
+    # открытые инциденты остаются в книге независимо от возраста
+    assert set(incidents.loc[incidents["status"] == DEFAULT_STATUS, "id"]) <= set(hot["id"])
+
+def _count_reads(st: IncidentStorage, monkeypatch) -> list:
+    reads = []
+    read = st.archive._read
+    monkeypatch.setattr(st.archive, "_read", lambda month, key: reads.append(month) or read(month, key))
+    st.archive._months.clear()
+    return reads
+
+def test_undated_reads_skip_archive(workbook, incidents, monkeypatch):
+    st = _storage(workbook)
+    reads = _count_reads(st, monkeypatch)
+    hot = st.load_incidents()
+    assert len(st.query(IncidentQuery(status=CLOSED_STATUS))) == int((hot["status"] == CLOSED_STATUS).sum())
+    assert st.query_chunks(IncidentQuery())[0] == len(hot)
+    st.search("связи")
+    assert reads == []
+
+def test_archive_flag_reads_whole_archive(workbook, incidents, tmp_path):
+    st = _storage(workbook)
+    q = IncidentQuery(archive=True)
+    assert len(st.query(q)) == len(incidents)
+    total, chunks = st.query_chunks(q, chunk_rows=50)
+    assert total == len(incidents) == sum(len(c) for c in chunks)
+
+    out = tmp_path / "export.csv"
+    assert export_incidents(st, str(out), q) == len(incidents)
+    assert len(pd.read_csv(out, sep=None, engine="python")) == len(incidents)
+
+def test_long_archive_scan_keeps_month_cache(workbook, incidents, monkeypatch):
+    monkeypatch.setattr(archive, "CACHED_MONTHS", 2)
+    st = _storage(workbook)
+    months = st.archive.months()
+    assert len(months) > 2
+    reads = _count_reads(st, monkeypatch)
+    st.archive.load(months[0])
+    st.query(IncidentQuery(archive=True))
+    st.search("связи", IncidentQuery(archive=True))
+    # проход по всему архиву не вытесняет уже прочитанный месяц
+    assert list(st.archive._months) == [months[0]]
+    assert reads.count(months[0]) == 1
+    assert len(reads) == 1 + 2 * (len(months) - 1)
+
+def test_dated_query_reads_only_its_months(workbook, incidents):
+    st = _storage(workbook)
+    start = (_cutoff() - pd.Timedelta(days=120)).date()
+    end = (_cutoff() - pd.Timedelta(days=90)).date()
+    got = st.query(IncidentQuery(date_from=start, date_to=end))
+    expected = incidents[incidents["date"].between(pd.Timestamp(start), pd.Timestamp(end))]
+    assert sorted(got["id"]) == sorted(expected["id"])
+    assert st.daily_rollup(start, end).total(start, end) == len(expected)
+
+def test_archived_incident_is_found_and_ids_are_not_reused(workbook, incidents):
+    st = _storage(workbook)
+    incident_id = _archived_id(st)
+    assert st.get_incident(incident_id)["id"] == incident_id
+    assert st.append_incident(new_record(1)) == len(incidents) + 1
+
+def test_reopen_returns_incident_to_workbook(workbook):
+    st = _storage(workbook)
+    incident_id = _archived_id(st)
+    st.update_incident(incident_id, {"status": DEFAULT_STATUS, "resolved_at": None})
+
+    assert incident_id in st.load_incidents()["id"].tolist()
+    assert st.archive.find(incident_id) is None
+    # после перечитывания с диска — то же самое
+    st.invalidate_cache()
+    reopened = _storage(workbook)
+    assert reopened.get_incident(incident_id)["status"] == DEFAULT_STATUS
+    assert reopened.archive.find(incident_id) is None
+
+def test_closing_old_incident_archives_it(workbook, incidents):
+    st = _storage(workbook, journal=True, compact_every=0)
+    old_open = incidents[(incidents["status"] == DEFAULT_STATUS) & (incidents["date"] < _cutoff())]
+    incident_id = int(old_open["id"].iloc[0])
+    st.update_incident(incident_id, {"status": CLOSED_STATUS})
+
+    assert incident_id not in st.load_incidents()["id"].tolist()
+    assert st.archive.find(incident_id) is not None
+    assert not st.journal_path.exists()
+    assert st.get_incident(incident_id)["status"] == CLOSED_STATUS
@@ -0,0 +1,108 @@
+# tests/test_cache_sync.py
+"""Сводка по дням, индексы и поиск обновляются на записи построчно —
+результат должен совпадать с построенным заново по реестру."""
+import threading
+import time
+from datetime import date
+import pandas as pd
+import pytest
+from conftest import new_record
+from query import IncidentQuery
+from storage import CLOSED_STATUS, DEFAULT_STATUS, IncidentStorage
+
+START, END = date(2000, 1, 1), date(2100, 1, 1)
+QUERIES = [
+    IncidentQuery(status=DEFAULT_STATUS),
+    IncidentQuery(type="Новый тип"),
+    IncidentQuery(location="Новый объект 2"),
+    IncidentQuery(type="Тип после правки", status=CLOSED_STATUS),
+    IncidentQuery(date_from=date.today(), date_to=date.today()),
+]
+
+@pytest.fixture(params=["excel", "excel-journal", "sqlite"])
+def storage(request):
+    if request.param == "sqlite":
+        return request.getfixturevalue("sqlite_db")
+    workbook = request.getfixturevalue("workbook")
+    return IncidentStorage(str(workbook), journal=request.param == "excel-journal", compact_every=0)
+
+def _snapshot(st):
+    return {
+        "frame": st.load_incidents(),
+        "queries": [st.query(q)["id"].tolist() for q in QUERIES],
+        "types": st.distinct_values("type"),
+        "search": sorted(st.search("связи узле", limit=None)["id"].tolist()),
+        "rollup": st.daily_rollup(START, END).days(START, END),
+        "by_type": st.daily_rollup(START, END).counts("type", START, END).sort_index(),
+    }
+
+def test_incremental_updates_match_rebuild(storage):
+    # производные структуры построены до записей — дальше они только обновляются
+    _snapshot(storage)
+    ids = [storage.append_incident(new_record(n)) for n in range(3)]
+    storage.update_incident(ids[0], {"type": "Тип после правки", "status": CLOSED_STATUS})
+    storage.update_incident(10, {"type": "Тип после правки", "status": CLOSED_STATUS,
+                                 "description": "Нет связи на узле после правки"})
+    storage.update_incident(ids[1], {"date": "01.01.2020", "location": "Новый объект 2"})
+    incremental = _snapshot(storage)
+
+    storage.invalidate_cache()
+    rebuilt = _snapshot(storage)
+    pd.testing.assert_frame_equal(incremental.pop("frame"), rebuilt.pop("frame"), check_categorical=False)
+    pd.testing.assert_frame_equal(incremental.pop("rollup"), rebuilt.pop("rollup"))
+    pd.testing.assert_series_equal(incremental.pop("by_type"), rebuilt.pop("by_type"))
+    assert incremental == rebuilt
+
+def test_append_keeps_schema_types(storage):
+    before = storage.load_incidents().dtypes.astype(str)
+    storage.append_incident(new_record(1))
+    storage.update_incident(1, {"status": "Новый статус", "time": "08:05"})
+    after = storage.load_incidents()
+    pd.testing.assert_series_equal(after.dtypes.astype(str), before)
+    assert "Новый объект 1" in after["location"].cat.categories
+    assert after.loc[after["id"] == 1, "time"].item() == pd.Timedelta(hours=8, minutes=5)
+
+def test_events_carry_typed_rows(storage):
+    events = []
+    storage.subscribe(events.append)
+    new_id = storage.append_incident(new_record(1))
+    storage.update_incident(new_id, {"comment": "Принято"})
+    assert [e.kind for e in events] == ["inserted", "updated"]
+    assert events[1].row["comment"] == "Принято"
+    assert events[1].row["date"] == pd.Timestamp(date.today())
+
+def test_cache_stats_does_not_wait_for_writers(storage):
+    # окно «Диагностика» опрашивает счётчики из потока Tk, пока запись держит блокировку кэша
+    rows = len(storage.load_incidents())
+    holding, release = threading.Event(), threading.Event()
+
+    def writer():
+        with storage._cache.lock:
+            holding.set()
+            release.wait(5)
+    t = threading.Thread(target=writer)
+    t.start()
+    try:
+        assert holding.wait(5)
+        t0 = time.monotonic()
+        assert storage.cache_stats()["rows"] == rows
+        assert time.monotonic() - t0 < 0.5
+    finally:
+        release.set()
+        t.join()
+
+def test_sqlite_appends_are_merged_on_next_read(sqlite_db):
+    before = sqlite_db.load_incidents()
+    cached = sqlite_db._cache.df
+    ids = [sqlite_db.append_incident(new_record(n)) for n in range(3)]
+    # вставки не копируют реестр: фрейм кэша тот же, строки ждут в pending
+    assert sqlite_db._cache.df is cached
+    assert sqlite_db.cache_stats()["rows"] == len(before) + 3
+    sqlite_db.update_incident(ids[1], {"comment": "Принято"})
+    after = sqlite_db.load_incidents()
+    assert after["id"].tolist()[-3:] == ids
+    assert after.loc[after["id"] == ids[1], "comment"].item() == "Принято"
+    assert {"Новый объект 0", "Новый объект 2"} <= set(after["location"].cat.categories)
+    pd.testing.assert_series_equal(after.dtypes.astype(str), before.dtypes.astype(str))
+    sqlite_db.invalidate_cache()
+    pd.testing.assert_frame_equal(after, sqlite_db.load_incidents(), check_categorical=False)
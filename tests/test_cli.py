@@ -0,0 +1,28 @@
+# tests/test_cli.py
+import pytest
+import yaml
+import cli
+
+@pytest.fixture
+def config(tmp_path, workbook):
+    path = tmp_path / "config.yaml"
+    path.write_text(yaml.safe_dump({
+        "storage": {"excel_path": str(workbook)},
+        "telegram": {"queue_path": str(tmp_path / "outbox.db")},
+        "schedule": {"state_path": str(tmp_path / "schedule.json")},
+        "daemon": {"token_path": str(tmp_path / "daemon.token")},
+    }), encoding="utf-8")
+    return str(path)
+
+@pytest.mark.parametrize("command", [
+    ["import", "/nonexistent/incidents.csv"],
+    ["export", "/nonexistent/folder/incidents.csv"],
+])
+def test_file_errors_are_reported_not_raised(config, command, capsys):
+    assert cli.main(["--config", config, "--local", *command]) == 1
+    assert capsys.readouterr().err.startswith("Ошибка: ")
+
+def test_export_writes_file(config, tmp_path, incidents, capsys):
+    out = tmp_path / "export.csv"
+    assert cli.main(["--config", config, "--local", "export", str(out)]) == 0
+    assert len(out.read_text(encoding="utf-8-sig").splitlines()) == len(incidents) + 1
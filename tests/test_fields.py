@@ -0,0 +1,68 @@
+# tests/test_fields.py
+import pandas as pd
+import pytest
+from api import ApiError, update_incident as api_update
+from storage import CLOSED_STATUS, DEFAULT_STATUS, IncidentStorage
+
+BAD_FIELDS = [
+    ({"date": "32.13.2026"}, "Неверная дата"),
+    ({"date": "вчера"}, "Неверная дата"),
+    ({"resolved_at": "после обеда"}, "Неверное время закрытия"),
+    ({"time": "утром"}, "Неверное время"),
+    ({"colour": "red"}, "Неизвестные поля"),
+]
+
+@pytest.fixture(params=["excel", "excel-journal", "sqlite"])
+def storage(request):
+    if request.param == "sqlite":
+        return request.getfixturevalue("sqlite_db")
+    workbook = request.getfixturevalue("workbook")
+    return IncidentStorage(str(workbook), journal=request.param == "excel-journal", compact_every=0)
+
+@pytest.mark.parametrize("fields, message", BAD_FIELDS)
+def test_bad_value_is_rejected_without_partial_update(storage, fields, message):
+    before = storage.get_incident(1)
+    with pytest.raises(ValueError, match=message):
+        # статус впереди плохого поля: правка не должна примениться наполовину
+        storage.update_incident(1, {"status": CLOSED_STATUS, **fields})
+    assert storage.get_incident(1) == before
+    storage.invalidate_cache()
+    assert storage.get_incident(1)["status"] == before["status"]
+
+@pytest.mark.parametrize("value, expected", [
+    ("05.03.2026", pd.Timestamp(2026, 3, 5)),
+    ("2026-03-05", pd.Timestamp(2026, 3, 5)),
+    ("2026-03-05T17:40", pd.Timestamp(2026, 3, 5)),
+    ("", pd.NaT),
+])
+def test_date_formats(storage, value, expected):
+    storage.update_incident(1, {"date": value})
+    got = storage.get_incident(1)["date"]
+    assert got is pd.NaT if expected is pd.NaT else got == expected
+
+def test_resolved_at_formats(storage):
+    storage.update_incident(1, {"resolved_at": "05.03.2026 17:40"})
+    assert storage.get_incident(1)["resolved_at"] == pd.Timestamp(2026, 3, 5, 17, 40)
+    storage.update_incident(1, {"resolved_at": "2026-03-06T08:00"})
+    assert storage.get_incident(1)["resolved_at"] == pd.Timestamp(2026, 3, 6, 8, 0)
+    storage.update_incident(1, {"resolved_at": None})
+    assert pd.isna(storage.get_incident(1)["resolved_at"])
+
+# ---- PATCH /incidents/<id> ----
+@pytest.mark.parametrize("body", [{"date": "31.02.2026"}, {"time": "25 часов"}, {"resolved_at": "скоро"}])
+def test_patch_rejects_bad_values_with_400(core, body):
+    with pytest.raises(ApiError) as e:
+        api_update(core, {}, body, 1)
+    assert e.value.status == 400
+
+def test_patch_close_and_reopen(core):
+    closed = api_update(core, {}, {"status": CLOSED_STATUS}, 1)
+    assert closed["status"] == CLOSED_STATUS and closed["resolved_at"]
+    reopened = api_update(core, {}, {"status": DEFAULT_STATUS}, 1)
+    assert reopened["status"] == DEFAULT_STATUS
+    assert reopened["resolved_at"] is None
+
+def test_patch_unknown_incident_is_404(core):
+    with pytest.raises(ApiError) as e:
+        api_update(core, {}, {"comment": "x"}, 10 ** 6)
+    assert e.value.status == 404
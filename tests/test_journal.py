@@ -0,0 +1,100 @@
+# tests/test_journal.py
+import json
+import pandas as pd
+import pytest
+from conftest import new_record
+from storage import CLOSED_STATUS, DEFAULT_STATUS, INCIDENT_SHEET, IncidentStorage
+
+def _workbook_rows(path) -> pd.DataFrame:
+    return pd.read_excel(path, sheet_name=INCIDENT_SHEET, engine="openpyxl")
+
+def _reread(storage: IncidentStorage) -> pd.DataFrame:
+    # как другое рабочее место: кэш процесса сброшен, реестр читается с диска
+    storage.invalidate_cache()
+    return storage.load_incidents()
+
+def test_journal_write_leaves_workbook_untouched(workbook, incidents):
+    st = IncidentStorage(str(workbook), journal=True, compact_every=0)
+    before = workbook.stat().st_mtime_ns
+    new_id = st.append_incident(new_record(1))
+    st.update_incident(5, {"status": CLOSED_STATUS, "comment": "Заменён автомат"})
+
+    assert workbook.stat().st_mtime_ns == before
+    ops = [json.loads(line)["op"] for line in st.journal_path.read_text(encoding="utf-8").splitlines()]
+    assert ops == ["insert", "update"]
+    assert new_id == len(incidents) + 1
+
+def test_journal_replay_matches_cache(workbook):
+    st = IncidentStorage(str(workbook), journal=True, compact_every=0)
+    new_id = st.append_incident(new_record(1))
+    st.update_incident(new_id, {"comment": "Принято"})
+    st.update_incident(7, {"status": CLOSED_STATUS, "resolved_at": "01.02.2026 10:30"})
+    cached = st.load_incidents()
+
+    replayed = _reread(st)
+    pd.testing.assert_frame_equal(cached, replayed, check_categorical=False)
+    row = replayed[replayed["id"] == 7].iloc[0]
+    assert row["status"] == CLOSED_STATUS
+    assert row["resolved_at"] == pd.Timestamp(2026, 2, 1, 10, 30)
+
+def test_replay_skips_duplicate_inserts(workbook):
+    st = IncidentStorage(str(workbook), journal=True, compact_every=0)
+    st.append_incident(new_record(1))
+    # повтор строки (сбой между записью журнала и ответом) не удваивает запись
+    lines = st.journal_path.read_text(encoding="utf-8")
+    st.journal_path.write_text(lines + lines + '{"op": "ins', encoding="utf-8")
+    df = _reread(st)
+    assert df["id"].is_unique
+
+def test_compact_folds_journal_into_workbook(workbook):
+    st = IncidentStorage(str(workbook), journal=True, compact_every=0)
+    new_id = st.append_incident(new_record(1))
+    st.update_incident(3, {"status": CLOSED_STATUS})
+    expected = st.load_incidents()
+
+    st.compact()
+    assert not st.journal_path.exists()
+    book = _workbook_rows(workbook)
+    assert new_id in book["id"].tolist()
+    assert book.loc[book["id"] == 3, "status"].item() == CLOSED_STATUS
+    pd.testing.assert_frame_equal(expected, _reread(st), check_categorical=False)
+
+def test_compact_every_triggers_compaction(workbook):
+    st = IncidentStorage(str(workbook), journal=True, compact_every=3)
+    for n in range(3):
+        st.append_incident(new_record(n))
+    assert not st.journal_path.exists()
+    assert len(_workbook_rows(workbook)) == len(_reread(st))
+
+def test_leftover_journal_is_folded_in_when_journal_is_off(workbook):
+    journaled = IncidentStorage(str(workbook), journal=True, compact_every=0)
+    journaled.update_incident(1, {"status": CLOSED_STATUS})
+    assert journaled.journal_path.exists()
+
+    plain = IncidentStorage(str(workbook), journal=False)
+    assert not plain.journal_path.exists()
+    assert _workbook_rows(workbook).loc[lambda d: d["id"] == 1, "status"].item() == CLOSED_STATUS
+
+def test_plain_write_drops_journal_so_old_updates_do_not_win(workbook):
+    # Одно место пишет в журнал, другое — без журнала: повторное чтение
+    # журнала не должно возвращать старый статус поверх новой правки
+    journaled = IncidentStorage(str(workbook), journal=True, compact_every=0)
+    plain = IncidentStorage(str(workbook), journal=False)
+    journaled.update_incident(2, {"status": CLOSED_STATUS})
+    plain.invalidate_cache()
+    plain.update_incident(2, {"status": DEFAULT_STATUS, "resolved_at": None})
+
+    assert not plain.journal_path.exists()
+    df = _reread(journaled)
+    assert df.loc[df["id"] == 2, "status"].item() == DEFAULT_STATUS
+
+def test_failed_journal_write_rolls_back_cache(workbook, monkeypatch):
+    st = IncidentStorage(str(workbook), journal=True, compact_every=0)
+    before = st.load_incidents()
+
+    def broken(entries):
+        raise OSError("диск переполнен")
+    monkeypatch.setattr(st, "_journal_append_many", broken)
+    with pytest.raises(OSError):
+        st.update_incident(4, {"status": CLOSED_STATUS, "comment": "не сохранится"})
+    pd.testing.assert_frame_equal(before, st.load_incidents(), check_categorical=False)
@@ -0,0 +1,73 @@
+# tests/test_locking.py
+import subprocess
+import sys
+import textwrap
+import time
+import pytest
+from conftest import ROOT
+from locking import FileLock, StorageBusyError
+from storage import IncidentStorage
+
+def _python(code: str, *args: str) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-c", textwrap.dedent(code), *args], cwd=ROOT,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+HOLD_LOCK = """
+    import sys, time
+    from pathlib import Path
+    from locking import FileLock
+    lock = FileLock(Path(sys.argv[1]))
+    with lock:
+        print("locked", flush=True)
+        time.sleep(float(sys.argv[2]))
+"""
+
+def test_lock_held_by_other_process_times_out(tmp_path):
+    path = tmp_path / "book.lock"
+    holder = _python(HOLD_LOCK, str(path), "1.5")
+    try:
+        assert holder.stdout.readline().strip() == "locked"
+        lock = FileLock(path, timeout=0.2)
+        t0 = time.monotonic()
+        with pytest.raises(StorageBusyError):
+            lock.acquire()
+        assert time.monotonic() - t0 >= 0.2
+        # после выхода другого процесса блокировка свободна
+        holder.wait(10)
+        with FileLock(path, timeout=1.0):
+            pass
+    finally:
+        holder.kill()
+
+def test_lock_is_reentrant_in_one_thread(tmp_path):
+    lock = FileLock(tmp_path / "book.lock", timeout=0.2)
+    with lock:
+        with lock:
+            pass
+        assert lock._depth == 1
+    assert lock._depth == 0
+
+APPEND = """
+    import sys
+    from datetime import date
+    from storage import IncidentStorage
+    st = IncidentStorage(sys.argv[1], journal=sys.argv[2] == "1", compact_every=7)
+    for n in range(int(sys.argv[3])):
+        st.append_incident({"date": date.today(), "location": "Объект 1", "address": "ул. Тестовая, 1/1",
+                            "description": f"Процесс {sys.argv[4]}, запись {n}"})
+    print("done", flush=True)
+"""
+
+@pytest.mark.parametrize("journal", [False, True], ids=["workbook", "journal"])
+def test_concurrent_appends_from_processes_keep_unique_ids(workbook, incidents, journal):
+    per_process = 10
+    workers = [_python(APPEND, str(workbook), "1" if journal else "0", str(per_process), str(i)) for i in range(3)]
+    for w in workers:
+        out, err = w.communicate(timeout=120)
+        assert w.returncode == 0, err
+    st = IncidentStorage(str(workbook), journal=journal)
+    st.invalidate_cache()
+    df = st.load_incidents()
+    assert len(df) == len(incidents) + 3 * per_process
+    assert df["id"].is_unique
+    assert sorted(df["id"]) == list(range(1, len(df) + 1))
@@ -0,0 +1,71 @@
+# tests/test_outbox.py
+import threading
+import time
+import pytest
+from telegram_outbox import TelegramOutbox
+
+class FakeClient:
+    chat_id = "42"
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send_message(self, text, chat_id=None, parse_mode=None):
+        time.sleep(self.delay)
+        with self._lock:
+            self.sent.append(text)
+
+@pytest.fixture
+def queue_path(tmp_path):
+    return str(tmp_path / "outbox.db")
+
+def _outbox(client, queue_path) -> TelegramOutbox:
+    return TelegramOutbox(client, queue_path, min_interval=0, per_minute=0, merge_delay=0)
+
+def test_two_senders_on_one_queue_send_each_message_once(queue_path):
+    client = FakeClient(delay=0.01)
+    first, second = _outbox(client, queue_path), _outbox(client, queue_path)
+    first.enqueue_many([f"часть {n}" for n in range(20)])
+    first.start()
+    second.start()
+    try:
+        assert first.flush(10)
+    finally:
+        first.close()
+        second.close()
+    assert sorted(client.sent) == sorted(f"часть {n}" for n in range(20))
+
+def test_claimed_rows_are_skipped_by_other_sender(queue_path):
+    client = FakeClient()
+    first, second = _outbox(client, queue_path), _outbox(client, queue_path)
+    second.enqueue("уведомление")
+    now = time.time()
+    assert first._claim(first._pending(now), now)
+    second._drain_once()
+    assert client.sent == []
+    assert second.depth() == 1
+    first.close()
+    second.close()
+
+def test_sender_thread_survives_unexpected_errors(queue_path):
+    client = FakeClient()
+    outbox = TelegramOutbox(client, queue_path, min_interval=0, per_minute=0, merge_delay=0, backoff_base=0.05)
+    calls = []
+    drain = outbox._drain_once
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise KeyError("битая строка")
+        return drain()
+    outbox._drain_once = flaky
+    outbox.enqueue("после ошибки")
+    outbox.start()
+    try:
+        assert outbox.flush(5)
+    finally:
+        outbox.close()
+    assert client.sent == ["после ошибки"]
+    assert "KeyError" in outbox.last_error
@@ -0,0 +1,77 @@
+# tests/test_report.py
+import re
+from datetime import date
+from html.parser import HTMLParser
+import pandas as pd
+import pytest
+from config import DEFAULT_CONFIG
+from report_generator import ReportGenerator, chunk_lines
+from storage import DEFAULT_STATUS, ensure_incidents_schema
+from telegram_client import TEXT_LIMIT
+
+# служебные символы обеих разметок, чтобы экранирование шло по всему описанию
+LONG_DESCRIPTION = ("Нет_связи *узел* [1] (2) a.b-c=d! & <b> x>y; " * 120)[:5000]
+
+def _report_frame(day: date, shift: int = 0) -> pd.DataFrame:
+    # shift сдвигает описание, чтобы граница limit попадала на разные символы разметки
+    return ensure_incidents_schema(pd.DataFrame([
+        {"id": 1, "date": day, "time": "09:30", "location": "Склад", "address": "ул. Ленина, 1",
+         "duty": "Иванов И.И.", "type": "Связь", "description": "я" * shift + LONG_DESCRIPTION,
+         "status": DEFAULT_STATUS},
+        {"id": 2, "date": day, "time": "10:00", "location": "Офис", "address": "пр. Мира, 5",
+         "duty": "Петров П.П.", "type": "Питание", "description": "Коротко", "status": DEFAULT_STATUS},
+    ]))
+
+def _generator(template: str) -> ReportGenerator:
+    cfg = {**DEFAULT_CONFIG, "report": {**DEFAULT_CONFIG["report"], "template": template, "attach_format": ""}}
+    return ReportGenerator(cfg)
+
+class _TagBalance(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.stack = []
+
+    def handle_starttag(self, tag, attrs):
+        self.stack.append(tag)
+
+    def handle_endtag(self, tag):
+        assert self.stack and self.stack.pop() == tag, f"лишний </{tag}>"
+
+def _check_html(chunk: str):
+    # сущность не разрезана: после & идёт полное имя и ;
+    assert not re.search(r"&[a-z#0-9]*$", chunk)
+    assert not re.search(r"<[^>]*$", chunk)
+    parser = _TagBalance()
+    parser.feed(chunk)
+    parser.close()
+    assert parser.stack == []
+
+def _check_markdown(chunk: str):
+    unescaped = re.sub(r"\\.", "", chunk)
+    assert not unescaped.endswith("\\"), "разрезано экранирование"
+    assert unescaped.count("*") % 2 == 0
+    assert unescaped.count("`") % 2 == 0
+
+@pytest.mark.parametrize("shift", range(12))
+@pytest.mark.parametrize("template, check", [("markdown", _check_markdown), ("html", _check_html)])
+def test_long_description_is_split_on_markup_boundaries(template, check, shift):
+    day = date(2026, 3, 5)
+    gen = _generator(template)
+    df = _report_frame(day, shift)
+    chunks, attachment = gen.build_daily_messages(df, day)
+    assert attachment is None
+    assert len(chunks) >= 2
+    for chunk in chunks:
+        assert len(chunk) <= TEXT_LIMIT
+        check(chunk)
+    # текст не теряется: куски длинной строки склеиваются обратно
+    full = "\n".join(gen.daily_report_lines(df, day=day))
+    assert "".join(chunks).replace("\n", "") == full.replace("\n", "")
+
+def test_plain_long_line_is_cut_at_limit():
+    assert [len(c) for c in chunk_lines(["x" * 25], limit=10)] == [10, 10, 5]
+
+def test_markdown_cut_steps_back_past_escape():
+    line = "a" * 9 + "\\." + "b" * 5
+    first = next(chunk_lines([line], limit=10, parse_mode="MarkdownV2"))
+    assert first == "a" * 9